@@ -6,7 +6,14 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from routes import event_series, events, ticket_types, discounts, orders, check_ins, payments
+from routes import event_series, events, ticket_types, discounts, orders, order_exports, check_ins, payments
+from services.ticket_tailor import get_tt_metrics, close_session, close_async_client, cache as tt_cache
+from services.ticket_index import ticket_index
+from services.bundle_availability import bundle_availability
+from services.inventory import inventory
+from services.event_metadata import event_metadata
+from services import check_in_queue, fulfilment_queue, bulk_retry, reservations, ticket_mirror
+from services.email_service import dispatcher as email_dispatcher
 
 load_dotenv()
 
@@ -27,9 +34,46 @@ app.include_router(events.router)
 app.include_router(ticket_types.router)
 app.include_router(discounts.router)
 app.include_router(orders.router)
+app.include_router(order_exports.router)
 app.include_router(check_ins.router)
 app.include_router(payments.router)
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Ticket Tailor EMS Backend"}
+
+
+@app.get("/metrics")
+def read_metrics():
+    """Upstream latency, pool and cache stats for the Ticket Tailor client."""
+    return {
+        "ticket_tailor": get_tt_metrics(),
+        "tt_cache": tt_cache.metrics(),
+        "ticket_index": ticket_index.metrics(),
+        "bundle_availability": bundle_availability.metrics(),
+        "inventory": inventory.metrics(),
+        "holds": reservations.hold_status(),
+        "event_metadata": event_metadata.metrics(),
+        "fulfilment_queue": fulfilment_queue.queue_status(),
+        "email": email_dispatcher.metrics(),
+    }
+
+@app.on_event("startup")
+def startup():
+    check_in_queue.start_worker()
+    fulfilment_queue.start_workers()
+    bulk_retry.resume_runs()
+    inventory.start_reconciler()
+    ticket_mirror.start_reconciler()
+    reservations.start_sweeper()
+
+@app.on_event("shutdown")
+async def shutdown():
+    check_in_queue.stop_worker()
+    fulfilment_queue.stop_workers()
+    inventory.stop_reconciler()
+    ticket_mirror.stop_reconciler()
+    reservations.stop_sweeper()
+    email_dispatcher.stop()
+    close_session()
+    await close_async_client()
@@ -0,0 +1,24 @@
+"""
+Benchmark for services.email_templates: render + build_message per confirmation.
+
+Run from backend/:
+    python -m benchmarks.email_templates [renders]
+"""
+
+import sys
+import time
+from services.email_templates import render_confirmation, build_message
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    events = [(f"Event {i}", "Sat, 1 Mar 2026 7:00 PM", f"Hall {i}") for i in range(20)]
+    tickets = [{"id": f"it_{i}", "barcode": f"BC{i:08d}", "ticket_type_name": "General Admission"} for i in range(3)]
+    started = time.perf_counter()
+    for n in range(count):
+        event = events[n % len(events)]
+        html, text = render_confirmation(f"Buyer {n}", *event, tickets, 1500)
+        build_message("Ticket Tailor <box@example.com>", f"buyer{n}@example.com",
+                      f"🎫 Booking Confirmed — {event[0]}", html, text)
+    elapsed = time.perf_counter() - started
+    print(f"{count:,} messages in {elapsed * 1000:.0f} ms ({count / elapsed:,.0f} renders/s)")
@@ -0,0 +1,47 @@
+"""
+Benchmark for services.order_aggregation on synthetic tickets.
+
+Run from backend/:
+    python -m benchmarks.order_aggregation [ticket_count]
+"""
+
+import sys
+import time
+import random
+from services.order_aggregation import aggregate_orders
+
+
+def _synthetic_tickets(count: int, buyers: int = 50_000, events: int = 200) -> list:
+    rng = random.Random(42)
+    tickets = []
+    for i in range(count):
+        b = rng.randrange(buyers)
+        masked = rng.random() < 0.2
+        tickets.append({
+            "id": f"it_{i}",
+            "event_id": f"ev_{rng.randrange(events)}",
+            "email": "****" if masked else f"buyer{b}@example.com",
+            "full_name": "****" if masked else f"Buyer {b}",
+            "reference": f"Buyer {b}|buyer{b}@example.com",
+            "barcode": f"BC{i}",
+            "listed_price": rng.choice((0, 500, 1500)),
+            "created_at": 1_700_000_000 + i,
+            "checked_in": "false",
+            "status": "valid",
+            "ticket_type_id": "tt_1",
+            "description": "General Admission",
+        })
+    return tickets
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    tickets = _synthetic_tickets(count)
+    event_map = {f"ev_{i}": f"Event {i}" for i in range(200)}
+    runs = []
+    for _ in range(3):
+        started = time.perf_counter()
+        orders = aggregate_orders(tickets, event_map)
+        runs.append(time.perf_counter() - started)
+    best = min(runs)
+    print(f"{count:,} tickets -> {len(orders):,} orders: best {best * 1000:.0f} ms ({count / best:,.0f} tickets/s)")
@@ -1,66 +1,71 @@
-from fastapi import APIRouter, HTTPException
+import os
+import asyncio
+import logging
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from services.ticket_tailor import fetch_from_tt, post_to_tt
+from typing import List, Optional
+from services.ticket_tailor import post_to_tt, afetch_from_tt, apost_to_tt
+from services.ticket_index import ticket_index, resolve_attendee, needs_order_lookup
+from services import ticket_mirror
+from services import check_in_queue
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/check_ins", tags=["Check-ins"])
 
+BULK_CHECK_IN_CONCURRENCY = int(os.getenv("BULK_CHECK_IN_CONCURRENCY", "8"))
+
 class CheckInCreate(BaseModel):
     ticket_id: str
 
+class OrderRef(BaseModel):
+    event_id: str
+    buyer_email: str
+
+class BulkCheckInCreate(BaseModel):
+    ticket_ids: List[str] = []   # issued ticket ids or barcodes
+    order: Optional[OrderRef] = None
+
+async def _fetch_upstream(key: str):
+    """Looks a ticket id or barcode up in Ticket Tailor. None when no barcode matches."""
+    if key.startswith("it_"):
+        return await afetch_from_tt(f"/issued_tickets/{key}", priority="checkout")
+    response = await afetch_from_tt("/issued_tickets", params={"barcode": key}, priority="checkout")
+    results = response.get("data", [])
+    return results[0] if results else None
+
+
 @router.get("/{ticket_id}")
-def get_ticket_status(ticket_id: str):
+async def get_ticket_status(ticket_id: str):
+    # 0. Resolve locally from the preloaded index / ticket mirror (stale status re-read in the background)
+    indexed = await ticket_index.lookup_current(ticket_id)
+    if indexed is not None:
+        return indexed
+
     try:
         # 1. Fetch the ticket
-        if ticket_id.startswith("it_"):
-            ticket_data = fetch_from_tt(f"/issued_tickets/{ticket_id}")
-        else:
-            response = fetch_from_tt(f"/issued_tickets?barcode={ticket_id}")
-            results = response.get("data", [])
-            if not results:
-                raise HTTPException(status_code=404, detail="Barcode not found.")
-            ticket_data = results[0]
-
-        # 2. Extract unmasked PII from reference field if available (Workaround for TT masking)
-        ref = ticket_data.get("reference")
-        if ref and "|" in ref:
-            try:
-                ref_name, ref_email = ref.split("|", 1)
-                if ref_name:
-                    ticket_data["full_name"] = ref_name
-                if ref_email:
-                    ticket_data["email"] = ref_email
-            except Exception:
-                pass
-
-        # 3. Fallback: Fetch the parent order if details are still missing/masked
-        order_id = ticket_data.get("order_id")
+        ticket_data = await _fetch_upstream(ticket_id)
+        if ticket_data is None:
+            raise HTTPException(status_code=404, detail="Barcode not found.")
+
+        # 2. Unmask PII from the reference field; fall back to the parent order
+        #    only if details are still masked/missing (Workaround for TT masking)
         buyer_name = None
         buyer_email = None
-        
-        # Only check order if ticket info is still masked/missing
-        if order_id and ("****" in str(ticket_data.get("full_name", "")) or "****" in str(ticket_data.get("email", ""))):
+        if needs_order_lookup(resolve_attendee(ticket_data, placeholders=False)):
+            order_id = ticket_data.get("order_id")
             try:
-                order_data = fetch_from_tt(f"/orders/{order_id}")
+                order_data = await afetch_from_tt(f"/orders/{order_id}", priority="checkout")
                 buyer_name = order_data.get("buyer_name")
                 buyer_email = order_data.get("buyer_email")
             except Exception as e:
-                print(f"Warning: Failed to fetch parent order {order_id} for details", e)
+                logger.warning(f"Failed to fetch parent order {order_id} for details: {e}")
 
         # Inject the real buyer details so the scanner UI can display them
-        current_name = ticket_data.get("full_name")
-        if not current_name or current_name == "****" or "Guest" in str(current_name):
-            if buyer_name and "****" not in str(buyer_name):
-                ticket_data["full_name"] = buyer_name
-            elif not current_name or current_name == "****":
-                ticket_data["full_name"] = "Guest Attendee"
-            
-        current_email = ticket_data.get("email")
-        if not current_email or current_email == "****" or "No Email" in str(current_email):
-            if buyer_email and "****" not in str(buyer_email):
-                ticket_data["email"] = buyer_email
-            elif not current_email or current_email == "****":
-                ticket_data["email"] = "No Email Provided"
+        ticket_data = resolve_attendee(ticket_data, buyer_name, buyer_email)
 
+        ticket_index.add_tickets([ticket_data])
         return ticket_data
     except HTTPException:
         raise
@@ -70,7 +75,17 @@ def get_ticket_status(ticket_id: str):
         raise HTTPException(status_code=404, detail="Ticket not found or invalid.")
 
 @router.post("/")
-def check_in_attendee(check_in: CheckInCreate):
+def check_in_attendee(check_in: CheckInCreate, mode: Optional[str] = Query(None, pattern="^(direct|queued)$")):
+    # Queued mode: answer from local state now, upload in the background
+    if (mode or check_in_queue.CHECK_IN_MODE) == "queued":
+        try:
+            record = check_in_queue.enqueue_check_in(check_in.ticket_id)
+            return {"success": True, "queued": True, "data": record}
+        except check_in_queue.DuplicateCheckIn as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except check_in_queue.UnknownTicket as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
     try:
         # Ticket Tailor uses POST /check_ins with form data
         end_point = "/check_ins"
@@ -78,7 +93,9 @@ def check_in_attendee(check_in: CheckInCreate):
             "issued_ticket_id": check_in.ticket_id,
             "quantity": 1
         }
-        data = post_to_tt(end_point, payload)
+        data = post_to_tt(end_point, payload, priority="checkout")
+        ticket_index.mark_checked_in(check_in.ticket_id)
+        ticket_mirror.mark_checked_in(check_in.ticket_id)
         return {"success": True, "data": data}
     except Exception as e:
         error_msg = str(e)
@@ -87,3 +104,118 @@ def check_in_attendee(check_in: CheckInCreate):
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=error_msg)
+
+
+@router.post("/preload/{event_id}")
+async def preload_event_tickets(event_id: str):
+    """Loads an event's tickets into the scanner index before doors open."""
+    try:
+        count = await ticket_index.preload_event(event_id)
+        return {"success": True, "event_id": event_id, "tickets": count}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/queue/status")
+def get_check_in_queue_status():
+    """Queue depth and sync lag of offline (queued) check-ins."""
+    return check_in_queue.queue_status()
+
+
+def _classify(result: dict, record: dict, seen_ids: set, to_upload: list):
+    if record is None:
+        result["status"] = "not_found"
+    elif record.get("id") in seen_ids or record.get("checked_in") == "true":
+        result.update(ticket_id=record["id"], status="already_checked_in")
+    elif record.get("status") == "voided":
+        result.update(ticket_id=record["id"], status="voided")
+    else:
+        seen_ids.add(record["id"])
+        result.pop("status", None)
+        result.update(ticket_id=record["id"], full_name=record.get("full_name"))
+        to_upload.append(result)
+
+
+def _validate_locally(results: list, seen_ids: set) -> list:
+    """Resolves each result's key against the index / mirror; returns the ones to check in."""
+    to_upload = []
+    for result in results:
+        _classify(result, ticket_index.lookup(result["key"]), seen_ids, to_upload)
+    return to_upload
+
+
+def _enqueue_all(to_upload: list):
+    for result in to_upload:
+        try:
+            check_in_queue.enqueue_check_in(result["ticket_id"])
+            result["status"] = "queued"
+        except check_in_queue.DuplicateCheckIn:
+            result["status"] = "already_checked_in"
+
+
+@router.post("/bulk")
+async def bulk_check_in(body: BulkCheckInCreate, mode: Optional[str] = Query(None, pattern="^(direct|queued)$")):
+    """
+    Checks in many tickets (ids/barcodes and/or every ticket of one order) at once.
+    Tickets are validated against local state first (in direct mode, keys not
+    known locally are looked up in Ticket Tailor); the remaining upstream
+    check-ins run concurrently, at most BULK_CHECK_IN_CONCURRENCY at a time.
+    Returns one result per ticket, in request order.
+    """
+    keys = list(dict.fromkeys(body.ticket_ids))
+    if body.order:
+        order_tickets = await run_in_threadpool(
+            ticket_mirror.tickets_for_order, body.order.event_id, body.order.buyer_email
+        )
+        ticket_index.add_tickets(order_tickets)
+        keys.extend(t["id"] for t in order_tickets if t["id"] not in keys)
+    if not keys:
+        raise HTTPException(status_code=400, detail="No tickets given.")
+
+    queued = (mode or check_in_queue.CHECK_IN_MODE) == "queued"
+    results = [{"key": key} for key in keys]
+    seen_ids = set()
+    to_upload = await run_in_threadpool(_validate_locally, results, seen_ids)
+
+    if queued:
+        await run_in_threadpool(_enqueue_all, to_upload)
+    else:
+        semaphore = asyncio.Semaphore(BULK_CHECK_IN_CONCURRENCY)
+
+        # Unknown locally isn't unknown upstream (e.g. sold since the last sync) —
+        # look those up the way the single check-in would accept them
+        async def _lookup_upstream(result):
+            async with semaphore:
+                try:
+                    return await _fetch_upstream(result["key"])
+                except Exception:
+                    return None
+
+        unknown = [r for r in results if r.get("status") == "not_found"]
+        tickets = await asyncio.gather(*(_lookup_upstream(r) for r in unknown))
+        ticket_index.add_tickets([t for t in tickets if t])
+        for result, ticket in zip(unknown, tickets):
+            _classify(result, resolve_attendee(ticket) if ticket else None, seen_ids, to_upload)
+
+        async def _check_in(result):
+            async with semaphore:
+                try:
+                    await apost_to_tt("/check_ins", {"issued_ticket_id": result["ticket_id"], "quantity": 1}, priority="checkout")
+                    result["status"] = "checked_in"
+                except Exception as e:
+                    if "already" in str(e).lower():
+                        result["status"] = "already_checked_in"
+                    else:
+                        result.update(status="error", error=str(e))
+                        return
+            ticket_index.mark_checked_in(result["ticket_id"])
+            await run_in_threadpool(ticket_mirror.mark_checked_in, result["ticket_id"])
+
+        await asyncio.gather(*(_check_in(r) for r in to_upload))
+
+    summary = {}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    return {"success": all(r["status"] in ("checked_in", "queued") for r in results), "summary": summary, "results": results}
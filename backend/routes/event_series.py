@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 from services.ticket_tailor import fetch_from_tt, post_to_tt, put_to_tt, delete_from_tt
+from services.bundle_availability import bundle_availability, SERIES_DEFAULTS
 
 router = APIRouter(prefix="/event_series", tags=["Event Series"])
 
@@ -129,7 +130,7 @@ def list_bundles(series_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{series_id}/bundles/availability")
-def list_bundles_with_availability(series_id: str, event_id: Optional[str] = None):
+async def list_bundles_with_availability(series_id: str, event_id: Optional[str] = None, event_ids: Optional[str] = None):
     """
     Returns all bundles for the series, enriched with live availability
     calculated from included ticket inventory.
@@ -137,105 +138,18 @@ def list_bundles_with_availability(series_id: str, event_id: Optional[str] = Non
     For each bundle:
       - is_available: True if all included tickets have sufficient queantity
       - max_quantity: min(floor(ticket.quantity / required_qty)) across all included tickets
+
+    Without an event_id the series' default ticket types are used. Pass
+    event_ids=ev_1,ev_2,... to get {"data": {event_id: [bundles]}} for many
+    occurrences in one call.
     """
     try:
-        import math
-
-        # 1. Fetch all bundles for this series (embedded in the series object)
-        try:
-            series_obj = fetch_from_tt(f"/event_series/{series_id}")
-            bundles = series_obj.get("bundles", [])
-        except Exception:
-            return {"data": []}
-
-        if not bundles:
-            return {"data": []}
-
-        # 2. Build a map of ticket_type_id -> available quantity and name
-        tt_inventory: dict[str, int] = {}
-        tt_names: dict[str, str] = {}
-        try:
-            if event_id:
-                # Fetch inventory ONLY for the specific event occurrence
-                event_resp = fetch_from_tt(f"/events/{event_id}")
-                for tt in event_resp.get("ticket_types", []):
-                    tid = tt["id"]
-                    qty_remaining = tt.get("quantity", 0)
-                    tt_inventory[tid] = qty_remaining
-                    tt_names[tid] = tt.get("name", "Unknown Ticket")
-            else:
-                # If no specific event is provided, we rely purely on the series template
-                # via `default_ticket_types` below. We no longer aggregate all occurrences
-                # because it causes ballooned/confusing "Max Purchasable" bundle numbers.
-                pass
-        except Exception:
-            pass  # fall back
-
-        # Also check series-level default ticket types
-        try:
-            series_resp = fetch_from_tt(f"/event_series/{series_id}")
-            for tt in series_resp.get("default_ticket_types", []):
-                tid = tt["id"]
-                if tid not in tt_inventory:
-                    tt_inventory[tid] = tt.get("quantity", 0)
-                if tid not in tt_names:
-                    tt_names[tid] = tt.get("name", "Unknown Ticket")
-        except Exception:
-            pass
-
-        # 3. Enrich each bundle with availability computations
-        enriched = []
-        for bundle in bundles:
-            included_tickets = bundle.get("ticket_types", [])  # [{id, quantity}]
-
-            min_purchasable = None
-            all_available = True
-
-            for included in included_tickets:
-                tid = included["id"]
-                required_qty = included.get("quantity", 1)
-
-                stock = tt_inventory.get(tid)
-
-                if stock is None:
-                    # We don't have inventory data for this ticket — be conservative
-                    all_available = False
-                    purchasable_for_this = 0
-                else:
-                    if required_qty > 0:
-                        purchasable_for_this = math.floor(stock / required_qty)
-                    else:
-                        purchasable_for_this = 0
-
-                    if purchasable_for_this == 0:
-                        all_available = False
-
-                if min_purchasable is None:
-                    min_purchasable = purchasable_for_this
-                else:
-                    min_purchasable = min(min_purchasable, purchasable_for_this)
-
-            if not included_tickets:
-                # A bundle with no tickets configured is treated as unavailable
-                all_available = False
-                min_purchasable = 0
-
-            enriched.append({
-                **bundle,
-                "is_available": all_available,
-                "max_quantity": min_purchasable if min_purchasable is not None else 0,
-                "included_tickets_details": [
-                    {
-                        "id": inc["id"],
-                        "name": tt_names.get(inc["id"], "Included Ticket"),
-                        "quantity": inc.get("quantity", 1),
-                        "left": tt_inventory.get(inc["id"], 0)
-                    }
-                    for inc in included_tickets
-                ]
-            })
-
-        return {"data": enriched}
+        if event_ids:
+            ids = [e.strip() for e in event_ids.split(",") if e.strip()]
+            return {"data": await bundle_availability.for_events(series_id, ids)}
+        key = event_id or SERIES_DEFAULTS
+        result = await bundle_availability.for_events(series_id, [key])
+        return {"data": result[key]}
 
     except Exception as e:
         import traceback
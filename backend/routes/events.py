@@ -1,7 +1,10 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from pydantic import BaseModel
 from typing import Optional
 from services.ticket_tailor import fetch_from_tt, post_to_tt
+from services.public_catalog import public_catalog
+from services.inventory import inventory
+from services.event_metadata import event_metadata
 
 router = APIRouter(prefix="/events", tags=["Events"])
 
@@ -18,61 +21,27 @@ class EventCreate(BaseModel):
     event_series_id: Optional[str] = None
 
 @router.get("/public")
-def list_public_events():
+async def list_public_events(request: Request):
     """
     Returns a flat list of upcoming event occurrences enriched with their
     parent Event Series data (name, description, images, venue, tickets).
 
     This is the primary endpoint for the user-facing events page.
-    It merges: Event Series master data + individual event occurrences.
+    It is served from the in-memory public catalog (see services/public_catalog.py)
+    and honours If-None-Match, answering 304 when the client copy is current.
     """
     try:
-        # 1. Fetch all event series
-        series_resp = fetch_from_tt("/event_series")
-        all_series = series_resp.get("data", [])
-
-        # 2. Fetch all event occurrences
-        events_resp = fetch_from_tt("/events")
-        all_events = events_resp.get("data", [])
-
-        # 3. Build a lookup map: series_id -> series data
-        series_map = {s["id"]: s for s in all_series}
-
-        # 4. Enrich each occurrence with its parent series data
-        enriched = []
-        for event in all_events:
-            series_id = event.get("event_series_id")
-            series = series_map.get(series_id, {})
-
-            # Only include published series
-            if series.get("status") not in ("published",):
-                continue
-
-            enriched.append({
-                # Core occurrence fields
-                "id": event.get("id"),
-                "event_series_id": series_id,
-                "start": event.get("start"),
-                "end": event.get("end"),
-                "status": event.get("status", series.get("status", "unknown")),
-                # Inherited from series
-                "name": series.get("name", event.get("name", "Untitled Event")),
-                "description": series.get("description", ""),
-                "images": series.get("images", {}),
-                "venue": series.get("venue", {}),
-                "online_event": series.get("online_event", "false"),
-                "checkout_url": event.get("checkout_url") or series.get("checkout_url", ""),
-                "ticket_types": event.get("ticket_types") or series.get("default_ticket_types", []),
-            })
-
-        # Sort by start date ascending
-        enriched.sort(key=lambda e: (e.get("start") or {}).get("iso", ""))
-
-        return {"data": enriched}
-
+        body, etag = await public_catalog.get()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    client_etags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if etag in client_etags or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 
 @router.get("/")
 def list_events():
@@ -113,6 +82,9 @@ def create_event(event: EventCreate):
 
             series_data = post_to_tt("/event_series", series_payload)
             series_id = series_data.get("id")
+            created_series = True
+        else:
+            created_series = False
 
         if not series_id:
             raise Exception("Failed to identify or create event series")
@@ -126,6 +98,15 @@ def create_event(event: EventCreate):
         }
         
         event_data = post_to_tt(f"/event_series/{series_id}/events", occurrence_payload)
+        # Confirmation emails for this event won't need to look it up again. The
+        # name and venue are ours only for a series we just created; an existing
+        # series keeps its own, so that event is looked up on first use instead
+        if created_series:
+            event_metadata.warm(
+                event_data,
+                name=event.name,
+                venue="Online Event" if event.online_event else event.venue_name,
+            )
         return event_data
 
     except Exception as e:
@@ -146,28 +127,9 @@ def get_event(event_id: str):
 @router.get("/{event_id}/tickets")
 def get_event_tickets(event_id: str):
     try:
-        event = fetch_from_tt(f"/events/{event_id}")
-        
-        # 1. Attempt to resolve explicitly bound tickets first
-        tickets = event.get("ticket_types", [])
-        
-        # 2. If the active batch has no explicit overrides, inherit the Master Series inventory
-        if not tickets:
-            series_id = event.get("event_series_id")
-            if series_id:
-                series = fetch_from_tt(f"/event_series/{series_id}")
-                tickets = series.get("default_ticket_types", [])
-
-        # Filter strictly out tickets explicitly assigned to OTHER specific events (preventing cross-contamination)
-        filtered_tickets = []
-        for t in tickets:
-             if t.get("event_ids"):
-                 if event_id in t.get("event_ids"):
-                     filtered_tickets.append(t)
-             else:
-                 filtered_tickets.append(t)
-
-        return {"data": filtered_tickets, "groups": series.get("default_ticket_groups", []) if 'series' in locals() else []}
+        # Explicitly bound tickets, else the series defaults, with live quantities
+        # from the in-memory inventory (see services/inventory.py)
+        return inventory.ticket_types(event_id)
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -192,6 +154,7 @@ def update_event(event_id: str, event: EventCreate):
         
         from services.ticket_tailor import put_to_tt
         put_to_tt(f"/event_series/{series_id}", series_payload)
+        event_metadata.invalidate(event_id)
 
         # Note: Ticket Tailor API docs don't directly mention updating occurrences. 
         # In a real scenario, you would update the occurrence using its specific endpoints or just rely on the Series.
@@ -216,6 +179,7 @@ def delete_event(event_id: str):
         # 2. Delete the entire Event Series (which deletes the event occurrence)
         from services.ticket_tailor import delete_from_tt
         response = delete_from_tt(f"/event_series/{series_id}")
+        event_metadata.invalidate(event_id)
         return response
     except Exception as e:
         import traceback
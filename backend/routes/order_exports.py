@@ -0,0 +1,164 @@
+import csv
+import io
+import json
+import logging
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from services.ticket_tailor import fetch_from_tt
+from services import ticket_mirror
+from services.ticket_mirror import unmask_ticket_pii
+from services.order_aggregation import aggregate_orders
+
+router = APIRouter(prefix="/exports", tags=["Exports"])
+logger = logging.getLogger(__name__)
+
+EXPORT_PAGE_SIZE = 100
+
+ORDER_COLUMNS = [
+    "id", "event_id", "event_name", "buyer_name", "buyer_email",
+    "total", "source", "created_at", "ticket_count", "ticket_ids",
+]
+ATTENDEE_COLUMNS = [
+    "ticket_id", "barcode", "event_id", "event_name", "ticket_type_id",
+    "full_name", "email", "checked_in", "status", "listed_price", "created_at",
+]
+
+
+def _iter_pages(endpoint: str, params: dict = None):
+    """Yields every object of a Ticket Tailor list endpoint one page at a time, following starting_after."""
+    params = {"limit": EXPORT_PAGE_SIZE, **(params or {})}
+    while True:
+        data = fetch_from_tt(endpoint, params=params, priority="background")
+        tickets = data.get("data") or []
+        yield from tickets
+
+        links = data.get("links") or {}
+        if not links.get("next") or len(tickets) == 0:
+            break
+        last_id = tickets[-1].get("id")
+        if not last_id:
+            break
+        params["starting_after"] = last_id
+
+
+def _iter_issued_tickets(params: dict = None):
+    return _iter_pages("/issued_tickets", params)
+
+
+def _event_name_map() -> dict:
+    series = {s["id"]: s for s in _iter_pages("/event_series")}
+    return {
+        e["id"]: series.get(e.get("event_series_id"), {}).get("name") or e.get("name") or "Unknown Event"
+        for e in _iter_pages("/events")
+    }
+
+
+def _iter_attendee_rows(event_map: dict, event_id: Optional[str]):
+    for t in _iter_issued_tickets({"event_id": event_id} if event_id else None):
+        name, email = unmask_ticket_pii(t)
+        yield {
+            "ticket_id": t.get("id", ""),
+            "barcode": t.get("barcode") or t.get("id", ""),
+            "event_id": t.get("event_id", ""),
+            "event_name": event_map.get(t.get("event_id"), "Unknown Event"),
+            "ticket_type_id": t.get("ticket_type_id", ""),
+            "full_name": name,
+            "email": email,
+            "checked_in": t.get("checked_in", "false"),
+            "status": t.get("status", "valid"),
+            "listed_price": t.get("listed_price") or 0,
+            "created_at": t.get("created_at", 0),
+        }
+
+
+def _ticket_event_ids(event_map: dict) -> list:
+    # Deleted events are gone from /events but still have tickets — the mirror
+    # knows them; /events covers anything the mirror hasn't synced yet. Tickets
+    # the mirror stored without an event ("unknown") can't be queried by event
+    return [eid for eid in dict.fromkeys([*ticket_mirror.event_ids(), *event_map]) if eid != "unknown"]
+
+
+def _iter_orders(event_map: dict, event_id: Optional[str]):
+    # Orders never span events, so only one event's tickets are held at a time
+    for eid in ([event_id] if event_id else _ticket_event_ids(event_map)):
+        yield from aggregate_orders(_iter_issued_tickets({"event_id": eid}), event_map)
+
+
+def _order_csv_row(order: dict) -> dict:
+    ticket_ids = [t["id"] for t in order["issued_tickets"]]
+    return {
+        **{k: order.get(k, "") for k in ORDER_COLUMNS},
+        "ticket_count": len(ticket_ids),
+        "ticket_ids": " ".join(ticket_ids),
+    }
+
+
+def _ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + "\n"
+
+
+def _csv(rows, columns, to_row=lambda r: r):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(to_row(row))
+        # Flush whatever accumulated so memory stays one row deep
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    tail = buffer.getvalue()
+    if tail:
+        yield tail
+
+
+def _guard(chunks, label: str):
+    # Headers are already sent once streaming starts; re-raising aborts the
+    # connection, so the client sees an incomplete download, not a short file
+    try:
+        yield from chunks
+    except Exception as e:
+        logger.error(f"[Export] {label} export aborted: {e}")
+        raise
+
+
+@router.get("/orders")
+def export_orders(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    kind: str = Query("orders", pattern="^(orders|attendees)$"),
+    event_id: Optional[str] = None,
+):
+    """
+    Streams every order (or every attendee / ticket row) as NDJSON or CSV while
+    paging through Ticket Tailor's /issued_tickets. Nothing is materialized:
+    memory stays flat. Attendee rows start after the first page; a full order
+    export takes its event ids from /events and the ticket mirror (so past and
+    deleted events are included) and aggregates one event at a time.
+    If Ticket Tailor fails mid-stream the connection is aborted.
+    """
+    try:
+        event_map = _event_name_map()
+    except Exception as e:
+        logger.error(f"[Export] Could not load events for export: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if kind == "attendees":
+        rows = _iter_attendee_rows(event_map, event_id)
+        columns, to_row = ATTENDEE_COLUMNS, (lambda r: r)
+    else:
+        rows = _iter_orders(event_map, event_id)
+        columns, to_row = ORDER_COLUMNS, _order_csv_row
+
+    if format == "csv":
+        body, media_type = _csv(rows, columns, to_row), "text/csv"
+    else:
+        body, media_type = _ndjson(rows), "application/x-ndjson"
+
+    filename = f"{kind}.{format}"
+    return StreamingResponse(
+        _guard(body, kind),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
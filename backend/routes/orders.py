@@ -1,9 +1,15 @@
 import logging
-from fastapi import APIRouter, HTTPException
-from services.ticket_tailor import fetch_from_tt, post_to_tt
+from fastapi import APIRouter, HTTPException, Query, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from services.ticket_tailor import fetch_from_tt, gather_from_tt
+from services import ticket_mirror, order_store
+from services.ticket_issuance import expand_items, issue_tickets, ticket_results
+from services.inventory import inventory
+from services.idempotency import run_idempotent
+from services.order_aggregation import aggregate_orders
 from pydantic import BaseModel
 from typing import List, Optional
-from collections import defaultdict
 
 router = APIRouter(prefix="/orders", tags=["Orders"])
 logger = logging.getLogger(__name__)
@@ -22,46 +28,33 @@ class OrderCreate(BaseModel):
     items: List[OrderItem]
 
 
-def _fetch_all_issued_tickets() -> list:
-    """Fetch ALL issued tickets from Ticket Tailor, handling pagination."""
-    all_tickets = []
-    params = {"limit": 100}
-
-    while True:
-        data = fetch_from_tt("/issued_tickets", params=params)
-        tickets = data.get("data") or []
-        all_tickets.extend(tickets)
-
-        # Check for more pages
-        links = data.get("links") or {}
-        next_url = links.get("next")
-        if not next_url or len(tickets) == 0:
-            break
-
-        # Use the last ticket ID as starting_after for next page
-        last_id = tickets[-1].get("id")
-        if last_id:
-            params["starting_after"] = last_id
-        else:
-            break
-
-    return all_tickets
-
-
 @router.get("/")
-def list_orders():
+async def list_orders(
+    event_id: Optional[str] = None,
+    buyer_email: Optional[str] = None,
+    source: Optional[str] = Query(None, pattern="^(free|stripe)$"),
+    created_from: Optional[int] = None,
+    created_to: Optional[int] = None,
+    checked_in: Optional[bool] = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+):
     """
-    Returns all orders from Ticket Tailor's /issued_tickets API,
-    grouped by (email + event_id) to reconstruct orders.
+    Returns one page of orders from the local mirror of Ticket Tailor's
+    /issued_tickets, grouped by (email + event_id) to reconstruct orders.
+
+    Filters: event_id, buyer_email, source (free|stripe), created_from/created_to
+    (unix seconds) and checked_in (all tickets checked in / not). Pass the
+    returned `next_cursor` back as `cursor` to get the next page.
     """
     try:
-        tickets = _fetch_all_issued_tickets()
-
-        # Fetch events and series to map event_id to event_name
-        events_resp = fetch_from_tt("/events")
+        # Mirror sync, events and series are independent — run them concurrently
+        # (events and series map event_id to event_name). A failed sync doesn't
+        # fail the list; it is served from the mirror as it is
+        _, events_resp, series_resp = await gather_from_tt(
+            ticket_mirror.sync_if_due(), "/events", "/event_series", priority="background"
+        )
         all_events = events_resp.get("data", [])
-        
-        series_resp = fetch_from_tt("/event_series")
         all_series = {s["id"]: s for s in series_resp.get("data", [])}
         
         event_map = {}
@@ -70,100 +63,31 @@ def list_orders():
             # Prefer series name, fallback to event name, then default
             event_map[e["id"]] = series.get("name") or e.get("name") or "Unknown Event"
 
-        # Group tickets by email + event_id to form "orders"
-        order_groups = defaultdict(list)
-        for t in tickets:
-            email = t.get("email") or "unknown"
-            event_id = t.get("event_id") or "unknown"
-            key = f"{email}|{event_id}"
-            order_groups[key].append(t)
-
-        transformed = []
-        for key, group_tickets in order_groups.items():
-            email_key, event_id = key.split("|", 1)
-            first = group_tickets[0]
-
-            
-            # If TT masks PII as ****, try to extract from our custom reference field
-            # Format: "Name|Email"
-            buyer_name = first.get("full_name") or "Guest"
-            buyer_email = email_key
-
-            # Check if we need to unmask
-            if "****" in buyer_name or "****" in buyer_email:
-                for t in group_tickets:
-                    ref = t.get("reference")
-                    if ref and "|" in ref:
-                        try:
-                            ref_name, ref_email = ref.split("|", 1)
-                            if ref_name and "****" in buyer_name:
-                                buyer_name = ref_name
-                            if ref_email and "****" in buyer_email:
-                                buyer_email = ref_email
-                            break # Found it
-                        except Exception:
-                            pass
-
-            # Calculate total price from listed_price of each ticket
-            total = 0
-            for t in group_tickets:
-                price = t.get("listed_price")
-                if price and isinstance(price, (int, float)):
-                    total += int(price)
-
-            # Use the earliest created_at as the order date
-            created_timestamps = [t.get("created_at", 0) for t in group_tickets]
-            earliest_ts = min(created_timestamps) if created_timestamps else 0
-
-            # Build issued_tickets array in the format the frontend expects
-            issued_tickets = []
-            for t in group_tickets:
-                t_name = t.get("full_name") or "Guest"
-                t_email = t.get("email") or ""
-                # Unmask individual ticket info too if possible
-                ref = t.get("reference")
-                if ("****" in t_name or "****" in t_email) and ref and "|" in ref:
-                    try:
-                        rn, re = ref.split("|", 1)
-                        if "****" in t_name: t_name = rn
-                        if "****" in t_email: t_email = re
-                    except: pass
-
-                issued_tickets.append({
-                    "id": t.get("id", ""),
-                    "description": t.get("description", "Ticket"),
-                    "barcode": t.get("barcode") or t.get("id", ""),
-                    "checked_in": t.get("checked_in", "false"),
-                    "status": t.get("status", "valid"),
-                    "full_name": t_name,
-                    "email": t_email,
-                    "ticket_type_id": t.get("ticket_type_id", ""),
-                })
-
-            # Determine source (free vs paid)
-            source = "free" if total == 0 else "stripe"
-
-            transformed.append({
-                "id": f"{event_id}_{buyer_email}",  # Composite ID
-                "buyer_name": buyer_name,
-                "buyer_email": buyer_email,
-                "phone": "",
-                "event_id": event_id,
-                "event_name": event_map.get(event_id, "Unknown Event"),
-                "total": total,
-                "source": source,
-                "status": "confirmed",
-                "created_at": earliest_ts,
-                "stripe_session_id": "",
-                "issued_tickets": issued_tickets,
-                "items": [],
-            })
-
-        # Sort newest first
-        transformed.sort(key=lambda o: o.get("created_at", 0), reverse=True)
-
-        return {"data": transformed}
+        try:
+            page, next_cursor = await run_in_threadpool(
+                ticket_mirror.query_orders,
+                event_id=event_id,
+                buyer_email=buyer_email,
+                source=source,
+                created_from=created_from,
+                created_to=created_to,
+                checked_in=checked_in,
+                limit=limit,
+                cursor=cursor,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        # Pages come back newest first with whole (email + event_id) groups,
+        # so aggregate in page order rather than re-sorting
+        transformed = aggregate_orders(
+            (t for o in page for t in o["tickets"]), event_map, sort=False
+        )
 
+        return {"data": transformed, "next_cursor": next_cursor}
+
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -172,35 +96,51 @@ def list_orders():
 
 
 @router.post("/")
-def create_order(order: OrderCreate):
+async def create_order(order: OrderCreate, idempotency_key: Optional[str] = Header(None)):
     """Creates issued tickets directly via TT API and requests email confirmation."""
+    return await run_idempotent("order", idempotency_key, lambda: _create_order(order), order)
+
+
+async def _create_order(order: OrderCreate):
+    payload = {
+        "event_id": order.event_id,
+        "full_name": order.buyer_name,
+        "email": order.buyer_email,
+        "send_email": "true",
+    }
+    if order.phone:
+        payload["phone"] = order.phone
+
     try:
-        issued_tickets = []
-        for item in order.items:
-            payload = {
-                "event_id": order.event_id,
-                "ticket_type_id": item.ticket_type_id,
-                "full_name": order.buyer_name,
-                "email": order.buyer_email,
-                "send_email": "true",
-            }
-            if order.phone:
-                payload["phone"] = order.phone
-
-            for _ in range(item.quantity):
-                data = post_to_tt("/issued_tickets", payload)
-                issued_tickets.append(data)
-
-        return {"data": issued_tickets}
+        results = await issue_tickets(expand_items([i.model_dump() for i in order.items], payload))
     except Exception as e:
-        import requests
-        if isinstance(e, requests.HTTPError) and e.response is not None:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Ticket Tailor API Error: {e.response.json().get('message', str(e))}"
-            )
         raise HTTPException(status_code=500, detail=str(e))
 
+    inventory.record_issued(order.event_id, results)
+    await run_in_threadpool(order_store.record_issuance, {
+        "event_id": order.event_id,
+        "buyer_name": order.buyer_name,
+        "buyer_email": order.buyer_email,
+        "phone": order.phone or "",
+        "items": [i.model_dump() for i in order.items],
+        "source": "admin",
+    }, results)
+
+    failures = [r for r in results if not r["ok"]]
+    if failures and len(failures) == len(results):
+        raise HTTPException(
+            status_code=400,
+            detail=f"No tickets could be issued: {failures[0]['error']}"
+        )
+    if failures:
+        # Some tickets exist (and were emailed) — report each one instead of failing the order
+        return JSONResponse(status_code=207, content={
+            "data": [r["ticket"] for r in results if r["ok"]],
+            "results": ticket_results(results),
+            "detail": f"{len(failures)} of {len(results)} tickets could not be issued: {failures[0]['error']}",
+        })
+    return {"data": [r["ticket"] for r in results], "results": ticket_results(results)}
+
 
 @router.get("/{order_id}")
 def get_order(order_id: str):
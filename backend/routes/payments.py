@@ -1,17 +1,21 @@
 import os
 import json
-import uuid
 import stripe
 import math
 import logging
-import requests as http_requests
-from datetime import datetime, timezone
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Header
+from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
 from dotenv import load_dotenv
-from services.ticket_tailor import post_to_tt, fetch_from_tt
+from services.ticket_tailor import fetch_from_tt
 from services.email_service import send_ticket_confirmation
+from services.ticket_issuance import expand_items, issue_tickets, ticket_results
+from services.inventory import inventory, SoldOut
+from services.event_metadata import event_metadata
+from services import fulfilment_queue, order_store, bulk_retry, reservations
+from services.idempotency import run_idempotent
 
 load_dotenv()
 
@@ -25,44 +29,6 @@ FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
 STRIPE_CONNECTED_ACCOUNT = os.getenv("STRIPE_CONNECTED_ACCOUNT", "")
 PLATFORM_FEE_PERCENT = float(os.getenv("PLATFORM_FEE_PERCENT", "10"))
 
-# ── Pending orders file (when TT billing blocks ticket creation) ───────────────
-PENDING_ORDERS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "pending_orders.json")
-
-def _load_pending_orders() -> list:
-    try:
-        with open(PENDING_ORDERS_FILE, "r") as f:
-            return json.load(f)
-    except Exception:
-        return []
-
-def _save_pending_orders(orders: list):
-    try:
-        os.makedirs(os.path.dirname(PENDING_ORDERS_FILE), exist_ok=True)
-        with open(PENDING_ORDERS_FILE, "w") as f:
-            json.dump(orders, f, indent=2)
-    except Exception as e:
-        logger.error(f"Failed to save pending orders: {e}")
-
-def _store_pending_order(event_id, buyer_name, buyer_email, phone, items, amount_total, stripe_session_id):
-    orders = _load_pending_orders()
-    orders.append({
-        "id": str(uuid.uuid4()),
-        "stripe_session_id": stripe_session_id,
-        "event_id": event_id,
-        "buyer_name": buyer_name,
-        "buyer_email": buyer_email,
-        "phone": phone,
-        "items": items,
-        "amount_total": amount_total,
-        "status": "pending",
-        "error": "TT billing not configured",
-        "created_at": datetime.now(timezone.utc).isoformat(),
-    })
-    _save_pending_orders(orders)
-    logger.warning(f"[Pending] Order saved for {buyer_email} — retry after TT billing setup")
-
-
-
 # ── Stripe Connect Config ──────────────────────────────────────────────────────
 # The merchant's connected account that receives funds minus the platform fee.
 STRIPE_CONNECTED_ACCOUNT = os.getenv("STRIPE_CONNECTED_ACCOUNT", "")
@@ -182,6 +148,18 @@ def create_checkout_session(body: CreateCheckoutSessionRequest):
                 "metadata": metadata,
             }
 
+        # ── Hold the tickets while the buyer is on Stripe ─────────────────────
+        # Released on cancel, on checkout.session.expired, or by the sweeper
+        counts = {}
+        for i in body.items:
+            if i.quantity > 0:
+                counts[i.ticket_type_id] = counts.get(i.ticket_type_id, 0) + i.quantity
+        try:
+            hold = reservations.create_hold(body.event_id, counts)
+        except SoldOut as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        metadata["hold_id"] = hold["id"]
+
         # ── Calculate platform fee and what merchant receives ─────────────────
         application_fee = calculate_application_fee(total)
         merchant_receives = total - application_fee
@@ -194,26 +172,33 @@ def create_checkout_session(body: CreateCheckoutSessionRequest):
         )
 
         # ── Create Stripe Checkout Session with Connect destination charge ────
-        session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=line_items,
-            mode="payment",
-            customer_email=body.buyer_email,
-            success_url=f"{FRONTEND_URL}payment/success?session_id={{CHECKOUT_SESSION_ID}}",
-            cancel_url=f"{FRONTEND_URL}payment/cancel",
-            metadata=metadata,
-            billing_address_collection="auto",
-
-            # ── Stripe Connect: destination charge ───────────────────────────
-            # Stripe collects payment on behalf of the platform, then
-            # transfers (total - application_fee_amount) to the connected account.
-            payment_intent_data={
-                "application_fee_amount": application_fee,  # Platform keeps this
-                "transfer_data": {
-                    "destination": STRIPE_CONNECTED_ACCOUNT,  # Merchant receives rest
+        try:
+            session = stripe.checkout.Session.create(
+                payment_method_types=["card"],
+                line_items=line_items,
+                mode="payment",
+                customer_email=body.buyer_email,
+                success_url=f"{FRONTEND_URL}payment/success?session_id={{CHECKOUT_SESSION_ID}}",
+                cancel_url=f"{FRONTEND_URL}payment/cancel?hold={hold['id']}",
+                metadata=metadata,
+                billing_address_collection="auto",
+                # The session (and so the hold) ends together
+                expires_at=hold["expires_at"],
+
+                # ── Stripe Connect: destination charge ───────────────────────────
+                # Stripe collects payment on behalf of the platform, then
+                # transfers (total - application_fee_amount) to the connected account.
+                payment_intent_data={
+                    "application_fee_amount": application_fee,  # Platform keeps this
+                    "transfer_data": {
+                        "destination": STRIPE_CONNECTED_ACCOUNT,  # Merchant receives rest
+                    },
                 },
-            },
-        )
+            )
+        except Exception:
+            reservations.release(hold["id"])
+            raise
+        reservations.attach_session(hold["id"], session.id)
 
         return {
             "url": session.url,
@@ -222,8 +207,11 @@ def create_checkout_session(body: CreateCheckoutSessionRequest):
             "platform_fee": application_fee,
             "merchant_receives": merchant_receives,
             "currency": body.currency,
+            "hold_expires_at": hold["expires_at"],
         }
 
+    except HTTPException:
+        raise
     except stripe.StripeError as e:
         logger.error(f"Stripe error creating session: {e}")
         raise HTTPException(status_code=400, detail=f"Stripe error: {str(e)}")
@@ -232,6 +220,37 @@ def create_checkout_session(body: CreateCheckoutSessionRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# POST /payments/holds/{hold_id}/release — buyer cancelled on Stripe
+# ─────────────────────────────────────────────────────────────────────────────
+
+@router.post("/holds/{hold_id}/release")
+def release_hold(hold_id: str):
+    """
+    Called by the cancel page: expires the Stripe session so it can no longer
+    be paid, then gives the held tickets back right away. Only active holds
+    are released here — a paid hold belongs to its fulfilment job.
+    """
+    row = reservations.get_hold(hold_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Hold not found")
+    if row["status"] != "active" or not row["stripe_session_id"]:
+        # Paid or closed: nothing to do. No session yet: it can still be paid,
+        # so leave the hold to expire with it (sweeper)
+        return {"released": False, "status": row["status"]}
+    try:
+        stripe.checkout.Session.expire(row["stripe_session_id"])
+    except stripe.StripeError as e:
+        # Already paid or expired — the webhook decides what happens to the hold
+        logger.warning(f"Could not expire Stripe session {row['stripe_session_id']}: {e}")
+        return {"released": False, "status": row["status"]}
+    # The webhook may have marked it paid meanwhile — then it stays held
+    released = reservations.release(hold_id, from_statuses=("active",))
+    if released:
+        return {"released": True, "status": "released"}
+    return {"released": False, "status": reservations.get_hold(hold_id)["status"]}
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # POST /payments/create-free-order
 # ─────────────────────────────────────────────────────────────────────────────
@@ -245,70 +264,105 @@ class FreeOrderRequest(BaseModel):
 
 
 @router.post("/create-free-order")
-def create_free_order(body: FreeOrderRequest):
+async def create_free_order(body: FreeOrderRequest, idempotency_key: Optional[str] = Header(None)):
     """
     Directly creates Ticket Tailor issued_tickets for free (₹0) orders.
-    No Stripe session or Connect charge needed.
+    No Stripe session or Connect charge needed. A repeated Idempotency-Key
+    returns the first response instead of issuing again.
     """
-    issued_tickets = []
-    try:
-        for item in body.items:
-            if item.quantity <= 0:
-                continue
-            payload = {
-                "event_id": body.event_id,
-                "ticket_type_id": item.ticket_type_id,
-                "full_name": body.buyer_name,
-                "email": body.buyer_email,
-                "send_email": "true",
-                "reference": f"{body.buyer_name}|{body.buyer_email}",
-            }
-            if body.phone:
-                payload["phone"] = body.phone
+    return await run_idempotent("free_order", idempotency_key, lambda: _create_free_order(body), body)
 
-            for _ in range(item.quantity):
-                data = post_to_tt("/issued_tickets", payload)
-                issued_tickets.append(data)
 
+async def _create_free_order(body: FreeOrderRequest):
+    base_payload = {
+        "event_id": body.event_id,
+        "full_name": body.buyer_name,
+        "email": body.buyer_email,
+        "send_email": "true",
+        "reference": f"{body.buyer_name}|{body.buyer_email}",
+    }
+    if body.phone:
+        base_payload["phone"] = body.phone
+
+    # Claim the tickets in the live inventory first so concurrent orders can't
+    # both get the last ones; whatever fails to issue is given back below
+    counts = {}
+    for i in body.items:
+        if i.quantity > 0:
+            counts[i.ticket_type_id] = counts.get(i.ticket_type_id, 0) + i.quantity
+    try:
+        await inventory.aload(body.event_id)
+    except Exception as e:
+        logger.warning(f"Could not load inventory for {body.event_id}, skipping stock check: {e}")
+    try:
+        inventory.take(body.event_id, counts)
+    except SoldOut as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-        # Send confirmation email via our own SMTP service
+    try:
         try:
-            event_data = fetch_from_tt(f"/events/{body.event_id}")
-            event_name  = event_data.get("name", "Your Event")
-            start_iso   = (event_data.get("start") or {}).get("formatted", "")
-            venue_obj   = event_data.get("venue") or {}
-            event_venue = venue_obj.get("name", "") or ("Online Event" if event_data.get("online_event") == "true" else "TBA")
+            results = await issue_tickets(expand_items([i.model_dump() for i in body.items], base_payload))
         except Exception:
-            event_name, start_iso, event_venue = "Your Event", "", "TBA"
-
-        ticket_objs = [
-            {
-                "id": t.get("id", ""),
-                "barcode": t.get("barcode") or t.get("id", ""),
-                "ticket_type_name": "Free Ticket",
-            }
-            for t in issued_tickets
-        ]
-        send_ticket_confirmation(
-            buyer_email=body.buyer_email,
-            buyer_name=body.buyer_name,
-            event_name=event_name,
-            event_date=start_iso,
-            event_venue=event_venue,
-            tickets=ticket_objs,
-            amount_total=0,
-            source="free",
-        )
-
-        return {"success": True, "issued_tickets": issued_tickets}
-
+            inventory.restore(body.event_id, counts)
+            raise
+        inventory.restore_failed(body.event_id, results)
+        issued_tickets = [r["ticket"] for r in results if r["ok"]]
+        failures = [r for r in results if not r["ok"]]
+        await run_in_threadpool(order_store.record_issuance, {
+            "event_id": body.event_id,
+            "buyer_name": body.buyer_name,
+            "buyer_email": body.buyer_email,
+            "phone": body.phone or "",
+            "items": [{"ticket_type_id": i.ticket_type_id, "quantity": i.quantity} for i in body.items if i.quantity > 0],
+            "source": "free",
+        }, results)
+
+        if issued_tickets:
+            # Send confirmation email via our own SMTP service
+            try:
+                meta = await event_metadata.aget(body.event_id)
+                event_name, start_iso, event_venue = meta["name"], meta["date"], meta["venue"]
+            except Exception:
+                event_name, start_iso, event_venue = "Your Event", "", "TBA"
+
+            ticket_objs = [
+                {
+                    "id": t.get("id", ""),
+                    "barcode": t.get("barcode") or t.get("id", ""),
+                    "ticket_type_name": "Free Ticket",
+                }
+                for t in issued_tickets
+            ]
+            send_ticket_confirmation(
+                buyer_email=body.buyer_email,
+                buyer_name=body.buyer_name,
+                event_name=event_name,
+                event_date=start_iso,
+                event_venue=event_venue,
+                tickets=ticket_objs,
+                amount_total=0,
+                source="free",
+            )
 
-    except http_requests.HTTPError as e:
-        logger.error(f"Ticket Tailor API error: {e}")
-        raise HTTPException(
-            status_code=400,
-            detail=str(e)
-        )
+        if failures:
+            logger.error(f"Ticket Tailor API error: {len(failures)} of {len(results)} tickets failed")
+            if not issued_tickets:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"No tickets could be issued: {failures[0]['error']}"
+                )
+            # Some tickets exist (and were emailed) — report each one instead of failing the order
+            return JSONResponse(status_code=207, content={
+                "success": False,
+                "issued_tickets": issued_tickets,
+                "results": ticket_results(results),
+                "detail": f"{len(failures)} of {len(results)} tickets could not be issued: {failures[0]['error']}",
+            })
+
+        return {"success": True, "issued_tickets": issued_tickets, "results": ticket_results(results)}
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Free order creation failed (unexpected): {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -390,101 +444,25 @@ async def stripe_webhook(request: Request):
             raise HTTPException(status_code=400, detail=str(e))
 
     # ── Handle: checkout.session.completed ───────────────────────────────────
+    # Fulfilment (ticket issuance + email) runs in the background job queue
     if event["type"] == "checkout.session.completed":
-        session   = event["data"]["object"]
-        metadata  = session.get("metadata", {})
-        session_id = session.get("id", "")
-
-        event_id    = metadata.get("event_id")
-        buyer_name  = metadata.get("buyer_name")
-        buyer_email = metadata.get("buyer_email")
-        phone       = metadata.get("phone", "")
-        items_json  = metadata.get("items", "[]")
-        amount_total = session.get("amount_total", 0)
-
+        # Stripe redelivers events; jobs are unique per session, so a repeat
+        # maps onto the existing job. If enqueueing fails, the 500 makes Stripe retry.
+        session = event["data"]["object"]
+        job_id = await run_in_threadpool(fulfilment_queue.enqueue_checkout, session)
         logger.info(
-            f"[Webhook] checkout.session.completed | "
-            f"session={session_id} event={event_id} buyer={buyer_email} total={amount_total}"
+            f"[Webhook] checkout.session.completed | session={session.get('id', '')} "
+            f"buyer={(session.get('metadata') or {}).get('buyer_email')} queued as job {job_id}"
         )
 
-        try:
-            items = json.loads(items_json)
-        except json.JSONDecodeError:
-            logger.error("Could not parse items JSON from Stripe session metadata")
-            return {"received": True}
-
-        # ── Create Ticket Tailor issued tickets ───────────────────────────────
-        all_created = True
-        issued_ticket_objects = []   # collect for email
-        for item in items:
-            ticket_type_id = item.get("ticket_type_id")
-            quantity       = item.get("quantity", 1)
-            item_name      = item.get("name", "Ticket")
-
-            payload_tt = {
-                "event_id": event_id,
-                "ticket_type_id": ticket_type_id,
-                "full_name": buyer_name,
-                "email": buyer_email,
-                "send_email": "true",
-                "reference": f"{buyer_name}|{buyer_email}",
-            }
-            if phone:
-                payload_tt["phone"] = phone
-
-            for _ in range(quantity):
-                try:
-                    result = post_to_tt("/issued_tickets", payload_tt)
-                    logger.info(f"[Webhook] ✅ Issued ticket: {result.get('id','?')} → {buyer_email}")
-                    issued_ticket_objects.append({
-                        "id": result.get("id", ""),
-                        "barcode": result.get("barcode") or result.get("id", ""),
-                        "ticket_type_name": item_name,
-                    })
-                except Exception as e:
-                    all_created = False
-                    logger.error(f"[Webhook] ❌ Failed to create ticket {ticket_type_id}: {e}")
-
-        # ── Send confirmation email if all tickets were created ─────────────
-        if all_created:
-            # ── Send confirmation email via our own SMTP service ──────────────
-            try:
-                event_data = fetch_from_tt(f"/events/{event_id}")
-                event_name  = event_data.get("name", "Your Event")
-                start_iso   = (event_data.get("start") or {}).get("formatted", "")
-                venue_obj   = event_data.get("venue") or {}
-                event_venue = venue_obj.get("name", "") or ("Online Event" if event_data.get("online_event") == "true" else "TBA")
-            except Exception:
-                event_name  = metadata.get("event_name", "Your Event")
-                start_iso   = ""
-                event_venue = ""
-
-            send_ticket_confirmation(
-                buyer_email=buyer_email,
-                buyer_name=buyer_name,
-                event_name=event_name,
-                event_date=start_iso,
-                event_venue=event_venue,
-                tickets=issued_ticket_objects,
-                amount_total=amount_total,
-                source="stripe",
-            )
-
-        # ── If TT creation failed, save order locally so admin can retry ──────
-        if not all_created:
-            _store_pending_order(
-                event_id=event_id,
-                buyer_name=buyer_name,
-                buyer_email=buyer_email,
-                phone=phone,
-                items=items,
-                amount_total=amount_total,
-                stripe_session_id=session_id,
-            )
-            logger.warning(
-                f"[Webhook] Order saved to pending_orders.json — "
-                "set up TT billing then use /payments/pending-orders to retry."
-            )
+    # ── Handle: checkout.session.expired — give the held tickets back ────────
+    elif event["type"] == "checkout.session.expired":
+        session = event["data"]["object"]
+        hold_id = (session.get("metadata") or {}).get("hold_id")
+        if hold_id:
+            await run_in_threadpool(reservations.release, hold_id, "expired")
+        else:
+            await run_in_threadpool(reservations.release_session, session.get("id", ""), "expired")
 
     # Always return 200 to Stripe
     return {"received": True}
@@ -493,53 +471,47 @@ async def stripe_webhook(request: Request):
 # ─────────────────────────────────────────────────────────────────────────────
 # GET /payments/pending-orders  — Admin: view orders that failed TT creation
 # POST /payments/pending-orders/{order_id}/retry — Admin: retry TT creation
+# POST /payments/pending-orders/retry-all — Admin: retry every pending order
+# GET /payments/pending-orders/retry-runs[/{run_id}] — Admin: bulk retry progress
 # ─────────────────────────────────────────────────────────────────────────────
 
 @router.get("/pending-orders")
 def get_pending_orders():
-    """Returns all locally-stored pending orders (Stripe paid but TT ticket not yet created)."""
-    orders = _load_pending_orders()
+    """Returns pending orders (Stripe paid but TT tickets not created after all retries)."""
+    orders = order_store.list_orders(status="pending")
     return {"data": orders, "count": len(orders)}
 
 
 @router.post("/pending-orders/{order_id}/retry")
 def retry_pending_order(order_id: str):
-    """Retries creating the TT issued_ticket for a pending order."""
-    orders = _load_pending_orders()
-    order = next((o for o in orders if o["id"] == order_id), None)
-    if not order:
+    """Retries creating the TT issued_tickets for a pending order right away."""
+    # A plain def: FastAPI runs it in the threadpool, where the job gets its own loop
+    result = fulfilment_queue.retry_job_now(order_id)
+    if result is None:
         raise HTTPException(status_code=404, detail="Pending order not found")
+    if result["status"] != "done":
+        raise HTTPException(status_code=400, detail=result["error"])
+    return {"success": True, "issued_ticket_ids": [t["id"] for t in result["issued"]]}
 
-    issued = []
-    errors = []
-    for item in order.get("items", []):
-        ticket_type_id = item.get("ticket_type_id")
-        quantity = item.get("quantity", 1)
-        payload_tt = {
-            "event_id": order["event_id"],
-            "ticket_type_id": ticket_type_id,
-            "full_name": order["buyer_name"],
-            "email": order["buyer_email"],
-        }
-        if order.get("phone"):
-            payload_tt["phone"] = order["phone"]
 
-        for _ in range(quantity):
-            try:
-                result = post_to_tt("/issued_tickets", payload_tt)
-                issued.append(result.get("id", "?"))
-            except Exception as e:
-                errors.append(str(e))
-
-    if not errors:
-        # Remove from pending list on full success
-        orders = [o for o in orders if o["id"] != order_id]
-        _save_pending_orders(orders)
-        return {"success": True, "issued_ticket_ids": issued}
-    else:
-        # Update error message in place
-        for o in orders:
-            if o["id"] == order_id:
-                o["error"] = " | ".join(errors)
-        _save_pending_orders(orders)
-        raise HTTPException(status_code=400, detail=" | ".join(errors))
+@router.post("/pending-orders/retry-all")
+def retry_all_pending_orders():
+    """
+    Starts a background run that retries every pending order with bounded
+    concurrency. Returns the run (or the one already in progress) to poll.
+    """
+    return bulk_retry.start_run()
+
+
+@router.get("/pending-orders/retry-runs")
+def list_retry_runs():
+    return {"data": bulk_retry.list_runs()}
+
+
+@router.get("/pending-orders/retry-runs/{run_id}")
+def get_retry_run(run_id: str):
+    """Progress and per-order results of a bulk retry run."""
+    run = bulk_retry.get_run(run_id, include_items=True)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Retry run not found")
+    return run
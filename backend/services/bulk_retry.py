@@ -0,0 +1,211 @@
+"""
+Bulk replay of pending orders (e.g. after a Ticket Tailor billing outage).
+
+`start_run` snapshots every pending order into a persisted run and drains it in
+a background thread, BULK_RETRY_CONCURRENCY orders at a time, through the same
+`fulfilment_queue.retry_job` as the single-order retry. When an order comes back
+rate limited the whole pool pauses before starting more. Per-order results are
+stored as they finish, so a run interrupted by a restart resumes with the
+orders it had not finished (`resume_runs` on startup). An order whose job a
+fulfilment worker is already running is recorded as "in_progress" and takes the
+job's outcome once it finishes.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from services.local_db import get_db, ensure_schema
+from services.ticket_tailor import close_async_client
+from services import fulfilment_queue, order_store
+
+logger = logging.getLogger(__name__)
+
+BULK_RETRY_CONCURRENCY = int(os.getenv("BULK_RETRY_CONCURRENCY", "4"))
+BULK_RETRY_RATE_LIMIT_PAUSE = float(os.getenv("BULK_RETRY_RATE_LIMIT_PAUSE", "30"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS retry_runs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'running',
+    total INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS retry_run_items (
+    run_id TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    error TEXT,
+    issued_ticket_ids TEXT,
+    finished_at REAL,
+    PRIMARY KEY (run_id, order_id)
+);
+CREATE INDEX IF NOT EXISTS ix_retry_run_items_status ON retry_run_items (run_id, status);
+"""
+
+_threads = {}
+_lock = threading.Lock()
+
+
+def _db():
+    ensure_schema("retry_runs", _SCHEMA)
+    return get_db()
+
+
+def _is_rate_limited(error: str) -> bool:
+    return "[429]" in (error or "")
+
+
+async def _drain(run_id: str):
+    db = _db()
+    order_ids = [r["order_id"] for r in db.execute(
+        "SELECT order_id FROM retry_run_items WHERE run_id = ? AND status = 'queued'", (run_id,)
+    )]
+    semaphore = asyncio.Semaphore(max(1, BULK_RETRY_CONCURRENCY))
+    resume_at = 0.0
+
+    async def _retry(order_id: str):
+        nonlocal resume_at
+        async with semaphore:
+            if resume_at > time.time():
+                await asyncio.sleep(resume_at - time.time())
+            try:
+                result = await fulfilment_queue.retry_job(order_id, priority="background")
+            except Exception as e:
+                result = {"status": "failed", "error": str(e), "issued": []}
+            if result is None:
+                # Already fulfilled, or a fulfilment worker is running it right now
+                job = fulfilment_queue.get_job(order_id)
+                if job is not None and job["status"] in ("running", "queued"):
+                    status, error, issued = "in_progress", None, []
+                else:
+                    status, error, issued = "skipped", None, []
+            else:
+                status = "done" if result["status"] == "done" else "failed"
+                error, issued = result["error"], result["issued"]
+                if _is_rate_limited(error):
+                    resume_at = time.time() + BULK_RETRY_RATE_LIMIT_PAUSE
+                    logger.warning(f"[BulkRetry] Rate limited — pausing run {run_id} for {BULK_RETRY_RATE_LIMIT_PAUSE:.0f}s")
+            with db:
+                db.execute(
+                    "UPDATE retry_run_items SET status = ?, error = ?, issued_ticket_ids = ?, finished_at = ? "
+                    "WHERE run_id = ? AND order_id = ?",
+                    (status, error, " ".join(t["id"] for t in issued), time.time(), run_id, order_id),
+                )
+
+    await asyncio.gather(*(_retry(order_id) for order_id in order_ids))
+    with db:
+        db.execute("UPDATE retry_runs SET status = 'done', finished_at = ? WHERE id = ?", (time.time(), run_id))
+    logger.info(f"[BulkRetry] Run {run_id} finished")
+
+
+def _run(run_id: str):
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(_drain(run_id))
+    except Exception as e:
+        logger.error(f"[BulkRetry] Run {run_id} stopped: {e}")
+    finally:
+        loop.run_until_complete(close_async_client())
+        loop.close()
+        with _lock:
+            _threads.pop(run_id, None)
+
+
+def _launch(run_id: str):
+    with _lock:
+        if run_id in _threads:
+            return
+        thread = threading.Thread(target=_run, args=(run_id,), name=f"bulk-retry-{run_id[:8]}", daemon=True)
+        _threads[run_id] = thread
+    thread.start()
+
+
+def start_run() -> dict:
+    """Starts retrying every pending order, or returns the run already in progress."""
+    db = _db()
+    active = db.execute("SELECT id FROM retry_runs WHERE status = 'running' LIMIT 1").fetchone()
+    if active:
+        _launch(active["id"])
+        return get_run(active["id"])
+
+    order_ids = [o["id"] for o in order_store.list_orders(status="pending", limit=-1)]
+    run_id = str(uuid.uuid4())
+    with db:
+        db.execute(
+            "INSERT INTO retry_runs (id, status, total, started_at) VALUES (?, ?, ?, ?)",
+            (run_id, "running" if order_ids else "done", len(order_ids), time.time()),
+        )
+        db.executemany(
+            "INSERT INTO retry_run_items (run_id, order_id) VALUES (?, ?)",
+            [(run_id, order_id) for order_id in order_ids],
+        )
+    if order_ids:
+        logger.info(f"[BulkRetry] Run {run_id} started for {len(order_ids)} pending orders")
+        _launch(run_id)
+    return get_run(run_id)
+
+
+def resume_runs():
+    """Restarts runs that were still in progress when the process stopped."""
+    for row in _db().execute("SELECT id FROM retry_runs WHERE status = 'running'").fetchall():
+        logger.info(f"[BulkRetry] Resuming run {row['id']}")
+        _launch(row["id"])
+
+
+def _settle_in_progress(db, run_id: str):
+    """Gives items that were running elsewhere the outcome of their job, once it has one."""
+    rows = db.execute(
+        "SELECT order_id FROM retry_run_items WHERE run_id = ? AND status = 'in_progress'", (run_id,)
+    ).fetchall()
+    for row in rows:
+        job = fulfilment_queue.get_job(row["order_id"])
+        if job is not None and job["status"] in ("running", "queued"):
+            continue
+        if job is not None and job["status"] == "done":
+            status, error = "done", None
+        elif job is not None and job["status"] == "dead":
+            status, error = "failed", job["last_error"]
+        else:
+            status, error = "skipped", None
+        with db:
+            db.execute(
+                "UPDATE retry_run_items SET status = ?, error = ?, issued_ticket_ids = ?, finished_at = ? "
+                "WHERE run_id = ? AND order_id = ?",
+                (status, error, " ".join(t["id"] for t in (job or {}).get("issued", [])), time.time(),
+                 run_id, row["order_id"]),
+            )
+
+
+def get_run(run_id: str, include_items: bool = False):
+    """Progress of a run: counts per item status, plus per-order results if asked."""
+    db = _db()
+    run = db.execute("SELECT * FROM retry_runs WHERE id = ?", (run_id,)).fetchone()
+    if run is None:
+        return None
+    _settle_in_progress(db, run_id)
+    counts = {r["status"]: r["n"] for r in db.execute(
+        "SELECT status, COUNT(*) AS n FROM retry_run_items WHERE run_id = ? GROUP BY status", (run_id,)
+    )}
+    result = {
+        **dict(run),
+        "queued": counts.get("queued", 0),
+        "succeeded": counts.get("done", 0),
+        "failed": counts.get("failed", 0),
+        "skipped": counts.get("skipped", 0),
+        "in_progress": counts.get("in_progress", 0),
+    }
+    if include_items:
+        result["items"] = [dict(r) for r in db.execute(
+            "SELECT order_id, status, error, issued_ticket_ids, finished_at FROM retry_run_items "
+            "WHERE run_id = ? ORDER BY rowid", (run_id,)
+        )]
+    return result
+
+
+def list_runs(limit: int = 20) -> list:
+    rows = _db().execute("SELECT id FROM retry_runs ORDER BY started_at DESC LIMIT ?", (limit,)).fetchall()
+    return [get_run(r["id"]) for r in rows]
@@ -0,0 +1,200 @@
+"""
+Bundle availability engine behind GET /event_series/{id}/bundles/availability.
+
+A bundle can be bought `min(floor(stock / required_qty))` times across the
+ticket types it includes. The series is fetched once per request (bundles and
+default ticket types both come from the same object); event quantities are read
+from the live inventory (services/inventory.py). Per event we keep an inventory
+snapshot and the bundle results computed from it; on the next request only
+bundles that include a ticket type whose quantity (or name) changed are
+recomputed. Local inventory changes are pushed straight into the snapshots via
+`apply_quantity`.
+
+Availability for many events of a series is answered in one call, with the
+event fetches running concurrently. Snapshots are kept for the most recently
+used BUNDLE_SNAPSHOT_MAX events.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from services.ticket_tailor import afetch_from_tt
+from services.inventory import inventory
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_SNAPSHOT_MAX = int(os.getenv("BUNDLE_SNAPSHOT_MAX", "1000"))
+
+# Snapshot key for series-level availability (no specific occurrence)
+SERIES_DEFAULTS = ""
+
+
+def compute_bundle(bundle: dict, inventory: dict) -> dict:
+    """Enriches one bundle from `inventory` (ticket_type_id -> (quantity, name))."""
+    included_tickets = bundle.get("ticket_types", [])  # [{id, quantity}]
+
+    min_purchasable = None
+    all_available = True
+    for included in included_tickets:
+        required_qty = included.get("quantity", 1)
+        stock = inventory.get(included["id"])
+        if stock is None:
+            # We don't have inventory data for this ticket — be conservative
+            all_available = False
+            purchasable_for_this = 0
+        else:
+            purchasable_for_this = stock[0] // required_qty if required_qty > 0 else 0
+            if purchasable_for_this == 0:
+                all_available = False
+        if min_purchasable is None or purchasable_for_this < min_purchasable:
+            min_purchasable = purchasable_for_this
+
+    if not included_tickets:
+        # A bundle with no tickets configured is treated as unavailable
+        all_available = False
+        min_purchasable = 0
+
+    return {
+        **bundle,
+        "is_available": all_available,
+        "max_quantity": min_purchasable if min_purchasable is not None else 0,
+        "included_tickets_details": [
+            {
+                "id": inc["id"],
+                "name": inventory.get(inc["id"], (0, "Included Ticket"))[1],
+                "quantity": inc.get("quantity", 1),
+                "left": inventory.get(inc["id"], (0, None))[0],
+            }
+            for inc in included_tickets
+        ],
+    }
+
+
+def build_inventory(event: dict, series: dict) -> dict:
+    """ticket_type_id -> (quantity, name); the occurrence's own types win over series defaults."""
+    inventory = {}
+    for source in ((event or {}).get("ticket_types", []), series.get("default_ticket_types", [])):
+        for tt in source:
+            if tt["id"] not in inventory:
+                inventory[tt["id"]] = (tt.get("quantity") or 0, tt.get("name", "Unknown Ticket"))
+    return inventory
+
+
+class _Snapshot:
+    __slots__ = ("inventory", "results")
+
+    def __init__(self):
+        self.inventory = {}
+        self.results = {}
+
+
+class BundleAvailability:
+    def __init__(self, max_snapshots: int = BUNDLE_SNAPSHOT_MAX):
+        self.max_snapshots = max_snapshots
+        self._lock = threading.Lock()
+        # series_id -> (bundles, ticket_type_id -> indexes of bundles including it)
+        self._series = {}
+        # (series_id, event_id) -> _Snapshot
+        self._snapshots: "OrderedDict[tuple, _Snapshot]" = OrderedDict()
+        self.stats = {"requests": 0, "bundles_computed": 0, "bundles_reused": 0}
+
+    def _index_series(self, series_id: str, bundles: list):
+        """Returns the dependency index for `bundles`, dropping snapshots if bundles changed."""
+        known = self._series.get(series_id)
+        if known is not None and known[0] == bundles:
+            return known[1]
+        used_by = {}
+        for i, bundle in enumerate(bundles):
+            for included in bundle.get("ticket_types", []):
+                used_by.setdefault(included["id"], set()).add(i)
+        self._series[series_id] = (bundles, used_by)
+        for key in [k for k in self._snapshots if k[0] == series_id]:
+            del self._snapshots[key]
+        return used_by
+
+    def _refresh(self, series_id: str, event_id: str, bundles: list, used_by: dict, inventory: dict) -> list:
+        key = (series_id, event_id)
+        snapshot = self._snapshots.get(key)
+        if snapshot is None:
+            snapshot = self._snapshots[key] = _Snapshot()
+            dirty = range(len(bundles))
+        else:
+            self._snapshots.move_to_end(key)
+            changed = {tid for tid in inventory.keys() | snapshot.inventory.keys()
+                       if inventory.get(tid) != snapshot.inventory.get(tid)}
+            dirty = set().union(*(used_by.get(tid, ()) for tid in changed))
+        snapshot.inventory = inventory
+        for i in dirty:
+            snapshot.results[i] = compute_bundle(bundles[i], inventory)
+        self.stats["bundles_computed"] += len(dirty)
+        self.stats["bundles_reused"] += len(bundles) - len(dirty)
+        while len(self._snapshots) > self.max_snapshots:
+            self._snapshots.popitem(last=False)
+        return [snapshot.results[i] for i in range(len(bundles))]
+
+    async def for_events(self, series_id: str, event_ids: list) -> dict:
+        """
+        Bundle availability per event: {event_id: [enriched bundle, ...]}.
+        Pass SERIES_DEFAULTS as an event id for series-level availability.
+        """
+        try:
+            series = await afetch_from_tt(f"/event_series/{series_id}")
+        except Exception:
+            return {event_id: [] for event_id in event_ids}
+        bundles = series.get("bundles", [])
+        if not bundles:
+            return {event_id: [] for event_id in event_ids}
+
+        defaults = build_inventory(None, series)
+        real_ids = [e for e in dict.fromkeys(event_ids) if e != SERIES_DEFAULTS]
+        loaded = await asyncio.gather(
+            *(inventory.quantities(event_id) for event_id in real_ids), return_exceptions=True
+        )
+        inventories = {SERIES_DEFAULTS: defaults}
+        for event_id, quantities in zip(real_ids, loaded):
+            if isinstance(quantities, Exception):
+                # Fall back to the series defaults for this occurrence
+                logger.warning(f"[Bundles] Could not load inventory for {event_id}: {quantities}")
+                quantities = defaults
+            inventories[event_id] = quantities
+
+        with self._lock:
+            self.stats["requests"] += 1
+            used_by = self._index_series(series_id, bundles)
+            return {
+                event_id: self._refresh(series_id, event_id, bundles, used_by, inventories[event_id])
+                for event_id in event_ids
+            }
+
+    def apply_quantity(self, event_id: str, ticket_type_id: str, quantity: int):
+        """Updates one ticket type's quantity in every snapshot of `event_id` and recomputes its bundles."""
+        with self._lock:
+            for (series_id, snap_event_id), snapshot in self._snapshots.items():
+                if snap_event_id != event_id or ticket_type_id not in snapshot.inventory:
+                    continue
+                bundles, used_by = self._series[series_id]
+                name = snapshot.inventory[ticket_type_id][1]
+                snapshot.inventory = {**snapshot.inventory, ticket_type_id: (quantity, name)}
+                for i in used_by.get(ticket_type_id, ()):
+                    snapshot.results[i] = compute_bundle(bundles[i], snapshot.inventory)
+                    self.stats["bundles_computed"] += 1
+
+    def invalidate(self, series_id: str = None):
+        with self._lock:
+            if series_id is None:
+                self._series.clear()
+                self._snapshots.clear()
+                return
+            self._series.pop(series_id, None)
+            for key in [k for k in self._snapshots if k[0] == series_id]:
+                del self._snapshots[key]
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self.stats, "series": len(self._series), "snapshots": len(self._snapshots)}
+
+
+bundle_availability = BundleAvailability()
+inventory.add_listener(bundle_availability.apply_quantity)
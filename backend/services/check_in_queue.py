@@ -0,0 +1,192 @@
+"""
+Durable offline check-in queue.
+
+In queued mode a scan is validated against local ticket state (the scanner
+index), written to SQLite and answered immediately. A background worker drains
+the queue to Ticket Tailor in batches, retrying with backoff, so venue Wi-Fi
+drops or upstream latency never stall the door line. Only rate limits, 5xx and
+network errors are retried; a permanent rejection (unknown or voided ticket)
+fails the check-in at once. ticket_id is UNIQUE, so a
+second scan of the same ticket is caught locally. A check-in that is given up
+on (`failed`) clears the local checked_in flag again, since Ticket Tailor never
+recorded it, and the ticket can be scanned again.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+import requests
+from services.local_db import get_db, ensure_schema
+from services.ticket_tailor import post_to_tt
+from services.ticket_index import ticket_index
+from services import ticket_mirror
+
+logger = logging.getLogger(__name__)
+
+CHECK_IN_MODE = os.getenv("CHECK_IN_MODE", "direct")  # "direct" | "queued"
+CHECK_IN_BATCH_SIZE = int(os.getenv("CHECK_IN_BATCH_SIZE", "25"))
+CHECK_IN_FLUSH_INTERVAL = float(os.getenv("CHECK_IN_FLUSH_INTERVAL", "2"))
+CHECK_IN_MAX_ATTEMPTS = int(os.getenv("CHECK_IN_MAX_ATTEMPTS", "20"))
+
+# Ticket Tailor answers that no retry will change
+PERMANENT_STATUS_CODES = {400, 404, 409, 422}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS check_in_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticket_id TEXT NOT NULL UNIQUE,
+    scanned_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    synced_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_check_in_queue_pending ON check_in_queue (status, next_attempt_at);
+"""
+
+_worker = None
+_stop = threading.Event()
+_wake = threading.Event()
+_last_flush_at = None
+
+
+class DuplicateCheckIn(Exception):
+    pass
+
+
+class UnknownTicket(Exception):
+    pass
+
+
+def _db():
+    ensure_schema("check_in_queue", _SCHEMA)
+    return get_db()
+
+
+def enqueue_check_in(ticket_key: str) -> dict:
+    """
+    Validates a scan (ticket id or barcode) locally and queues it for upload.
+    Returns the local ticket record. Raises UnknownTicket / DuplicateCheckIn.
+    """
+    record = ticket_index.lookup(ticket_key)
+    if record is None:
+        raise UnknownTicket(f"Ticket {ticket_key} is not in the local index — preload the event first.")
+    if record.get("checked_in") == "true":
+        raise DuplicateCheckIn("Ticket is already checked in.")
+    if record.get("status") == "voided":
+        raise UnknownTicket("Ticket has been voided.")
+
+    db = _db()
+    try:
+        with db:
+            # A check-in that was given up on doesn't block a new scan
+            db.execute("DELETE FROM check_in_queue WHERE ticket_id = ? AND status = 'failed'", (record["id"],))
+            db.execute(
+                "INSERT INTO check_in_queue (ticket_id, scanned_at) VALUES (?, ?)",
+                (record["id"], time.time()),
+            )
+    except sqlite3.IntegrityError:
+        raise DuplicateCheckIn("Ticket is already checked in.")
+
+    ticket_index.mark_checked_in(record["id"])
+    record["checked_in"] = "true"
+    _wake.set()
+    return record
+
+
+def _mark(row_id: int, **fields):
+    sets = ", ".join(f"{k} = ?" for k in fields)
+    db = _db()
+    with db:
+        db.execute(f"UPDATE check_in_queue SET {sets} WHERE id = ?", (*fields.values(), row_id))
+
+
+def _is_permanent(error: Exception) -> bool:
+    response = getattr(error, "response", None)
+    return (isinstance(error, requests.HTTPError) and response is not None
+            and response.status_code in PERMANENT_STATUS_CODES)
+
+
+def flush_once(limit: int = CHECK_IN_BATCH_SIZE) -> int:
+    """Uploads one batch of due check-ins. Returns how many were attempted."""
+    global _last_flush_at
+    now = time.time()
+    rows = _db().execute(
+        "SELECT id, ticket_id, attempts FROM check_in_queue "
+        "WHERE status = 'queued' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+        (now, limit),
+    ).fetchall()
+
+    for row in rows:
+        try:
+            post_to_tt("/check_ins", {"issued_ticket_id": row["ticket_id"], "quantity": 1}, priority="checkout")
+            _mark(row["id"], status="synced", synced_at=time.time(), last_error=None)
+            ticket_mirror.mark_checked_in(row["ticket_id"])
+        except Exception as e:
+            error_msg = str(e)
+            if "already" in error_msg.lower():
+                # Checked in elsewhere (another lane / TT app) — nothing left to upload
+                _mark(row["id"], status="synced", synced_at=time.time(), last_error=error_msg)
+                ticket_mirror.mark_checked_in(row["ticket_id"])
+                continue
+            attempts = row["attempts"] + 1
+            if _is_permanent(e) or attempts >= CHECK_IN_MAX_ATTEMPTS:
+                logger.error(f"[CheckInQueue] Giving up on {row['ticket_id']}: {error_msg}")
+                _mark(row["id"], status="failed", attempts=attempts, last_error=error_msg)
+                ticket_index.mark_checked_in(row["ticket_id"], checked_in=False)
+                ticket_mirror.mark_checked_in(row["ticket_id"], checked_in=False)
+            else:
+                backoff = min(300, 2 ** attempts)
+                _mark(row["id"], attempts=attempts, next_attempt_at=time.time() + backoff, last_error=error_msg)
+
+    if rows:
+        _last_flush_at = time.time()
+    return len(rows)
+
+
+def _run():
+    while not _stop.is_set():
+        try:
+            # Keep draining while full batches come back
+            while flush_once() >= CHECK_IN_BATCH_SIZE and not _stop.is_set():
+                pass
+        except Exception as e:
+            logger.error(f"[CheckInQueue] Flush failed: {e}")
+        _wake.wait(CHECK_IN_FLUSH_INTERVAL)
+        _wake.clear()
+
+
+def start_worker():
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        _stop.clear()
+        _worker = threading.Thread(target=_run, name="check-in-queue", daemon=True)
+        _worker.start()
+
+
+def stop_worker():
+    _stop.set()
+    _wake.set()
+
+
+def queue_status() -> dict:
+    """Queue depth and sync lag for the scanner UI."""
+    db = _db()
+    counts = {r["status"]: r["n"] for r in db.execute(
+        "SELECT status, COUNT(*) AS n FROM check_in_queue GROUP BY status"
+    )}
+    oldest = db.execute(
+        "SELECT MIN(scanned_at) AS t FROM check_in_queue WHERE status = 'queued'"
+    ).fetchone()["t"]
+    return {
+        "mode": CHECK_IN_MODE,
+        "depth": counts.get("queued", 0),
+        "failed": counts.get("failed", 0),
+        "synced": counts.get("synced", 0),
+        "sync_lag_seconds": round(time.time() - oldest, 1) if oldest else 0,
+        "last_flush_at": _last_flush_at,
+        "worker_running": _worker is not None and _worker.is_alive(),
+    }
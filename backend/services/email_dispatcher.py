@@ -0,0 +1,236 @@
+"""
+Background SMTP dispatcher with a small pool of persistent connections.
+
+`send` only queues the message. SMTP_POOL_SIZE sender threads each own one
+authenticated connection that is reused across messages (and reopened when the
+server drops it, or closed after SMTP_IDLE_TIMEOUT seconds of quiet). A sender
+that wakes for a message also takes whatever else is queued, up to
+SMTP_BATCH_SIZE, and sends the burst on the same connection. Failed messages are
+retried with backoff up to SMTP_MAX_ATTEMPTS times, except permanent rejections
+of the message itself (a 5xx reply to sendmail, e.g. every recipient refused),
+which fail at once and keep the connection. Connect, TLS and login errors (a
+535 for bad credentials too) are always retried.
+
+The queue is in memory: messages still queued when the process dies are lost.
+Callers that must not lose a message pass `on_done`, called with True once the
+server accepted it or False once it was given up on, and keep their own record
+of it until then (see services/fulfilment_queue.py).
+
+To test locally without a real mailbox, run a debugging server and point the
+dispatcher at it:
+    python -m aiosmtpd -n -l localhost:1025
+    SMTP_HOST=localhost SMTP_PORT=1025 SMTP_USE_TLS=false SMTP_AUTH=false
+"""
+
+import time
+import queue
+import logging
+import smtplib
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPConnectError(Exception):
+    """Opening, securing or authenticating the connection failed; says nothing about the message."""
+
+
+class EmailDispatcher:
+    def __init__(self, host: str, port: int, username: str, password: str, use_tls: bool = True,
+                 use_auth: bool = True, pool_size: int = 2, batch_size: int = 20,
+                 max_attempts: int = 5, idle_timeout: float = 30, timeout: float = 20):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_auth = use_auth
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._latencies = deque(maxlen=500)     # queued -> accepted by server, ms
+        self._send_times = deque(maxlen=500)    # SMTP sendmail call only, ms
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "retries": 0, "connections_opened": 0, "batches": 0}
+
+    # ── public API ──────────────────────────────────────────────────────────
+    def send(self, from_addr: str, to_addr: str, message: str, on_done=None):
+        """Queues a fully rendered message for delivery; `on_done(sent: bool)` reports the outcome."""
+        self._ensure_started()
+        with self._lock:
+            self.stats["queued"] += 1
+        self._queue.put({"from": from_addr, "to": to_addr, "message": message,
+                         "attempts": 0, "queued_at": time.time(), "on_done": on_done})
+
+    def stop(self, timeout: float = 5):
+        """Lets the senders finish what is queued (up to `timeout`), then closes connections."""
+        deadline = time.time() + timeout
+        while not self._queue.empty() and time.time() < deadline:
+            time.sleep(0.05)
+        self._stop.set()
+        for _ in self._threads:
+            self._queue.put(None)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            send_times = list(self._send_times)
+            stats = dict(self.stats)
+
+        def pct(values, p):
+            return round(values[min(len(values) - 1, int(len(values) * p))], 1) if values else None
+
+        return {
+            **stats,
+            "queue_depth": self._queue.qsize(),
+            "senders": sum(1 for t in self._threads if t.is_alive()),
+            "latency_ms": {"p50": pct(latencies, 0.5), "p95": pct(latencies, 0.95)},
+            "send_ms_avg": round(sum(send_times) / len(send_times), 1) if send_times else None,
+        }
+
+    # ── internals ───────────────────────────────────────────────────────────
+    def _ensure_started(self):
+        with self._lock:
+            if self._threads and any(t.is_alive() for t in self._threads):
+                return
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"smtp-sender-{i}", daemon=True)
+                for i in range(self.pool_size)
+            ]
+            for t in self._threads:
+                t.start()
+
+    def _connect(self) -> smtplib.SMTP:
+        try:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        except Exception as e:
+            raise SMTPConnectError(e) from e
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.use_auth:
+                server.login(self.username, self.password)
+        except Exception as e:
+            server.close()
+            raise SMTPConnectError(e) from e
+        with self._lock:
+            self.stats["connections_opened"] += 1
+        return server
+
+    @staticmethod
+    def _close(server):
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _next_batch(self) -> list:
+        first = self._queue.get(timeout=self.idle_timeout)
+        batch = [first]
+        while first is not None and len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is None:
+                break
+        return batch
+
+    @staticmethod
+    def _is_permanent(error: Exception) -> bool:
+        if isinstance(error, SMTPConnectError):
+            return False
+        # sendmail got an answer (so the connection is fine) and it won't accept this message
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return True
+        return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+    @staticmethod
+    def _report(job: dict, sent: bool):
+        if job.get("on_done") is None:
+            return
+        try:
+            job["on_done"](sent)
+        except Exception as e:
+            logger.error(f"[Email] Delivery callback for {job['to']} failed: {e}")
+
+    def _give_up(self, job: dict, error: Exception):
+        logger.error(f"[Email] Failed to send to {job['to']} after {job['attempts']} attempts: {error}")
+        with self._lock:
+            self.stats["failed"] += 1
+        self._report(job, False)
+
+    def _retry_later(self, job: dict, error: Exception):
+        job["attempts"] += 1
+        if job["attempts"] >= self.max_attempts:
+            self._give_up(job, error)
+            return
+        delay = min(300, 2 ** job["attempts"])
+        logger.warning(f"[Email] Send to {job['to']} failed ({error}), retrying in {delay}s")
+        with self._lock:
+            self.stats["retries"] += 1
+        timer = threading.Timer(delay, self._queue.put, args=(job,))
+        timer.daemon = True
+        timer.start()
+
+    def _deliver(self, server, job: dict):
+        started = time.perf_counter()
+        server.sendmail(job["from"], job["to"], job["message"])
+        now = time.perf_counter()
+        with self._lock:
+            self.stats["sent"] += 1
+            self._send_times.append((now - started) * 1000)
+            self._latencies.append((time.time() - job["queued_at"]) * 1000)
+        self._report(job, True)
+
+    def _run(self):
+        server = None
+        while not self._stop.is_set():
+            try:
+                batch = self._next_batch()
+            except queue.Empty:
+                # Idle — don't hold the connection open
+                self._close(server)
+                server = None
+                continue
+
+            with self._lock:
+                self.stats["batches"] += 1
+            for job in batch:
+                if job is None:
+                    self._close(server)
+                    return
+                try:
+                    if server is None:
+                        server = self._connect()
+                    try:
+                        self._deliver(server, job)
+                    except smtplib.SMTPServerDisconnected:
+                        # Pooled connection went stale — reconnect once
+                        self._close(server)
+                        server = None
+                        server = self._connect()
+                        self._deliver(server, job)
+                    logger.info(f"[Email] Confirmation sent to {job['to']}")
+                except Exception as e:
+                    if self._is_permanent(e):
+                        # Retrying won't change the answer; smtplib has reset the session
+                        job["attempts"] += 1
+                        self._give_up(job, e)
+                        continue
+                    # Connection state is unknown after a failure — start fresh
+                    self._close(server)
+                    server = None
+                    self._retry_later(job, e)
+        self._close(server)
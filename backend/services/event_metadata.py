@@ -0,0 +1,115 @@
+"""
+Event details shown in confirmation emails (name, formatted start, venue),
+cached per event id.
+
+Every fulfilled order used to re-read /events/{id} just for these three fields.
+They are now kept here: warmed when an event is created through the API,
+dropped when it is updated or deleted (or when its series is edited), and
+otherwise re-read only after EVENT_METADATA_TTL seconds as a safety net.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from services.ticket_tailor import fetch_from_tt, afetch_from_tt, add_write_listener
+
+EVENT_METADATA_TTL = float(os.getenv("EVENT_METADATA_TTL", str(6 * 3600)))
+EVENT_METADATA_MAX = int(os.getenv("EVENT_METADATA_MAX", "2000"))
+
+
+def describe(event_data: dict) -> dict:
+    """{"name", "date", "venue", "series_id"} from a Ticket Tailor event object."""
+    venue_obj = event_data.get("venue") or {}
+    return {
+        "name": event_data.get("name", "Your Event"),
+        "date": (event_data.get("start") or {}).get("formatted", ""),
+        "venue": venue_obj.get("name", "") or ("Online Event" if event_data.get("online_event") == "true" else "TBA"),
+        "series_id": event_data.get("event_series_id"),
+    }
+
+
+class EventMetadataCache:
+    def __init__(self, ttl: float = EVENT_METADATA_TTL, max_entries: int = EVENT_METADATA_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()   # event_id -> (expires_at, metadata)
+        self.stats = {"hits": 0, "misses": 0, "warmed": 0, "invalidations": 0}
+
+    def _lookup(self, event_id: str):
+        with self._lock:
+            entry = self._entries.get(event_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(event_id)
+                self.stats["hits"] += 1
+                return entry[1]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, event_id: str, metadata: dict):
+        with self._lock:
+            self._entries[event_id] = (time.monotonic() + self.ttl, metadata)
+            self._entries.move_to_end(event_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def warm(self, event_data: dict, name: str = None, venue: str = None):
+        """
+        Caches a freshly created event. `name` / `venue` fill in what the create
+        response leaves out (they live on the series).
+        """
+        if not event_data.get("id"):
+            return
+        metadata = describe(event_data)
+        if not event_data.get("name") and name:
+            metadata["name"] = name
+        if not (event_data.get("venue") or {}).get("name") and venue:
+            metadata["venue"] = venue
+        self.put(event_data["id"], metadata)
+        with self._lock:
+            self.stats["warmed"] += 1
+
+    def get(self, event_id: str) -> dict:
+        """Cached metadata, fetched from Ticket Tailor on a miss (may raise)."""
+        metadata = self._lookup(event_id)
+        if metadata is None:
+            metadata = describe(fetch_from_tt(f"/events/{event_id}", priority="checkout"))
+            self.put(event_id, metadata)
+        return metadata
+
+    async def aget(self, event_id: str) -> dict:
+        metadata = self._lookup(event_id)
+        if metadata is None:
+            metadata = describe(await afetch_from_tt(f"/events/{event_id}", priority="checkout"))
+            self.put(event_id, metadata)
+        return metadata
+
+    def invalidate(self, event_id: str):
+        with self._lock:
+            if self._entries.pop(event_id, None) is not None:
+                self.stats["invalidations"] += 1
+
+    def invalidate_series(self, series_id: str):
+        with self._lock:
+            stale = [e for e, (_, m) in self._entries.items() if m.get("series_id") == series_id]
+            for event_id in stale:
+                del self._entries[event_id]
+            self.stats["invalidations"] += len(stale)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries)}
+
+
+event_metadata = EventMetadataCache()
+
+
+def _on_tt_write(endpoint: str):
+    # Series edits (name, venue) change what every occurrence shows
+    parts = endpoint.strip("/").split("/")
+    if len(parts) == 2 and parts[0] == "event_series":
+        event_metadata.invalidate_series(parts[1])
+
+
+add_write_listener(_on_tt_write)
@@ -0,0 +1,470 @@
+"""
+Durable fulfilment queue for paid Stripe checkouts.
+
+The webhook only verifies the signature, writes the order to SQLite and
+returns, so Stripe never times out and retries into a double issuance.
+Background workers issue the tickets and send the confirmation email. Failed
+tickets are retried with exponential backoff; only the tickets still missing
+are re-issued. Each ticket is saved to its job as soon as it is issued, so a job
+picked up again after a crash never issues it twice. After FULFILMENT_MAX_ATTEMPTS a job becomes "dead" and its order
+record turns "pending" — the pending orders the admin sees and can retry by
+hand. Job ids double as order ids in the order store.
+
+A running job is leased to the process that claimed it and the lease is renewed
+while it runs. Only jobs whose lease has run out (their process died) are
+queued again, so several server processes can share the queue without one
+re-issuing a job another is still working on.
+
+A done job keeps email_status "pending" until the dispatcher reports the
+confirmation accepted by the server. One still pending FULFILMENT_EMAIL_TIMEOUT
+seconds later (its process died with the message queued) is sent again.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+from services.local_db import get_db, ensure_schema, ensure_columns
+from services.ticket_tailor import close_async_client
+from services.event_metadata import event_metadata
+from services.ticket_issuance import expand_items, issue_tickets, unissued_items
+from services.email_service import send_ticket_confirmation
+from services.inventory import inventory, issued_counts
+from services import order_store, reservations
+
+logger = logging.getLogger(__name__)
+
+FULFILMENT_WORKERS = int(os.getenv("FULFILMENT_WORKERS", "2"))
+FULFILMENT_MAX_ATTEMPTS = int(os.getenv("FULFILMENT_MAX_ATTEMPTS", "8"))
+FULFILMENT_BACKOFF_BASE = float(os.getenv("FULFILMENT_BACKOFF_BASE", "5"))
+FULFILMENT_POLL_INTERVAL = float(os.getenv("FULFILMENT_POLL_INTERVAL", "5"))
+FULFILMENT_LEASE = float(os.getenv("FULFILMENT_LEASE", "120"))
+FULFILMENT_EMAIL_TIMEOUT = float(os.getenv("FULFILMENT_EMAIL_TIMEOUT", "900"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fulfilment_jobs (
+    id TEXT PRIMARY KEY,
+    stripe_session_id TEXT UNIQUE,
+    payload TEXT NOT NULL,
+    issued TEXT NOT NULL DEFAULT '[]',
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    claimed_by TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    email_status TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_fulfilment_jobs_due ON fulfilment_jobs (status, next_attempt_at);
+"""
+
+# Tables created by older versions lack these
+_ADDED_COLUMNS = {"claimed_by": "TEXT", "lease_until": "REAL NOT NULL DEFAULT 0", "email_status": "TEXT"}
+
+# Identifies this process as the holder of the jobs it claims
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_workers = []
+_stop = threading.Event()
+_wake = threading.Event()
+
+
+def _db():
+    ensure_schema("fulfilment_jobs", _SCHEMA)
+    ensure_columns("fulfilment_jobs", _ADDED_COLUMNS)
+    return get_db()
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def enqueue_checkout(session: dict):
+    """
+    Persists a checkout.session.completed session as a fulfilment job and
+    returns its id (None if the metadata is unusable). Stripe redelivering the
+    same session maps onto the existing job.
+    """
+    metadata = session.get("metadata", {}) or {}
+    try:
+        items = json.loads(metadata.get("items", "[]"))
+    except json.JSONDecodeError:
+        logger.error("Could not parse items JSON from Stripe session metadata")
+        return None
+
+    payload = {
+        "event_id": metadata.get("event_id"),
+        "buyer_name": metadata.get("buyer_name"),
+        "buyer_email": metadata.get("buyer_email"),
+        "phone": metadata.get("phone", ""),
+        "event_name": metadata.get("event_name", ""),
+        "items": items,
+        "amount_total": session.get("amount_total", 0),
+        "hold_id": metadata.get("hold_id"),
+    }
+    job_id = str(uuid.uuid4())
+    db = _db()
+    with db:
+        db.execute(
+            "INSERT OR IGNORE INTO fulfilment_jobs (id, stripe_session_id, payload, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (job_id, session.get("id") or None, json.dumps(payload), _now_iso(), time.time()),
+        )
+    row = db.execute("SELECT id FROM fulfilment_jobs WHERE stripe_session_id = ?", (session.get("id"),)).fetchone()
+    if row is None or row["id"] == job_id:
+        _ensure_recorded(job_id, session.get("id"), payload)
+    _wake.set()
+    return row["id"] if row else job_id
+
+
+def _ensure_recorded(job_id: str, stripe_session_id: str, order: dict):
+    """
+    Gives a checkout job its order row and marks its hold paid. These are
+    separate writes from the job insert, so process_job calls this again to
+    repair a job whose enqueue was cut short.
+    """
+    if order_store.get_order(job_id) is None:
+        order_store.save_order({
+            **order,
+            "id": job_id,
+            "stripe_session_id": stripe_session_id or "",
+            "source": "stripe",
+            "status": "processing",
+        })
+    # Paid — keep the tickets on hold until they are issued, whatever the session TTL
+    reservations.mark_paid(order.get("hold_id"))
+
+
+def _update(job_id: str, **fields):
+    fields["updated_at"] = time.time()
+    sets = ", ".join(f"{k} = ?" for k in fields)
+    db = _db()
+    with db:
+        db.execute(f"UPDATE fulfilment_jobs SET {sets} WHERE id = ?", (*fields.values(), job_id))
+
+
+def _backoff(attempts: int) -> float:
+    return min(3600, FULFILMENT_BACKOFF_BASE * 2 ** (attempts - 1))
+
+
+def _claim(job_id: str, from_statuses=("queued",)) -> bool:
+    """Atomically moves a job to running under our lease; False if another worker got it first."""
+    marks = ", ".join("?" for _ in from_statuses)
+    now = time.time()
+    db = _db()
+    with db:
+        cur = db.execute(
+            "UPDATE fulfilment_jobs SET status = 'running', claimed_by = ?, lease_until = ?, updated_at = ? "
+            f"WHERE id = ? AND status IN ({marks})",
+            (_OWNER, now + FULFILMENT_LEASE, now, job_id, *from_statuses),
+        )
+    return cur.rowcount == 1
+
+
+def _renew_lease(job_id: str):
+    db = _db()
+    with db:
+        db.execute(
+            "UPDATE fulfilment_jobs SET lease_until = ? WHERE id = ? AND status = 'running' AND claimed_by = ?",
+            (time.time() + FULFILMENT_LEASE, job_id, _OWNER),
+        )
+
+
+def _requeue_expired() -> int:
+    """Queues running jobs whose holder stopped renewing its lease (the process died)."""
+    db = _db()
+    with db:
+        cur = db.execute(
+            "UPDATE fulfilment_jobs SET status = 'queued', claimed_by = NULL, updated_at = ? "
+            "WHERE status = 'running' AND lease_until < ?",
+            (time.time(), time.time()),
+        )
+    if cur.rowcount:
+        logger.warning(f"[Fulfilment] Requeued {cur.rowcount} job(s) whose lease expired")
+    return cur.rowcount
+
+
+async def _run_claimed(job_id: str, priority: str = "checkout") -> dict:
+    """
+    Runs a job we claimed, renewing its lease until it finishes. If it crashes
+    the job goes back to queued (or stays dead once out of attempts) instead of
+    being left running.
+    """
+    async def renew():
+        while True:
+            await asyncio.sleep(FULFILMENT_LEASE / 3)
+            try:
+                _renew_lease(job_id)
+            except Exception as e:
+                logger.error(f"[Fulfilment] Could not renew lease of job {job_id}: {e}")
+
+    renewer = asyncio.get_running_loop().create_task(renew())
+    try:
+        return await process_job(job_id, priority)
+    except Exception as e:
+        logger.error(f"[Fulfilment] Job {job_id} crashed: {e}")
+        # A crash is a failed attempt too, or a job that always crashes would never go dead
+        row = _db().execute("SELECT attempts, payload FROM fulfilment_jobs WHERE id = ?", (job_id,)).fetchone()
+        attempts = (row["attempts"] if row is not None else 0) + 1
+        if attempts >= FULFILMENT_MAX_ATTEMPTS:
+            _update(job_id, status="dead", attempts=attempts, next_attempt_at=0, claimed_by=None, last_error=str(e))
+            order_store.update_order(job_id, status="pending", error=str(e))
+            if row is not None:
+                reservations.release(json.loads(row["payload"]).get("hold_id"))
+        else:
+            _update(job_id, status="queued", attempts=attempts, next_attempt_at=time.time() + _backoff(attempts),
+                    claimed_by=None, last_error=str(e))
+        raise
+    finally:
+        renewer.cancel()
+
+
+def _email_done(job_id: str, sent: bool):
+    # Called from a dispatcher thread once the message is accepted or given up on
+    _update(job_id, email_status="sent" if sent else "failed")
+
+
+async def _send_confirmation(job_id: str, order: dict, issued: list):
+    try:
+        meta = await event_metadata.aget(order["event_id"])
+        event_name, start_iso, event_venue = meta["name"], meta["date"], meta["venue"]
+    except Exception:
+        event_name  = order.get("event_name") or "Your Event"
+        start_iso   = ""
+        event_venue = ""
+
+    # Only queues the message; the email dispatcher delivers it and reports back
+    queued = send_ticket_confirmation(
+        buyer_email=order["buyer_email"],
+        buyer_name=order["buyer_name"],
+        event_name=event_name,
+        event_date=start_iso,
+        event_venue=event_venue,
+        tickets=issued,
+        amount_total=order.get("amount_total", 0),
+        source="stripe",
+        on_done=lambda sent: _email_done(job_id, sent),
+    )
+    if not queued:
+        _update(job_id, email_status="skipped")
+
+
+async def process_job(job_id: str, priority: str = "checkout") -> dict:
+    """Runs one claimed job: issues the missing tickets, then emails the buyer."""
+    row = _db().execute("SELECT * FROM fulfilment_jobs WHERE id = ?", (job_id,)).fetchone()
+    order = json.loads(row["payload"])
+    issued = json.loads(row["issued"])
+    attempts = row["attempts"] + 1
+    _ensure_recorded(job_id, row["stripe_session_id"], order)
+
+    payload_tt = {
+        "event_id": order["event_id"],
+        "full_name": order["buyer_name"],
+        "email": order["buyer_email"],
+        "send_email": "true",
+        "reference": f"{order['buyer_name']}|{order['buyer_email']}",
+    }
+    if order.get("phone"):
+        payload_tt["phone"] = order["phone"]
+
+    jobs = expand_items(order.get("items", []), payload_tt)
+    done = set()
+
+    def record(result: dict):
+        # Saved per ticket, so a crash mid-batch never re-issues what already went out
+        if not result["ok"]:
+            return
+        ticket = result["ticket"]
+        done.add(result["index"])
+        issued.append({
+            "id": ticket.get("id", ""),
+            "barcode": ticket.get("barcode") or ticket.get("id", ""),
+            "ticket_type_name": result["item"].get("name", "Ticket"),
+        })
+        order["items"] = unissued_items(jobs, done)
+        _update(job_id, payload=json.dumps(order), issued=json.dumps(issued))
+        inventory.record_issued(order["event_id"], [result])
+        reservations.settle(order.get("hold_id"), issued_counts([result]))
+        logger.info(f"[Fulfilment] ✅ Issued ticket: {ticket.get('id','?')} → {order['buyer_email']}")
+
+    try:
+        results = await issue_tickets(jobs, priority=priority, on_result=record)
+    except Exception as e:
+        errors = [str(e)]
+    else:
+        errors = [r["error"] for r in results if not r["ok"]]
+    # Only what still failed is issued again next time
+    order["items"] = unissued_items(jobs, done)
+
+    if not errors:
+        _update(job_id, payload=json.dumps(order), issued=json.dumps(issued),
+                status="done", attempts=attempts, last_error=None, claimed_by=None, email_status="pending")
+        order_store.update_order(job_id, status="confirmed", error=None,
+                                 tt_ticket_ids=[t["id"] for t in issued])
+        await _send_confirmation(job_id, order, issued)
+        return {"id": job_id, "status": "done", "issued": issued, "error": None}
+
+    error_msg = " | ".join(errors)
+    if attempts >= FULFILMENT_MAX_ATTEMPTS:
+        status, next_attempt_at = "dead", 0
+        logger.error(f"[Fulfilment] Job {job_id} moved to dead-letter after {attempts} attempts: {error_msg}")
+        # Stop holding what we could not issue; a manual retry takes whatever is left
+        reservations.release(order.get("hold_id"))
+    else:
+        status = "queued"
+        next_attempt_at = time.time() + _backoff(attempts)
+    _update(job_id, payload=json.dumps(order), issued=json.dumps(issued), status=status,
+            attempts=attempts, next_attempt_at=next_attempt_at, last_error=error_msg, claimed_by=None)
+    order_store.update_order(job_id, status="pending" if status == "dead" else "processing",
+                             error=error_msg, tt_ticket_ids=[t["id"] for t in issued])
+    return {"id": job_id, "status": status, "issued": issued, "error": error_msg}
+
+
+def _due_job_ids(limit: int = 10) -> list:
+    rows = _db().execute(
+        "SELECT id FROM fulfilment_jobs WHERE status = 'queued' AND next_attempt_at <= ? "
+        "ORDER BY next_attempt_at LIMIT ?",
+        (time.time(), limit),
+    ).fetchall()
+    return [r["id"] for r in rows]
+
+
+async def _resend_lost_emails():
+    """Sends again the confirmations of done jobs whose process died before delivering them."""
+    cutoff = time.time() - FULFILMENT_EMAIL_TIMEOUT
+    rows = _db().execute(
+        "SELECT id, payload, issued, updated_at FROM fulfilment_jobs "
+        "WHERE status = 'done' AND email_status = 'pending' AND updated_at < ?",
+        (cutoff,),
+    ).fetchall()
+    for row in rows:
+        db = _db()
+        with db:
+            # Take it over atomically, so only one process resends it
+            cur = db.execute(
+                "UPDATE fulfilment_jobs SET updated_at = ? WHERE id = ? AND email_status = 'pending' AND updated_at = ?",
+                (time.time(), row["id"], row["updated_at"]),
+            )
+        if cur.rowcount != 1:
+            continue
+        logger.warning(f"[Fulfilment] Resending confirmation for job {row['id']}")
+        await _send_confirmation(row["id"], json.loads(row["payload"]), json.loads(row["issued"]))
+
+
+async def _drain():
+    _requeue_expired()
+    try:
+        await _resend_lost_emails()
+    except Exception as e:
+        logger.error(f"[Fulfilment] Could not resend pending confirmations: {e}")
+    while not _stop.is_set():
+        claimed = next((job_id for job_id in _due_job_ids() if _claim(job_id)), None)
+        if claimed is None:
+            return
+        try:
+            await _run_claimed(claimed)
+        except Exception:
+            pass  # _run_claimed logged it and put the job back
+
+
+def _run():
+    # Each worker thread owns an event loop (and so its own async TT client)
+    loop = asyncio.new_event_loop()
+    try:
+        while not _stop.is_set():
+            try:
+                loop.run_until_complete(_drain())
+            except Exception as e:
+                logger.error(f"[Fulfilment] Worker loop failed: {e}")
+            _wake.wait(FULFILMENT_POLL_INTERVAL)
+            _wake.clear()
+        loop.run_until_complete(close_async_client())
+    finally:
+        loop.close()
+
+
+def _adopt_pending_orders():
+    """Gives pending orders that have no job (e.g. imported from JSON) a dead job to retry."""
+    db = _db()
+    with db:
+        for o in order_store.list_orders(status="pending", limit=-1):
+            payload = {k: o.get(k) for k in ("event_id", "buyer_name", "buyer_email", "phone", "items", "amount_total")}
+            db.execute(
+                "INSERT OR IGNORE INTO fulfilment_jobs "
+                "(id, stripe_session_id, payload, status, attempts, last_error, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'dead', ?, ?, ?, ?)",
+                (o["id"], o.get("stripe_session_id") or None, json.dumps(payload),
+                 FULFILMENT_MAX_ATTEMPTS, o.get("error"), o["created_at"], time.time()),
+            )
+
+
+def start_workers():
+    order_store.migrate_legacy_files()
+    _adopt_pending_orders()
+    # Jobs left running by a crashed process are picked up again once their lease runs out
+    _requeue_expired()
+
+    _stop.clear()
+    _workers[:] = [t for t in _workers if t.is_alive()]
+    for i in range(len(_workers), FULFILMENT_WORKERS):
+        worker = threading.Thread(target=_run, name=f"fulfilment-{i}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+
+
+def stop_workers():
+    _stop.set()
+    _wake.set()
+
+
+async def retry_job(job_id: str, priority: str = "checkout"):
+    """Runs a dead (or waiting) job immediately. Returns None if it is not retryable."""
+    if not _claim(job_id, from_statuses=("dead", "queued")):
+        return None
+    # A dead job stays dead if the retry fails, so it remains on the pending list
+    return await _run_claimed(job_id, priority)
+
+
+def retry_job_now(job_id: str, priority: str = "checkout"):
+    """
+    retry_job for callers outside the workers (the admin route). Runs it on a
+    loop of the calling thread, so the blocking store writes stay off the server's.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(retry_job(job_id, priority))
+    finally:
+        loop.run_until_complete(close_async_client())
+        loop.close()
+
+
+def get_job(job_id: str):
+    """{"status", "issued", "last_error"} of a job, or None."""
+    row = _db().execute("SELECT status, issued, last_error FROM fulfilment_jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    return {"status": row["status"], "issued": json.loads(row["issued"]), "last_error": row["last_error"]}
+
+
+def queue_status() -> dict:
+    db = _db()
+    counts = {r["status"]: r["n"] for r in db.execute(
+        "SELECT status, COUNT(*) AS n FROM fulfilment_jobs GROUP BY status"
+    )}
+    return {
+        "queued": counts.get("queued", 0),
+        "running": counts.get("running", 0),
+        "done": counts.get("done", 0),
+        "dead": counts.get("dead", 0),
+        "emails_pending": db.execute(
+            "SELECT COUNT(*) FROM fulfilment_jobs WHERE status = 'done' AND email_status = 'pending'"
+        ).fetchone()[0],
+        "workers": sum(1 for t in _workers if t.is_alive()),
+    }
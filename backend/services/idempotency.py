@@ -0,0 +1,167 @@
+"""
+Idempotency store for order creation.
+
+A key is claimed by inserting a "pending" row before any upstream work; the
+primary key makes the claim atomic, so a concurrent duplicate sees the pending
+row (409) and a later repeat gets the stored response without touching Ticket
+Tailor. A pending claim is a lease of IDEMPOTENCY_LEASE seconds, so a process
+that dies mid-request doesn't lock the key; stored responses expire after
+IDEMPOTENCY_TTL seconds. Each key stores a hash of the request body it was
+first used with; reusing the key for a different request is rejected (422)
+rather than answered with the first request's response.
+
+Stripe webhooks don't need a claim: fulfilment jobs are unique per checkout
+session, so a redelivered event maps onto the job it already created.
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from services.local_db import get_db, ensure_schema, ensure_columns
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+IDEMPOTENCY_LEASE = int(os.getenv("IDEMPOTENCY_LEASE", "300"))
+PURGE_INTERVAL = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    status_code INTEGER,
+    response TEXT,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    request_hash TEXT,
+    PRIMARY KEY (scope, key)
+);
+CREATE INDEX IF NOT EXISTS ix_idempotency_keys_expires ON idempotency_keys (expires_at);
+"""
+
+_last_purge = 0.0
+
+
+class IdempotencyInProgress(Exception):
+    pass
+
+
+class IdempotencyKeyReused(Exception):
+    pass
+
+
+def _db():
+    ensure_schema("idempotency_keys", _SCHEMA)
+    ensure_columns("idempotency_keys", {"request_hash": "TEXT"})
+    return get_db()
+
+
+def request_hash(request) -> str:
+    """Stable hash of a request body (a pydantic model or anything JSON-serialisable)."""
+    if hasattr(request, "model_dump"):
+        request = request.model_dump()
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def purge_expired() -> int:
+    global _last_purge
+    _last_purge = time.time()
+    db = _db()
+    with db:
+        return db.execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (_last_purge,)).rowcount
+
+
+def claim(scope: str, key: str, req_hash: str = None):
+    """
+    Claims `key` for the caller. Returns None when the caller should do the
+    work, or {"status_code", "response"} stored by an earlier request.
+    Raises IdempotencyInProgress while the first request is still running and
+    IdempotencyKeyReused when the key was first used for a different request.
+    """
+    now = time.time()
+    if now - _last_purge > PURGE_INTERVAL:
+        purge_expired()
+
+    db = _db()
+    try:
+        with db:
+            db.execute(
+                "INSERT INTO idempotency_keys (scope, key, created_at, expires_at, request_hash) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (scope, key, now, now + IDEMPOTENCY_LEASE, req_hash),
+            )
+        return None
+    except sqlite3.IntegrityError:
+        pass
+
+    row = db.execute(
+        "SELECT status, status_code, response, expires_at, request_hash FROM idempotency_keys "
+        "WHERE scope = ? AND key = ?",
+        (scope, key),
+    ).fetchone()
+    if row is None or row["expires_at"] < now:
+        # Expired, abandoned (lease ran out) or released in the meantime — start over
+        release(scope, key)
+        return claim(scope, key, req_hash)
+    if req_hash and row["request_hash"] and row["request_hash"] != req_hash:
+        raise IdempotencyKeyReused(key)
+    if row["status"] == "pending":
+        raise IdempotencyInProgress(key)
+    return {"status_code": row["status_code"], "response": json.loads(row["response"])}
+
+
+def complete(scope: str, key: str, response, status_code: int = 200):
+    db = _db()
+    with db:
+        db.execute(
+            "UPDATE idempotency_keys SET status = 'done', status_code = ?, response = ?, expires_at = ? "
+            "WHERE scope = ? AND key = ?",
+            (status_code, json.dumps(response), time.time() + IDEMPOTENCY_TTL, scope, key),
+        )
+
+
+def release(scope: str, key: str):
+    """Drops a claim so the same key can be retried (used when the work failed transiently)."""
+    db = _db()
+    with db:
+        db.execute("DELETE FROM idempotency_keys WHERE scope = ? AND key = ?", (scope, key))
+
+
+async def run_idempotent(scope: str, key, handler, request=None):
+    """
+    Runs `await handler()` at most once per (scope, key) and replays its
+    response for repeats of the same `request` body. Handlers return (not raise) once anything has been
+    issued — a partial order is a 207 — so a raised HTTPException means nothing
+    happened upstream and the key is released for a retry (a sold-out 409 must
+    not stick to the key). Without a key the handler simply runs.
+    """
+    if not key:
+        return await handler()
+    try:
+        stored = await run_in_threadpool(claim, scope, key, request_hash(request) if request is not None else None)
+    except IdempotencyInProgress:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still being processed.")
+    except IdempotencyKeyReused:
+        raise HTTPException(status_code=422, detail="This Idempotency-Key was already used for a different request.")
+    if stored is not None:
+        logger.info(f"[Idempotency] Replaying stored response for {scope}:{key}")
+        return JSONResponse(content=stored["response"], status_code=stored["status_code"])
+
+    try:
+        response = await handler()
+    except BaseException:
+        await run_in_threadpool(release, scope, key)
+        raise
+    if isinstance(response, JSONResponse):
+        await run_in_threadpool(complete, scope, key, json.loads(response.body), response.status_code)
+    else:
+        await run_in_threadpool(complete, scope, key, response)
+    return response
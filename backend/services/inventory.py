@@ -0,0 +1,364 @@
+"""
+Live per-event ticket inventory, kept in memory.
+
+An event's ticket types (and its series, for default ticket types and groups)
+are loaded from Ticket Tailor once; after that, quantities change locally:
+
+    take / restore   free orders claim their tickets atomically before issuing,
+                     and give back the ones that could not be issued
+    hold / unhold    paid checkouts set tickets aside while the buyer is on
+                     Stripe (see services/reservations.py)
+    record_issued    paid (webhook) and admin orders subtract what was issued
+
+so concurrent buyers see the same numbers and two requests can't both get the
+last ticket. What a buyer can get is the stock minus the tickets on hold; held
+counts are kept per ticket type apart from the loaded events, so they survive
+reloads and reconciles, and are resynced from the holds table (`set_held`) so
+holds opened or closed by other processes are counted too.
+
+A reconciler thread re-reads every loaded event from Ticket Tailor every
+INVENTORY_RECONCILE_INTERVAL seconds; tickets sold locally while that read was
+in flight are subtracted from the upstream figure. Events not read for
+INVENTORY_IDLE_TTL seconds are dropped, and our own writes to events or series
+(edits, new ticket types) drop everything so it is reloaded.
+
+Listeners registered with `add_listener` get (event_id, ticket_type_id,
+quantity) after every local change.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from services.ticket_tailor import fetch_from_tt, afetch_from_tt, add_write_listener
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_RECONCILE_INTERVAL = float(os.getenv("INVENTORY_RECONCILE_INTERVAL", "60"))
+INVENTORY_IDLE_TTL = float(os.getenv("INVENTORY_IDLE_TTL", "3600"))
+
+# Our own writes under these paths change ticket types — reload from upstream
+_RELOAD_WRITE_PREFIXES = ("/event_series", "/events")
+
+
+class SoldOut(Exception):
+    def __init__(self, ticket_type_id: str, name: str, left: int):
+        super().__init__(f"Only {left} left for {name}.")
+        self.ticket_type_id = ticket_type_id
+        self.left = left
+
+
+def issued_counts(results: list) -> Counter:
+    """{ticket_type_id: n} issued, from `issue_tickets` results."""
+    return Counter(r["item"]["ticket_type_id"] for r in results if r["ok"])
+
+
+class _EventInventory:
+    __slots__ = ("event", "series", "quantities", "names", "sold", "last_read")
+
+    def __init__(self, event: dict, series: dict):
+        self.event = event
+        self.series = series or {}
+        self.quantities = {}
+        self.names = {}
+        self.sold = Counter()   # tickets taken locally since load, for reconciling
+        self.last_read = time.monotonic()
+        self.set_upstream(event, self.series)
+
+    def set_upstream(self, event: dict, series: dict, sold_since: Counter = None):
+        # The occurrence's own ticket types win over the series defaults
+        quantities, names = {}, {}
+        for source in (event.get("ticket_types", []), series.get("default_ticket_types", [])):
+            for tt in source:
+                if tt["id"] not in quantities:
+                    quantities[tt["id"]] = (tt.get("quantity") or 0) - (sold_since or {}).get(tt["id"], 0)
+                    names[tt["id"]] = tt.get("name", "Unknown Ticket")
+        self.event, self.series = event, series
+        self.quantities = {tid: max(0, q) for tid, q in quantities.items()}
+        self.names = names
+
+    def left(self, ticket_type_id: str, held: dict) -> int:
+        return max(0, self.quantities[ticket_type_id] - held.get(ticket_type_id, 0))
+
+    def ticket_types(self, event_id: str, held: dict) -> dict:
+        """Same shape as GET /events/{id}/tickets, with live quantities."""
+        tickets = self.event.get("ticket_types", [])
+        groups = []
+        if not tickets:
+            # No explicit overrides on this occurrence — inherit the series inventory
+            tickets = self.series.get("default_ticket_types", [])
+            groups = self.series.get("default_ticket_groups", [])
+        # Drop tickets explicitly assigned to OTHER specific events
+        data = [
+            {**t, "quantity": self.left(t["id"], held) if t["id"] in self.quantities else t.get("quantity")}
+            for t in tickets
+            if not t.get("event_ids") or event_id in t.get("event_ids")
+        ]
+        return {"data": data, "groups": groups}
+
+
+class Inventory:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = {}
+        self._held = {}         # event_id -> Counter of tickets on hold per ticket type
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"loads": 0, "reads": 0, "taken": 0, "restored": 0, "held": 0, "sold_out": 0,
+                      "reconciles": 0, "corrections": 0, "last_reconcile_at": None}
+
+    # ── loading ─────────────────────────────────────────────────────────────
+    def _install(self, event_id: str, event: dict, series: dict) -> _EventInventory:
+        with self._lock:
+            self.stats["loads"] += 1
+            # Another caller may have loaded (and sold from) it meanwhile — keep theirs
+            return self._events.setdefault(event_id, _EventInventory(event, series))
+
+    def _get(self, event_id: str):
+        with self._lock:
+            inv = self._events.get(event_id)
+            if inv is not None:
+                inv.last_read = time.monotonic()
+                self.stats["reads"] += 1
+            return inv
+
+    def load(self, event_id: str) -> _EventInventory:
+        inv = self._get(event_id)
+        if inv is not None:
+            return inv
+        event = fetch_from_tt(f"/events/{event_id}")
+        series_id = event.get("event_series_id")
+        series = fetch_from_tt(f"/event_series/{series_id}") if series_id else {}
+        return self._install(event_id, event, series)
+
+    async def aload(self, event_id: str) -> _EventInventory:
+        inv = self._get(event_id)
+        if inv is not None:
+            return inv
+        event = await afetch_from_tt(f"/events/{event_id}")
+        series_id = event.get("event_series_id")
+        series = await afetch_from_tt(f"/event_series/{series_id}") if series_id else {}
+        return self._install(event_id, event, series)
+
+    # ── reads ───────────────────────────────────────────────────────────────
+    def ticket_types(self, event_id: str) -> dict:
+        inv = self.load(event_id)
+        with self._lock:
+            return inv.ticket_types(event_id, self._held.get(event_id, {}))
+
+    async def quantities(self, event_id: str) -> dict:
+        """ticket_type_id -> (quantity, name) for every ticket type the event can sell."""
+        inv = await self.aload(event_id)
+        with self._lock:
+            held = self._held.get(event_id, {})
+            return {tid: (inv.left(tid, held), inv.names[tid]) for tid in inv.quantities}
+
+    def available(self, event_id: str, ticket_type_id: str):
+        """Live quantity, or None when the event isn't loaded or the type is unknown."""
+        with self._lock:
+            inv = self._events.get(event_id)
+            if inv is None or ticket_type_id not in inv.quantities:
+                return None
+            return inv.left(ticket_type_id, self._held.get(event_id, {}))
+
+    def held(self, event_id: str, ticket_type_id: str) -> int:
+        with self._lock:
+            return self._held.get(event_id, {}).get(ticket_type_id, 0)
+
+    # ── local changes ───────────────────────────────────────────────────────
+    def add_listener(self, callback):
+        """Registers `callback(event_id, ticket_type_id, quantity)` for every local change."""
+        self._listeners.append(callback)
+
+    def _notify(self, event_id: str, changed: dict):
+        for tid, quantity in changed.items():
+            for callback in self._listeners:
+                try:
+                    callback(event_id, tid, quantity)
+                except Exception as e:
+                    logger.error(f"[Inventory] Listener failed for {event_id}/{tid}: {e}")
+
+    def _check(self, event_id: str, inv, counts: dict):
+        held = self._held.get(event_id, {})
+        for tid, n in counts.items():
+            if tid in inv.quantities and inv.left(tid, held) < n:
+                self.stats["sold_out"] += 1
+                raise SoldOut(tid, inv.names.get(tid, tid), inv.left(tid, held))
+
+    def _apply(self, event_id: str, counts: dict, sign: int, check: bool = False) -> dict:
+        changed = {}
+        with self._lock:
+            inv = self._events.get(event_id)
+            if inv is None:
+                return changed
+            if check:
+                self._check(event_id, inv, counts)
+            held = self._held.get(event_id, {})
+            for tid, n in counts.items():
+                if tid not in inv.quantities or n <= 0:
+                    continue
+                inv.quantities[tid] = max(0, inv.quantities[tid] - sign * n)
+                inv.sold[tid] += sign * n
+                changed[tid] = inv.left(tid, held)
+        return changed
+
+    def _apply_hold(self, event_id: str, counts: dict, sign: int, check: bool = False) -> dict:
+        changed = {}
+        with self._lock:
+            inv = self._events.get(event_id)
+            if check and inv is not None:
+                self._check(event_id, inv, counts)
+            held = self._held.setdefault(event_id, Counter())
+            for tid, n in counts.items():
+                if n <= 0:
+                    continue
+                held[tid] = max(0, held[tid] + sign * n)
+                if inv is not None and tid in inv.quantities:
+                    changed[tid] = inv.left(tid, held)
+            if not any(held.values()):
+                del self._held[event_id]
+        return changed
+
+    def take(self, event_id: str, counts: dict):
+        """
+        Atomically subtracts {ticket_type_id: n} from a loaded event, or raises
+        SoldOut without changing anything if any type has fewer than n left.
+        Types (or events) we have no figures for are let through.
+        """
+        changed = self._apply(event_id, counts, 1, check=True)
+        with self._lock:
+            self.stats["taken"] += sum(counts.values())
+        self._notify(event_id, changed)
+
+    def restore(self, event_id: str, counts: dict):
+        """Gives back tickets taken with `take` that were not issued after all."""
+        changed = self._apply(event_id, counts, -1)
+        with self._lock:
+            self.stats["restored"] += sum(counts.values())
+        self._notify(event_id, changed)
+
+    def hold(self, event_id: str, counts: dict, check: bool = True):
+        """
+        Sets {ticket_type_id: n} aside without selling it, or raises SoldOut if
+        fewer are left. Holds on events that aren't loaded are still counted.
+        """
+        changed = self._apply_hold(event_id, counts, 1, check=check)
+        with self._lock:
+            self.stats["held"] += sum(counts.values())
+        self._notify(event_id, changed)
+
+    def unhold(self, event_id: str, counts: dict):
+        self._notify(event_id, self._apply_hold(event_id, counts, -1))
+
+    def set_held(self, event_id: str, counts: dict):
+        """Replaces an event's held counts (the holds table is the source of truth)."""
+        changed = {}
+        with self._lock:
+            inv = self._events.get(event_id)
+            old = self._held.get(event_id, Counter())
+            new = Counter({tid: n for tid, n in counts.items() if n > 0})
+            if new:
+                self._held[event_id] = new
+            else:
+                self._held.pop(event_id, None)
+            if inv is not None:
+                for tid in set(old) | set(new):
+                    if old[tid] != new[tid] and tid in inv.quantities:
+                        changed[tid] = inv.left(tid, new)
+        self._notify(event_id, changed)
+
+    def held_events(self) -> list:
+        with self._lock:
+            return list(self._held)
+
+    def restore_failed(self, event_id: str, results: list):
+        """`restore` for the failed results of `issue_tickets`."""
+        failed = Counter(r["item"]["ticket_type_id"] for r in results if not r["ok"])
+        if failed:
+            self.restore(event_id, failed)
+
+    def record_issued(self, event_id: str, results: list):
+        """Subtracts tickets issued without a prior `take` (paid and admin orders)."""
+        counts = issued_counts(results)
+        if counts:
+            self._notify(event_id, self._apply(event_id, counts, 1))
+
+    # ── reconciling ─────────────────────────────────────────────────────────
+    def invalidate(self, event_id: str = None):
+        with self._lock:
+            if event_id is None:
+                self._events.clear()
+            else:
+                self._events.pop(event_id, None)
+
+    def reconcile(self):
+        """Re-reads every loaded event from Ticket Tailor and corrects local figures."""
+        now = time.monotonic()
+        with self._lock:
+            for event_id in [e for e, inv in self._events.items() if now - inv.last_read > INVENTORY_IDLE_TTL]:
+                del self._events[event_id]
+            loaded = {event_id: Counter(inv.sold) for event_id, inv in self._events.items()}
+
+        for event_id, sold_before in loaded.items():
+            try:
+                event = fetch_from_tt(f"/events/{event_id}", priority="background", cached=False)
+                series_id = event.get("event_series_id")
+                series = fetch_from_tt(
+                    f"/event_series/{series_id}", priority="background", cached=False
+                ) if series_id else {}
+            except Exception as e:
+                logger.warning(f"[Inventory] Could not reconcile {event_id}: {e}")
+                continue
+
+            with self._lock:
+                inv = self._events.get(event_id)
+                if inv is None:
+                    continue
+                held = self._held.get(event_id, {})
+                before = {tid: inv.left(tid, held) for tid in inv.quantities}
+                # Sales made while we were reading may not be in the upstream figures yet
+                inv.set_upstream(event, series, inv.sold - sold_before)
+                changed = {tid: inv.left(tid, held) for tid in inv.quantities}
+                changed = {tid: q for tid, q in changed.items() if before.get(tid) != q}
+                self.stats["corrections"] += len(changed)
+            if changed:
+                logger.info(f"[Inventory] Reconciled {event_id}: {changed}")
+                self._notify(event_id, changed)
+
+        with self._lock:
+            self.stats["reconciles"] += 1
+            self.stats["last_reconcile_at"] = time.time()
+
+    def _run(self):
+        while not self._stop.wait(INVENTORY_RECONCILE_INTERVAL):
+            try:
+                self.reconcile()
+            except Exception as e:
+                logger.error(f"[Inventory] Reconcile failed: {e}")
+
+    def start_reconciler(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="inventory-reconcile", daemon=True)
+            self._thread.start()
+
+    def stop_reconciler(self):
+        self._stop.set()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self.stats, "events": len(self._events),
+                    "on_hold": sum(sum(c.values()) for c in self._held.values())}
+
+
+inventory = Inventory()
+
+
+def _on_tt_write(endpoint: str):
+    if endpoint.startswith(_RELOAD_WRITE_PREFIXES):
+        inventory.invalidate()
+
+
+add_write_listener(_on_tt_write)
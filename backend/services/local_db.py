@@ -0,0 +1,60 @@
+"""
+Embedded SQLite database shared by the local stores (ticket mirror, queues, ...).
+
+Each thread gets its own connection to the same WAL-mode file, so readers never
+block the single writer. Modules register their tables with `ensure_schema`.
+"""
+
+import os
+import sqlite3
+import threading
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", os.path.join(DATA_DIR, "local.sqlite3"))
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_applied_schemas = set()
+
+
+def get_db() -> sqlite3.Connection:
+    """Returns this thread's connection to the local database."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(LOCAL_DB_PATH)), exist_ok=True)
+        conn = sqlite3.connect(LOCAL_DB_PATH, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        _local.conn = conn
+    return conn
+
+
+def ensure_schema(name: str, ddl: str):
+    """Runs a module's CREATE TABLE/INDEX IF NOT EXISTS script once per process."""
+    if name in _applied_schemas:
+        return
+    with _schema_lock:
+        if name not in _applied_schemas:
+            get_db().executescript(ddl)
+            _applied_schemas.add(name)
+
+
+def ensure_columns(table: str, columns: dict):
+    """
+    Adds columns ({name: "TYPE ..."}) that a table created by an older version
+    lacks. Call it right after the table's ensure_schema.
+    """
+    name = f"{table}:columns"
+    if name in _applied_schemas:
+        return
+    with _schema_lock:
+        if name not in _applied_schemas:
+            db = get_db()
+            existing = {r["name"] for r in db.execute(f"PRAGMA table_info({table})")}
+            with db:
+                for column, decl in columns.items():
+                    if column not in existing:
+                        db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+            _applied_schemas.add(name)
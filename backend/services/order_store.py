@@ -0,0 +1,198 @@
+"""
+Local order records (pending and historical) in the shared SQLite database.
+
+Replaces the JSON files under data/: every write is a single indexed row
+update inside a transaction instead of rewriting the whole file, and lookups
+by id, Stripe session, event or buyer use indexes. Record shape matches the
+old all_orders.json entries.
+
+Migrating existing JSON files (also done once automatically on startup):
+    python -m services.order_store import data/all_orders.json data/pending_orders.json
+"""
+
+import os
+import sys
+import json
+import uuid
+import logging
+from datetime import datetime, timezone
+from services.local_db import get_db, ensure_schema, DATA_DIR, LOCAL_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+LEGACY_FILES = [
+    os.path.join(DATA_DIR, "all_orders.json"),
+    os.path.join(DATA_DIR, "pending_orders.json"),
+    os.path.join(DATA_DIR, "pending_orders.json.imported"),
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    stripe_session_id TEXT,
+    event_id TEXT,
+    buyer_name TEXT,
+    buyer_email TEXT,
+    phone TEXT,
+    items TEXT NOT NULL DEFAULT '[]',
+    amount_total INTEGER NOT NULL DEFAULT 0,
+    tt_ticket_ids TEXT NOT NULL DEFAULT '[]',
+    source TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_orders_session ON orders (stripe_session_id);
+CREATE INDEX IF NOT EXISTS ix_orders_event ON orders (event_id, created_at);
+CREATE INDEX IF NOT EXISTS ix_orders_buyer ON orders (buyer_email COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS ix_orders_status ON orders (status, created_at);
+CREATE TABLE IF NOT EXISTS order_imports (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    imported INTEGER NOT NULL
+);
+"""
+
+_COLUMNS = (
+    "id", "stripe_session_id", "event_id", "buyer_name", "buyer_email", "phone", "items",
+    "amount_total", "tt_ticket_ids", "source", "status", "error", "created_at",
+)
+_JSON_COLUMNS = ("items", "tt_ticket_ids")
+
+
+def _db():
+    ensure_schema("orders", _SCHEMA)
+    return get_db()
+
+
+def _params(order: dict) -> tuple:
+    values = []
+    for col in _COLUMNS:
+        value = order.get(col)
+        if col in _JSON_COLUMNS:
+            value = json.dumps(value or [])
+        elif col == "amount_total":
+            value = value or 0
+        elif col == "created_at":
+            value = value or datetime.now(timezone.utc).isoformat()
+        values.append(value)
+    return tuple(values)
+
+
+def _to_dict(row) -> dict:
+    order = dict(row)
+    for col in _JSON_COLUMNS:
+        order[col] = json.loads(order[col])
+    return order
+
+
+def save_order(order: dict):
+    """Inserts or replaces an order record (needs at least id and status)."""
+    marks = ", ".join("?" for _ in _COLUMNS)
+    db = _db()
+    with db:
+        db.execute(f"INSERT OR REPLACE INTO orders ({', '.join(_COLUMNS)}) VALUES ({marks})", _params(order))
+
+
+def update_order(order_id: str, **fields):
+    for col in _JSON_COLUMNS:
+        if col in fields:
+            fields[col] = json.dumps(fields[col] or [])
+    sets = ", ".join(f"{k} = ?" for k in fields)
+    db = _db()
+    with db:
+        db.execute(f"UPDATE orders SET {sets} WHERE id = ?", (*fields.values(), order_id))
+
+
+def record_issuance(order: dict, results: list):
+    """
+    Stores a directly issued order (free / admin) from `issue_tickets` results.
+    Never raises — the tickets exist upstream whatever happens here.
+    """
+    failures = [r["error"] for r in results if not r["ok"]]
+    if len(failures) == len(results):
+        return
+    try:
+        save_order({
+            **order,
+            "id": order.get("id") or str(uuid.uuid4()),
+            "tt_ticket_ids": [r["ticket"].get("id") for r in results if r["ok"]],
+            "status": "partial" if failures else "confirmed",
+            "error": " | ".join(failures) or None,
+        })
+    except Exception as e:
+        logger.error(f"[OrderStore] Could not record order for {order.get('buyer_email')}: {e}")
+
+
+def get_order(order_id: str):
+    row = _db().execute("SELECT * FROM orders WHERE id = ?", (order_id,)).fetchone()
+    return _to_dict(row) if row else None
+
+
+def find_by_session(stripe_session_id: str):
+    row = _db().execute("SELECT * FROM orders WHERE stripe_session_id = ?", (stripe_session_id,)).fetchone()
+    return _to_dict(row) if row else None
+
+
+def list_orders(status: str = None, event_id: str = None, buyer_email: str = None, limit: int = 500) -> list:
+    """Oldest first, optionally filtered by status / event / buyer."""
+    where, params = [], []
+    if status:
+        where.append("status = ?")
+        params.append(status)
+    if event_id:
+        where.append("event_id = ?")
+        params.append(event_id)
+    if buyer_email:
+        where.append("buyer_email = ? COLLATE NOCASE")
+        params.append(buyer_email)
+    sql = "SELECT * FROM orders"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at LIMIT ?"
+    return [_to_dict(r) for r in _db().execute(sql, (*params, limit))]
+
+
+def import_json(path: str) -> int:
+    """Imports a JSON list of order records. Existing ids are left untouched."""
+    with open(path, "r") as f:
+        orders = json.load(f)
+    marks = ", ".join("?" for _ in _COLUMNS)
+    db = _db()
+    with db:
+        cur = db.executemany(
+            f"INSERT OR IGNORE INTO orders ({', '.join(_COLUMNS)}) VALUES ({marks})",
+            [_params(o) for o in orders if o.get("id")],
+        )
+    logger.info(f"[OrderStore] Imported {cur.rowcount} of {len(orders)} orders from {path}")
+    return cur.rowcount
+
+
+def migrate_legacy_files():
+    """Imports the data/*.json order files once (again only if a file changes)."""
+    db = _db()
+    for path in LEGACY_FILES:
+        if not os.path.exists(path):
+            continue
+        mtime = os.path.getmtime(path)
+        done = db.execute("SELECT mtime FROM order_imports WHERE path = ?", (path,)).fetchone()
+        if done and done["mtime"] == mtime:
+            continue
+        try:
+            imported = import_json(path)
+        except Exception as e:
+            logger.error(f"[OrderStore] Could not import {path}: {e}")
+            continue
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO order_imports (path, mtime, imported) VALUES (?, ?, ?)",
+                (path, mtime, imported),
+            )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 3 or sys.argv[1] != "import":
+        sys.exit("usage: python -m services.order_store import FILE.json [FILE.json ...]")
+    total = sum(import_json(path) for path in sys.argv[2:])
+    print(f"Imported {total} orders into {os.path.abspath(LOCAL_DB_PATH)}")
@@ -0,0 +1,131 @@
+"""
+Materialized public catalog behind GET /events/public.
+
+The joined series + occurrence list is built once and kept in memory as a
+pre-serialized JSON body with an ETag. It is rebuilt in the background once it
+is older than PUBLIC_CATALOG_TTL, or after one of our own writes touches events
+or series; requests keep getting the previous body meanwhile, so a Ticket
+Tailor outage never holds up the storefront. A failed rebuild is not retried
+for PUBLIC_CATALOG_RETRY_BACKOFF seconds. Ticket sales don't mark it dirty: during an
+on-sale burst that would rebuild it on nearly every request. The ticket type
+quantities it carries are only refreshed by the TTL; live stock comes from
+/events/{id}/tickets.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from services.ticket_tailor import gather_from_tt, add_write_listener
+
+logger = logging.getLogger(__name__)
+
+PUBLIC_CATALOG_TTL = int(os.getenv("PUBLIC_CATALOG_TTL", "60"))
+PUBLIC_CATALOG_RETRY_BACKOFF = float(os.getenv("PUBLIC_CATALOG_RETRY_BACKOFF", "15"))
+
+# Writes under these paths change what the storefront shows
+_CATALOG_WRITE_PREFIXES = ("/event_series", "/events")
+
+
+def build_public_catalog(all_series: list, all_events: list) -> list:
+    """Enriches each occurrence of a published series with its parent series data."""
+    # Build a lookup map: series_id -> series data
+    series_map = {s["id"]: s for s in all_series}
+
+    enriched = []
+    for event in all_events:
+        series_id = event.get("event_series_id")
+        series = series_map.get(series_id, {})
+
+        # Only include published series
+        if series.get("status") not in ("published",):
+            continue
+
+        enriched.append({
+            # Core occurrence fields
+            "id": event.get("id"),
+            "event_series_id": series_id,
+            "start": event.get("start"),
+            "end": event.get("end"),
+            "status": event.get("status", series.get("status", "unknown")),
+            # Inherited from series
+            "name": series.get("name", event.get("name", "Untitled Event")),
+            "description": series.get("description", ""),
+            "images": series.get("images", {}),
+            "venue": series.get("venue", {}),
+            "online_event": series.get("online_event", "false"),
+            "checkout_url": event.get("checkout_url") or series.get("checkout_url", ""),
+            "ticket_types": event.get("ticket_types") or series.get("default_ticket_types", []),
+        })
+
+    # Sort by start date ascending
+    enriched.sort(key=lambda e: (e.get("start") or {}).get("iso", ""))
+    return enriched
+
+
+class PublicCatalog:
+    def __init__(self, ttl: int = PUBLIC_CATALOG_TTL):
+        self.ttl = ttl
+        self.body = None
+        self.etag = None
+        self.built_at = 0.0
+        self.dirty = False
+        self._retry_at = 0.0
+        self._lock = None
+        self._refresh_task = None
+
+    async def _build(self):
+        # Clear before reading so a write during the build marks it dirty again
+        self.dirty = False
+        try:
+            series_resp, events_resp = await gather_from_tt("/event_series", "/events")
+        except Exception:
+            self.dirty = True
+            self._retry_at = time.monotonic() + PUBLIC_CATALOG_RETRY_BACKOFF
+            raise
+        data = build_public_catalog(series_resp.get("data", []), events_resp.get("data", []))
+        body = json.dumps({"data": data}, separators=(",", ":")).encode()
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.built_at = time.monotonic()
+        logger.info(f"[Catalog] Rebuilt public catalog: {len(data)} events")
+
+    async def _rebuild_locked(self, only_if_needed: bool = False):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Requests that queued behind a rebuild reuse its result
+            if only_if_needed and self.body is not None and not self.dirty:
+                return
+            await self._build()
+
+    async def _refresh_in_background(self):
+        try:
+            await self._rebuild_locked()
+        except Exception as e:
+            logger.warning(f"[Catalog] Background refresh failed, serving the previous catalog: {e}")
+
+    async def get(self):
+        """
+        Returns (body, etag), building or refreshing the catalog as needed. If a
+        rebuild fails the previous body and ETag are served until one succeeds;
+        only a catalog that was never built raises.
+        """
+        if self.body is None:
+            await self._rebuild_locked(only_if_needed=True)
+            return self.body, self.etag
+        now = time.monotonic()
+        stale = self.dirty or now - self.built_at > self.ttl
+        if stale and now >= self._retry_at and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_in_background())
+        return self.body, self.etag
+
+    def invalidate(self, endpoint: str = ""):
+        if not endpoint or endpoint.startswith(_CATALOG_WRITE_PREFIXES):
+            self.dirty = True
+
+
+public_catalog = PublicCatalog()
+add_write_listener(public_catalog.invalidate)
@@ -0,0 +1,256 @@
+"""
+Inventory holds for paid Stripe checkouts.
+
+create_checkout_session puts the tickets on hold before it creates the Stripe
+session, so buyers still on the Stripe page can't be outsold by the ones who
+arrive after them. A hold is
+
+    active    the buyer is on Stripe; expires with the session (HOLD_TTL)
+    paid      checkout completed; kept until the fulfilment job has issued
+              the tickets (`settle`), or released if the job goes dead
+    released / expired / settled   no longer counted
+
+Holds are stored in SQLite so a restart doesn't forget them, and mirrored into
+the held counters of services/inventory.py, where every availability check is
+O(1) per ticket type. Server processes share the table, and a hold may be
+settled or released by a process other than the one that created it, so the
+counters are resynced from the table every HOLD_SYNC_INTERVAL seconds and for
+the event being checked before each new hold. A sweeper thread expires active
+holds HOLD_GRACE seconds after their session expired; the
+checkout.session.expired webhook and the cancel page release them sooner.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import Counter
+from services.local_db import get_db, ensure_schema
+from services.inventory import inventory
+
+logger = logging.getLogger(__name__)
+
+# Stripe won't expire a checkout session sooner than 30 minutes after creation
+HOLD_TTL = max(1800, int(os.getenv("HOLD_TTL", "1800")))
+HOLD_GRACE = float(os.getenv("HOLD_GRACE", "120"))
+HOLD_SWEEP_INTERVAL = float(os.getenv("HOLD_SWEEP_INTERVAL", "30"))
+HOLD_SYNC_INTERVAL = float(os.getenv("HOLD_SYNC_INTERVAL", "5"))
+# Closed holds are kept this long for inspection, then deleted
+HOLD_RETENTION = 7 * 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inventory_holds (
+    id TEXT PRIMARY KEY,
+    event_id TEXT NOT NULL,
+    items TEXT NOT NULL,
+    stripe_session_id TEXT,
+    status TEXT NOT NULL DEFAULT 'active',
+    expires_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    closed_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_inventory_holds_status ON inventory_holds (status, expires_at);
+CREATE INDEX IF NOT EXISTS ix_inventory_holds_session ON inventory_holds (stripe_session_id);
+CREATE INDEX IF NOT EXISTS ix_inventory_holds_event ON inventory_holds (event_id, status);
+"""
+
+_OPEN = ("active", "paid")
+
+_sweeper = None
+_stop = threading.Event()
+# Serialises read-modify-write of a hold's items (settle) against release,
+# and new holds against resyncing the held counters
+_lock = threading.Lock()
+
+
+def _db():
+    ensure_schema("inventory_holds", _SCHEMA)
+    return get_db()
+
+
+def create_hold(event_id: str, counts: dict) -> dict:
+    """
+    Holds {ticket_type_id: n} for one checkout and returns {"id", "expires_at"}.
+    Raises inventory.SoldOut if the tickets aren't there.
+    """
+    counts = {tid: n for tid, n in counts.items() if n > 0}
+    try:
+        inventory.load(event_id)
+    except Exception as e:
+        # Can't check stock right now — still count the hold once we can
+        logger.warning(f"[Holds] Could not load inventory for {event_id}: {e}")
+
+    now = time.time()
+    # A minute of slack so Stripe still sees at least HOLD_TTL when the session is created
+    hold = {"id": str(uuid.uuid4()), "expires_at": int(now + HOLD_TTL + 60)}
+    with _lock:
+        # Check against every process's holds, not just the ones we saw
+        _sync_held_locked([event_id])
+        inventory.hold(event_id, counts)
+        try:
+            db = _db()
+            with db:
+                db.execute(
+                    "INSERT INTO inventory_holds (id, event_id, items, expires_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (hold["id"], event_id, json.dumps(counts), hold["expires_at"], now),
+                )
+        except Exception:
+            inventory.unhold(event_id, counts)
+            raise
+    return hold
+
+
+def get_hold(hold_id: str):
+    row = _db().execute("SELECT * FROM inventory_holds WHERE id = ?", (hold_id,)).fetchone()
+    if row is None:
+        return None
+    return {**dict(row), "items": json.loads(row["items"])}
+
+
+def attach_session(hold_id: str, stripe_session_id: str):
+    db = _db()
+    with db:
+        db.execute("UPDATE inventory_holds SET stripe_session_id = ? WHERE id = ?", (stripe_session_id, hold_id))
+
+
+def mark_paid(hold_id: str) -> bool:
+    """Checkout completed: keep the hold past expiry until the tickets are issued."""
+    if not hold_id:
+        return False
+    db = _db()
+    with db:
+        cur = db.execute("UPDATE inventory_holds SET status = 'paid' WHERE id = ? AND status = 'active'", (hold_id,))
+    return cur.rowcount == 1
+
+
+def release(hold_id: str, status: str = "released", from_statuses: tuple = _OPEN) -> bool:
+    """
+    Gives the held tickets back. False if the hold was already closed, is not
+    in one of `from_statuses`, or is unknown.
+    """
+    if not hold_id:
+        return False
+    with _lock:
+        db = _db()
+        row = db.execute("SELECT event_id, items FROM inventory_holds WHERE id = ?", (hold_id,)).fetchone()
+        if row is None:
+            return False
+        marks = ", ".join("?" for _ in from_statuses)
+        with db:
+            cur = db.execute(
+                f"UPDATE inventory_holds SET status = ?, closed_at = ? WHERE id = ? AND status IN ({marks})",
+                (status, time.time(), hold_id, *from_statuses),
+            )
+        if cur.rowcount != 1:
+            return False
+        inventory.unhold(row["event_id"], json.loads(row["items"]))
+    logger.info(f"[Holds] Hold {hold_id} {status}")
+    return True
+
+
+def release_session(stripe_session_id: str, status: str = "released") -> bool:
+    row = _db().execute(
+        "SELECT id FROM inventory_holds WHERE stripe_session_id = ?", (stripe_session_id,)
+    ).fetchone()
+    return release(row["id"], status) if row else False
+
+
+def settle(hold_id: str, issued: dict):
+    """Drops {ticket_type_id: n} just issued from the hold; closes it once nothing is left."""
+    if not hold_id or not issued:
+        return
+    with _lock:
+        db = _db()
+        row = db.execute(
+            "SELECT event_id, items, status FROM inventory_holds WHERE id = ?", (hold_id,)
+        ).fetchone()
+        if row is None or row["status"] not in _OPEN:
+            return
+        items = json.loads(row["items"])
+        settled = {tid: min(n, items.get(tid, 0)) for tid, n in issued.items()}
+        remaining = {tid: n - settled.get(tid, 0) for tid, n in items.items() if n - settled.get(tid, 0) > 0}
+        with db:
+            if remaining:
+                db.execute("UPDATE inventory_holds SET items = ? WHERE id = ?", (json.dumps(remaining), hold_id))
+            else:
+                db.execute(
+                    "UPDATE inventory_holds SET items = '{}', status = 'settled', closed_at = ? WHERE id = ?",
+                    (time.time(), hold_id),
+                )
+        inventory.unhold(row["event_id"], settled)
+
+
+def sweep() -> int:
+    """Expires active holds whose Stripe session has expired."""
+    now = time.time()
+    db = _db()
+    rows = db.execute(
+        "SELECT id FROM inventory_holds WHERE status = 'active' AND expires_at < ?", (now - HOLD_GRACE,)
+    ).fetchall()
+    expired = sum(1 for r in rows if release(r["id"], "expired"))
+    with db:
+        db.execute("DELETE FROM inventory_holds WHERE closed_at < ?", (now - HOLD_RETENTION,))
+    return expired
+
+
+def _sync_held_locked(event_ids=None):
+    db = _db()
+    if event_ids is None:
+        rows = db.execute("SELECT event_id, items FROM inventory_holds WHERE status IN ('active', 'paid')")
+        event_ids = set(inventory.held_events())
+    else:
+        marks = ", ".join("?" for _ in event_ids)
+        rows = db.execute(
+            f"SELECT event_id, items FROM inventory_holds WHERE status IN ('active', 'paid') AND event_id IN ({marks})",
+            tuple(event_ids),
+        )
+        event_ids = set(event_ids)
+    held = {}
+    for row in rows:
+        counts = held.setdefault(row["event_id"], Counter())
+        counts.update(json.loads(row["items"]))
+    for event_id in event_ids | set(held):
+        inventory.set_held(event_id, held.get(event_id, {}))
+
+
+def sync_held(event_ids=None):
+    """Sets the in-memory held counters (of `event_ids`, or all) to the open holds in the table."""
+    with _lock:
+        _sync_held_locked(event_ids)
+
+
+def _run():
+    last_sweep = time.monotonic()
+    while not _stop.wait(HOLD_SYNC_INTERVAL):
+        try:
+            if time.monotonic() - last_sweep >= HOLD_SWEEP_INTERVAL:
+                last_sweep = time.monotonic()
+                expired = sweep()
+                if expired:
+                    logger.info(f"[Holds] Expired {expired} holds")
+            sync_held()
+        except Exception as e:
+            logger.error(f"[Holds] Sweep failed: {e}")
+
+
+def start_sweeper():
+    global _sweeper
+    if _sweeper is None or not _sweeper.is_alive():
+        sync_held()
+        _stop.clear()
+        _sweeper = threading.Thread(target=_run, name="hold-sweeper", daemon=True)
+        _sweeper.start()
+
+
+def stop_sweeper():
+    _stop.set()
+
+
+def hold_status() -> dict:
+    counts = {r["status"]: r["n"] for r in _db().execute(
+        "SELECT status, COUNT(*) AS n FROM inventory_holds GROUP BY status"
+    )}
+    return {**counts, "sweeper_running": _sweeper is not None and _sweeper.is_alive()}
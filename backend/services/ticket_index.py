@@ -0,0 +1,233 @@
+"""
+In-memory barcode / ticket-id index for the check-in scanner.
+
+Each record is the issued ticket as the scanner shows it, with name and email
+already unmasked, so a scan resolves with two dict lookups. Events are preloaded
+before doors open (`preload_event`), issuance and check-ins keep records
+current, and misses fall back to the SQLite ticket mirror before Ticket Tailor.
+
+Identity never changes, but status and checked_in can (voids, check-ins at
+another door or process). Those are kept current by the check-in write path
+and the mirror reconciler; on top of that `lookup_current` re-reads a record
+from Ticket Tailor in the background once it is older than TICKET_STATUS_TTL
+seconds. Scans are always answered from the local record, so they never wait on
+Ticket Tailor and keep working offline.
+
+The index is an LRU capped at TICKET_INDEX_MAX_TICKETS records: tickets of past
+events age out as current ones are scanned, and an evicted ticket is still
+found through the mirror.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from fastapi.concurrency import run_in_threadpool
+from services.ticket_tailor import afetch_from_tt
+from services import ticket_mirror
+
+logger = logging.getLogger(__name__)
+
+PRELOAD_PAGE_SIZE = 100
+PRELOAD_ORDER_CONCURRENCY = 10
+TICKET_STATUS_TTL = float(os.getenv("TICKET_STATUS_TTL", "15"))
+TICKET_INDEX_MAX_TICKETS = int(os.getenv("TICKET_INDEX_MAX_TICKETS", "200000"))
+
+
+def needs_order_lookup(ticket: dict) -> bool:
+    """True when a (reference-resolved) ticket still has masked PII and a parent order."""
+    return bool(ticket.get("order_id")) and (
+        "****" in str(ticket.get("full_name", "")) or "****" in str(ticket.get("email", ""))
+    )
+
+
+def resolve_attendee(ticket: dict, buyer_name: str = None, buyer_email: str = None, placeholders: bool = True) -> dict:
+    """
+    Returns the ticket with displayable full_name/email: the "Name|Email"
+    reference wins, then the parent order's buyer details, then placeholders.
+    """
+    ticket = dict(ticket)
+    ref = ticket.get("reference")
+    if ref and "|" in ref:
+        ref_name, ref_email = ref.split("|", 1)
+        if ref_name:
+            ticket["full_name"] = ref_name
+        if ref_email:
+            ticket["email"] = ref_email
+    if not placeholders:
+        return ticket
+
+    current_name = ticket.get("full_name")
+    if not current_name or current_name == "****" or "Guest" in str(current_name):
+        if buyer_name and "****" not in str(buyer_name):
+            ticket["full_name"] = buyer_name
+        elif not current_name or current_name == "****":
+            ticket["full_name"] = "Guest Attendee"
+
+    current_email = ticket.get("email")
+    if not current_email or current_email == "****" or "No Email" in str(current_email):
+        if buyer_email and "****" not in str(buyer_email):
+            ticket["email"] = buyer_email
+        elif not current_email or current_email == "****":
+            ticket["email"] = "No Email Provided"
+    return ticket
+
+
+class TicketIndex:
+    def __init__(self, max_tickets: int = TICKET_INDEX_MAX_TICKETS):
+        self.max_tickets = max_tickets
+        self._lock = threading.Lock()
+        self._by_id: "OrderedDict[str, dict]" = OrderedDict()
+        self._by_barcode = {}
+        self._events = {}  # event_id -> {"tickets": int, "loaded_at": float}
+        self._verified_at = {}  # ticket_id -> monotonic time status was last read upstream
+        self._revalidating = {}  # ticket_id -> background task re-reading it
+        self.stats = {"hits": 0, "mirror_hits": 0, "misses": 0, "revalidations": 0, "revalidation_errors": 0,
+                      "evictions": 0}
+
+    def _put(self, record: dict, fresh: bool = True):
+        ticket_id = record.get("id")
+        if not ticket_id:
+            return
+        self._by_id[ticket_id] = record
+        if fresh:
+            self._verified_at[ticket_id] = time.monotonic()
+        else:
+            self._verified_at.pop(ticket_id, None)
+        self._by_id.move_to_end(ticket_id)
+        barcode = record.get("barcode")
+        if barcode:
+            self._by_barcode[barcode] = record
+        while len(self._by_id) > self.max_tickets:
+            self._evict(next(iter(self._by_id)))
+
+    def _evict(self, ticket_id: str):
+        record = self._by_id.pop(ticket_id)
+        barcode = record.get("barcode")
+        if barcode and self._by_barcode.get(barcode) is record:
+            del self._by_barcode[barcode]
+        self._verified_at.pop(ticket_id, None)
+        self.stats["evictions"] += 1
+
+    def add_tickets(self, tickets: list):
+        """Indexes freshly issued or fetched tickets (raw TT objects or resolved records)."""
+        records = [resolve_attendee(t) for t in tickets if t.get("id")]
+        with self._lock:
+            for record in records:
+                self._put(record)
+
+    def lookup(self, key: str):
+        """Resolves a ticket id (it_...) or barcode. Returns a copy of the record or None."""
+        with self._lock:
+            record = self._by_id.get(key) or self._by_barcode.get(key)
+            if record is not None:
+                self._by_id.move_to_end(record["id"])
+                self.stats["hits"] += 1
+                return dict(record)
+
+        ticket = ticket_mirror.find_ticket(key)
+        if ticket is not None and not needs_order_lookup(resolve_attendee(ticket, placeholders=False)):
+            record = resolve_attendee(ticket)
+            with self._lock:
+                # The mirror may lag behind upstream — revalidate before trusting its status
+                self._put(record, fresh=False)
+                self.stats["mirror_hits"] += 1
+            return dict(record)
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    async def lookup_current(self, key: str):
+        """
+        `lookup`, answered from the local record. When its status is stale it
+        is re-read upstream in the background (once per ticket at a time).
+        """
+        record = await run_in_threadpool(self.lookup, key)
+        if record is None:
+            return None
+        ticket_id = record["id"]
+        with self._lock:
+            verified_at = self._verified_at.get(ticket_id)
+            stale = verified_at is None or time.monotonic() - verified_at >= TICKET_STATUS_TTL
+            if stale and ticket_id not in self._revalidating:
+                task = asyncio.get_running_loop().create_task(self._revalidate(ticket_id))
+                self._revalidating[ticket_id] = task
+                task.add_done_callback(lambda _: self._revalidating.pop(ticket_id, None))
+        return record
+
+    async def _revalidate(self, ticket_id: str):
+        try:
+            ticket = await afetch_from_tt(f"/issued_tickets/{ticket_id}", priority="background", cached=False)
+        except Exception as e:
+            with self._lock:
+                self.stats["revalidation_errors"] += 1
+            logger.warning(f"[Index] Could not revalidate {ticket_id}: {e}")
+            return
+
+        current = {"status": ticket.get("status"), "checked_in": ticket.get("checked_in")}
+        with self._lock:
+            stored = self._by_id.get(ticket_id)
+            if stored is not None:
+                stored.update(current)
+            self._verified_at[ticket_id] = time.monotonic()
+            self.stats["revalidations"] += 1
+        await run_in_threadpool(ticket_mirror.record_tickets, [ticket])
+
+    def mark_checked_in(self, ticket_id: str, checked_in: bool = True):
+        with self._lock:
+            record = self._by_id.get(ticket_id)
+            if record is not None:
+                record["checked_in"] = "true" if checked_in else "false"
+            if not checked_in:
+                # Undoing a local flag — let the next lookup ask upstream
+                self._verified_at.pop(ticket_id, None)
+
+    async def preload_event(self, event_id: str) -> int:
+        """
+        Loads every issued ticket of an event, resolving masked buyers through
+        their parent orders up front so scans never need a round trip.
+        """
+        tickets = []
+        params = {"event_id": event_id, "limit": PRELOAD_PAGE_SIZE}
+        while True:
+            data = await afetch_from_tt("/issued_tickets", params=params, priority="background")
+            page = data.get("data") or []
+            tickets.extend(page)
+            links = data.get("links") or {}
+            if not links.get("next") or not page or not page[-1].get("id"):
+                break
+            params["starting_after"] = page[-1]["id"]
+
+        await run_in_threadpool(ticket_mirror.record_tickets, tickets)
+
+        semaphore = asyncio.Semaphore(PRELOAD_ORDER_CONCURRENCY)
+
+        async def _resolve(ticket):
+            buyer_name = buyer_email = None
+            if needs_order_lookup(resolve_attendee(ticket, placeholders=False)):
+                order_id = ticket["order_id"]
+                try:
+                    async with semaphore:
+                        order = await afetch_from_tt(f"/orders/{order_id}", priority="background")
+                    buyer_name, buyer_email = order.get("buyer_name"), order.get("buyer_email")
+                except Exception as e:
+                    logger.warning(f"[Index] Could not resolve order {order_id}: {e}")
+            return resolve_attendee(ticket, buyer_name, buyer_email)
+
+        records = await asyncio.gather(*(_resolve(t) for t in tickets))
+        with self._lock:
+            for record in records:
+                self._put(record)
+            self._events[event_id] = {"tickets": len(records), "loaded_at": time.time()}
+        logger.info(f"[Index] Preloaded {len(records)} tickets for event {event_id}")
+        return len(records)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self.stats, "tickets": len(self._by_id), "events": dict(self._events)}
+
+
+ticket_index = TicketIndex()
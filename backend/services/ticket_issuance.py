@@ -0,0 +1,106 @@
+"""
+Ticket issuance engine shared by every checkout path.
+
+Ticket Tailor issues one ticket per POST /issued_tickets, so an order of N
+tickets is N calls. `issue_tickets` runs them concurrently (at most
+TT_ISSUE_CONCURRENCY in flight, at checkout priority in the rate governor, which
+also handles 429s) and returns one result per requested ticket in request order
+so partial failures can be reported — and retried — per ticket. Callers that
+must survive a crash mid-order pass `on_result` to record each ticket as soon as
+it is issued. Issued tickets are written to the local mirror and scanner index.
+"""
+
+import os
+import asyncio
+import logging
+from fastapi.concurrency import run_in_threadpool
+from services.ticket_tailor import apost_to_tt
+from services import ticket_mirror
+from services.ticket_index import ticket_index
+
+logger = logging.getLogger(__name__)
+
+TT_ISSUE_CONCURRENCY = int(os.getenv("TT_ISSUE_CONCURRENCY", "4"))
+
+
+def expand_items(items: list, base_payload: dict) -> list:
+    """
+    Turns [{ticket_type_id, quantity, ...}] into one issue payload per ticket.
+    Each entry is {"payload": ..., "item": <source item>}.
+    """
+    jobs = []
+    for item in items:
+        quantity = item.get("quantity", 1)
+        if quantity <= 0:
+            continue
+        payload = {**base_payload, "ticket_type_id": item.get("ticket_type_id")}
+        for _ in range(quantity):
+            jobs.append({"payload": payload, "item": item})
+    return jobs
+
+
+async def _issue_one(index: int, job: dict, semaphore: asyncio.Semaphore, priority: str, on_result) -> dict:
+    async with semaphore:
+        try:
+            ticket = await apost_to_tt("/issued_tickets", job["payload"], priority=priority)
+        except Exception as e:
+            logger.error(f"[Issuance] ❌ Failed to create ticket {job['item'].get('ticket_type_id')}: {e}")
+            result = {"index": index, "item": job["item"], "ok": False, "ticket": None, "error": str(e)}
+        else:
+            result = {"index": index, "item": job["item"], "ok": True, "ticket": ticket, "error": None}
+    if on_result is not None:
+        try:
+            on_result(result)
+        except Exception as e:
+            logger.error(f"[Issuance] on_result failed for ticket {index}: {e}")
+    return result
+
+
+async def issue_tickets(jobs: list, concurrency: int = TT_ISSUE_CONCURRENCY, priority: str = "checkout",
+                        on_result=None) -> list:
+    """
+    Issues every job from `expand_items`. Returns, in job order:
+      {"index", "item", "ok", "ticket", "error"}
+    `on_result(result)` is called with each result as soon as its call finishes.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results = await asyncio.gather(
+        *(_issue_one(index, job, semaphore, priority, on_result) for index, job in enumerate(jobs))
+    )
+
+    issued = [r["ticket"] for r in results if r["ok"]]
+    await run_in_threadpool(_record_issued, issued)
+    return list(results)
+
+
+def _record_issued(tickets: list):
+    ticket_mirror.record_tickets(tickets)
+    ticket_index.add_tickets(tickets)
+
+
+def ticket_results(results: list) -> list:
+    """Per-ticket outcome for API responses: [{ticket_type_id, ok, ticket, error}]."""
+    return [
+        {"ticket_type_id": r["item"].get("ticket_type_id"), "ok": r["ok"], "ticket": r["ticket"], "error": r["error"]}
+        for r in results
+    ]
+
+
+def _collapse(items) -> list:
+    remaining = {}
+    for item in items:
+        tid = item.get("ticket_type_id")
+        if tid not in remaining:
+            remaining[tid] = {**item, "quantity": 0}
+        remaining[tid]["quantity"] += 1
+    return list(remaining.values())
+
+
+def unissued_items(jobs: list, issued_indexes) -> list:
+    """Collapses the jobs not yet issued back into [{ticket_type_id, quantity, ...}]."""
+    return _collapse(job["item"] for index, job in enumerate(jobs) if index not in issued_indexes)
+
+
+def failed_items(results: list) -> list:
+    """Collapses failed results back into [{ticket_type_id, quantity, ...}] for a retry."""
+    return _collapse(r["item"] for r in results if not r["ok"])
@@ -0,0 +1,391 @@
+"""
+Local mirror of Ticket Tailor issued tickets.
+
+Admin order views read from this SQLite table instead of paging through every
+/issued_tickets page. The mirror is kept current two ways:
+  - tickets we issue ourselves are written straight in (`record_tickets`)
+  - `sync()` pulls anything newer than the last synced `created_at` watermark,
+    paging with `starting_after` (the first sync is a full backfill)
+  - a reconciler thread re-reads every ticket (`sync(full=True)`) every
+    TT_MIRROR_RECONCILE_INTERVAL seconds, since the incremental sync only sees
+    new tickets: check-ins made elsewhere, voids and other status changes on
+    existing tickets only reach the mirror this way
+
+Orders are reconstructed by grouping tickets on (email, event_id). Those groups
+are kept pre-aggregated in `ticket_orders`, updated whenever their tickets
+change, so the admin list can be filtered and keyset-paginated off an index.
+"""
+
+import os
+import json
+import base64
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from fastapi.concurrency import run_in_threadpool
+from services.local_db import get_db, ensure_schema
+from services.ticket_tailor import afetch_from_tt, close_async_client
+
+logger = logging.getLogger(__name__)
+
+TT_MIRROR_SYNC_INTERVAL = int(os.getenv("TT_MIRROR_SYNC_INTERVAL", "30"))
+TT_MIRROR_RECONCILE_INTERVAL = int(os.getenv("TT_MIRROR_RECONCILE_INTERVAL", "900"))
+TT_MIRROR_PAGE_SIZE = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS issued_tickets (
+    id TEXT PRIMARY KEY,
+    event_id TEXT,
+    email TEXT,
+    buyer_name TEXT,
+    buyer_email TEXT,
+    barcode TEXT,
+    checked_in TEXT,
+    status TEXT,
+    listed_price INTEGER,
+    created_at INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_issued_tickets_group ON issued_tickets (email, event_id, created_at);
+CREATE INDEX IF NOT EXISTS ix_issued_tickets_event ON issued_tickets (event_id, created_at);
+CREATE INDEX IF NOT EXISTS ix_issued_tickets_created ON issued_tickets (created_at);
+CREATE INDEX IF NOT EXISTS ix_issued_tickets_barcode ON issued_tickets (barcode);
+CREATE INDEX IF NOT EXISTS ix_issued_tickets_buyer_email ON issued_tickets (buyer_email COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS ticket_orders (
+    email TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    buyer_name TEXT,
+    buyer_email TEXT,
+    created_at INTEGER,
+    total INTEGER,
+    ticket_count INTEGER,
+    checked_in_count INTEGER,
+    PRIMARY KEY (email, event_id)
+);
+CREATE INDEX IF NOT EXISTS ix_ticket_orders_page ON ticket_orders (created_at DESC, email DESC, event_id DESC);
+CREATE INDEX IF NOT EXISTS ix_ticket_orders_event ON ticket_orders (event_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS ix_ticket_orders_buyer_email ON ticket_orders (buyer_email COLLATE NOCASE, created_at DESC);
+CREATE TABLE IF NOT EXISTS mirror_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_last_sync = 0.0
+_sync_lock = None
+_reconciler = None
+_stop = threading.Event()
+
+
+def _db():
+    ensure_schema("ticket_mirror", _SCHEMA)
+    return get_db()
+
+
+def unmask_ticket_pii(ticket: dict):
+    """
+    Returns (full_name, email) for a ticket, replacing values TT masks as ****
+    with the "Name|Email" we store in the reference field at issuance.
+    """
+    name = ticket.get("full_name") or "Guest"
+    email = ticket.get("email") or ""
+    ref = ticket.get("reference")
+    if ("****" in name or "****" in email) and ref and "|" in ref:
+        ref_name, ref_email = ref.split("|", 1)
+        if ref_name and "****" in name:
+            name = ref_name
+        if ref_email and "****" in email:
+            email = ref_email
+    return name, email
+
+
+def _row(ticket: dict):
+    name, email = unmask_ticket_pii(ticket)
+    price = ticket.get("listed_price")
+    return (
+        ticket.get("id"),
+        ticket.get("event_id") or "unknown",
+        ticket.get("email") or "unknown",
+        name,
+        email,
+        ticket.get("barcode") or ticket.get("id", ""),
+        ticket.get("checked_in", "false"),
+        ticket.get("status", "valid"),
+        int(price) if isinstance(price, (int, float)) else 0,
+        ticket.get("created_at") or int(time.time()),
+        json.dumps(ticket),
+    )
+
+
+def _refresh_orders(db, keys):
+    """Re-aggregates the ticket_orders rows for the given (email, event_id) groups."""
+    for email, event_id in keys:
+        rows = db.execute(
+            "SELECT buyer_name, buyer_email, listed_price, created_at, checked_in "
+            "FROM issued_tickets WHERE email = ? AND event_id = ? ORDER BY created_at",
+            (email, event_id),
+        ).fetchall()
+        if not rows:
+            db.execute("DELETE FROM ticket_orders WHERE email = ? AND event_id = ?", (email, event_id))
+            continue
+        # Prefer the first unmasked name/email in the group
+        buyer_name = next((r["buyer_name"] for r in rows if "****" not in r["buyer_name"]), rows[0]["buyer_name"])
+        buyer_email = next((r["buyer_email"] for r in rows if r["buyer_email"] and "****" not in r["buyer_email"]), email)
+        db.execute(
+            "INSERT OR REPLACE INTO ticket_orders "
+            "(email, event_id, buyer_name, buyer_email, created_at, total, ticket_count, checked_in_count) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                email,
+                event_id,
+                buyer_name,
+                buyer_email,
+                rows[0]["created_at"],
+                sum(r["listed_price"] for r in rows),
+                len(rows),
+                sum(1 for r in rows if r["checked_in"] == "true"),
+            ),
+        )
+
+
+def _upsert(tickets: list):
+    rows = [_row(t) for t in tickets if t.get("id")]
+    if not rows:
+        return
+    db = _db()
+    with db:
+        # A ticket can move groups (e.g. PII unmasked later) — refresh old and new
+        touched = {(r[2], r[1]) for r in rows}
+        for chunk_start in range(0, len(rows), 500):
+            ids = [r[0] for r in rows[chunk_start:chunk_start + 500]]
+            placeholders = ",".join("?" * len(ids))
+            for old in db.execute(
+                f"SELECT email, event_id FROM issued_tickets WHERE id IN ({placeholders})", ids
+            ):
+                touched.add((old["email"], old["event_id"]))
+        db.executemany(
+            "INSERT OR REPLACE INTO issued_tickets "
+            "(id, event_id, email, buyer_name, buyer_email, barcode, checked_in, status, listed_price, created_at, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        _refresh_orders(db, touched)
+
+
+def record_tickets(tickets: list):
+    """Writes tickets we just issued into the mirror. Never fails the caller."""
+    try:
+        _upsert(tickets)
+    except sqlite3.Error as e:
+        logger.error(f"[Mirror] Failed to record {len(tickets)} issued tickets: {e}")
+
+
+def _get_watermark():
+    row = _db().execute("SELECT value FROM mirror_state WHERE key = 'created_at_watermark'").fetchone()
+    return int(row["value"]) if row else None
+
+
+def _set_watermark(value: int):
+    db = _db()
+    with db:
+        db.execute(
+            "INSERT OR REPLACE INTO mirror_state (key, value) VALUES ('created_at_watermark', ?)",
+            (str(value),),
+        )
+
+
+async def sync(full: bool = False) -> int:
+    """
+    Pulls new tickets from Ticket Tailor into the mirror. Returns the number of
+    tickets fetched. The watermark is only advanced by upstream data, never by
+    tickets we recorded locally, so nobody else's sales are skipped.
+    """
+    global _last_sync
+    watermark = None if full else await run_in_threadpool(_get_watermark)
+    params = {"limit": TT_MIRROR_PAGE_SIZE}
+    if watermark is not None:
+        # gte, not gt: tickets sharing the boundary second are simply re-upserted
+        params["created_at.gte"] = watermark
+
+    fetched = 0
+    newest = watermark or 0
+    while True:
+        data = await afetch_from_tt("/issued_tickets", params=params, priority="background")
+        tickets = data.get("data") or []
+        await run_in_threadpool(_upsert, tickets)
+        fetched += len(tickets)
+        for t in tickets:
+            newest = max(newest, t.get("created_at") or 0)
+
+        links = data.get("links") or {}
+        if not links.get("next") or len(tickets) == 0:
+            break
+        last_id = tickets[-1].get("id")
+        if not last_id:
+            break
+        params["starting_after"] = last_id
+
+    # Another sync may have moved the watermark on meanwhile — never move it back
+    if newest and newest >= (await run_in_threadpool(_get_watermark) or 0):
+        await run_in_threadpool(_set_watermark, newest)
+    _last_sync = time.monotonic()
+    logger.info(f"[Mirror] Synced {fetched} issued tickets (watermark={newest})")
+    return fetched
+
+
+async def sync_if_due():
+    """
+    Runs an incremental sync at most once per TT_MIRROR_SYNC_INTERVAL. Never
+    fails the caller: if the sync fails the mirror is served as it is, and the
+    next attempt waits out the interval.
+    """
+    global _sync_lock, _last_sync
+    if _sync_lock is None:
+        _sync_lock = asyncio.Lock()
+    async with _sync_lock:
+        if time.monotonic() - _last_sync >= TT_MIRROR_SYNC_INTERVAL:
+            try:
+                await sync()
+            except Exception as e:
+                logger.warning(f"[Mirror] Sync failed, serving the mirror as is: {e}")
+                _last_sync = time.monotonic()
+
+
+def _run_reconciler():
+    # Runs on its own event loop, so full syncs never hold up request handling
+    loop = asyncio.new_event_loop()
+    try:
+        while not _stop.wait(TT_MIRROR_RECONCILE_INTERVAL):
+            try:
+                loop.run_until_complete(sync(full=True))
+            except Exception as e:
+                logger.error(f"[Mirror] Reconcile failed: {e}")
+        loop.run_until_complete(close_async_client())
+    finally:
+        loop.close()
+
+
+def start_reconciler():
+    global _reconciler
+    if _reconciler is None or not _reconciler.is_alive():
+        _stop.clear()
+        _reconciler = threading.Thread(target=_run_reconciler, name="mirror-reconcile", daemon=True)
+        _reconciler.start()
+
+
+def stop_reconciler():
+    _stop.set()
+
+
+def _encode_cursor(row) -> str:
+    raw = json.dumps([row["created_at"], row["email"], row["event_id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, email, event_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return created_at, email, event_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def query_orders(
+    event_id: str = None,
+    buyer_email: str = None,
+    source: str = None,
+    created_from: int = None,
+    created_to: int = None,
+    checked_in: bool = None,
+    limit: int = 50,
+    cursor: str = None,
+):
+    """
+    Returns (orders, next_cursor) newest first. Each order is a ticket_orders row
+    dict plus its `tickets`. Pagination is keyset on (created_at, email, event_id).
+    """
+    where, args = [], []
+    if event_id:
+        where.append("event_id = ?")
+        args.append(event_id)
+    if buyer_email:
+        where.append("buyer_email = ? COLLATE NOCASE")
+        args.append(buyer_email)
+    if source == "free":
+        where.append("total = 0")
+    elif source == "stripe":
+        where.append("total > 0")
+    if created_from is not None:
+        where.append("created_at >= ?")
+        args.append(created_from)
+    if created_to is not None:
+        where.append("created_at <= ?")
+        args.append(created_to)
+    if checked_in is True:
+        where.append("checked_in_count = ticket_count")
+    elif checked_in is False:
+        where.append("checked_in_count < ticket_count")
+    if cursor:
+        where.append("(created_at, email, event_id) < (?, ?, ?)")
+        args.extend(_decode_cursor(cursor))
+
+    sql = "SELECT * FROM ticket_orders"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at DESC, email DESC, event_id DESC LIMIT ?"
+    args.append(limit + 1)
+
+    db = _db()
+    rows = db.execute(sql, args).fetchall()
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+
+    orders = []
+    for row in rows[:limit]:
+        order = dict(row)
+        order["tickets"] = [
+            json.loads(t["data"])
+            for t in db.execute(
+                "SELECT data FROM issued_tickets WHERE email = ? AND event_id = ? ORDER BY created_at",
+                (row["email"], row["event_id"]),
+            )
+        ]
+        orders.append(order)
+    return orders, next_cursor
+
+
+def find_ticket(key: str):
+    """Looks a ticket up by id or barcode. Returns the raw TT ticket or None."""
+    row = _db().execute(
+        "SELECT data FROM issued_tickets WHERE id = ? OR barcode = ? LIMIT 1", (key, key)
+    ).fetchone()
+    return json.loads(row["data"]) if row else None
+
+
+def mark_checked_in(ticket_id: str, checked_in: bool = True):
+    """Flags a mirrored ticket as checked in after a successful check-in (or clears the flag)."""
+    try:
+        ticket = find_ticket(ticket_id)
+        if ticket is None:
+            return
+        ticket["checked_in"] = "true" if checked_in else "false"
+        _upsert([ticket])
+    except sqlite3.Error as e:
+        logger.error(f"[Mirror] Failed to mark {ticket_id} checked in: {e}")
+
+
+def event_ids() -> list:
+    """Every event id that has mirrored tickets."""
+    return [r["event_id"] for r in _db().execute(
+        "SELECT DISTINCT event_id FROM issued_tickets WHERE event_id IS NOT NULL"
+    )]
+
+
+def tickets_for_order(event_id: str, buyer_email: str) -> list:
+    """All mirrored tickets of one reconstructed order (buyer email + event)."""
+    rows = _db().execute(
+        "SELECT data FROM issued_tickets WHERE event_id = ? AND buyer_email = ? COLLATE NOCASE ORDER BY created_at",
+        (event_id, buyer_email),
+    ).fetchall()
+    return [json.loads(r["data"]) for r in rows]
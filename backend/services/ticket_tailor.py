@@ -1,12 +1,62 @@
 import os
+import json
+import time
+import logging
+import threading
+import asyncio
+import weakref
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from services.tt_cache import TTCache
+from services.tt_governor import RateGovernor
+from services.tt_singleflight import SingleFlight
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 TICKET_TAILOR_API_KEY = os.getenv("TICKET_TAILOR_API_KEY", "")
 BASE_URL = os.getenv("TICKET_TAILOR_BASE_URL", "https://api.tickettailor.com/v1")
 
+# ── Connection pool config ────────────────────────────────────────────────────
+TT_POOL_CONNECTIONS = int(os.getenv("TT_POOL_CONNECTIONS", "4"))
+TT_POOL_MAXSIZE = int(os.getenv("TT_POOL_MAXSIZE", "32"))
+TT_CONNECT_TIMEOUT = float(os.getenv("TT_CONNECT_TIMEOUT", "5"))
+TT_READ_TIMEOUT = float(os.getenv("TT_READ_TIMEOUT", "30"))
+TT_KEEPALIVE = os.getenv("TT_KEEPALIVE", "true").lower() == "true"
+TT_ASYNC_MAX_CONNECTIONS = int(os.getenv("TT_ASYNC_MAX_CONNECTIONS", "200"))
+TT_KEEPALIVE_EXPIRY = float(os.getenv("TT_KEEPALIVE_EXPIRY", "30"))
+TT_MAX_RATE_LIMIT_RETRIES = int(os.getenv("TT_MAX_RATE_LIMIT_RETRIES", "3"))
+
+_session = None
+_session_lock = threading.Lock()
+
+# One httpx client per event loop: an AsyncClient's connections belong to the
+# loop that opened them, and the uvicorn loop, fulfilment workers and bulk
+# retry runs each have their own.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_async_clients_lock = threading.Lock()
+
+# Shared response cache for read-mostly resources (see services/tt_cache.py)
+cache = TTCache()
+
+# Process-wide token bucket with priority classes (see services/tt_governor.py)
+governor = RateGovernor()
+
+# Identical GETs in flight at the same time share one upstream call (see services/tt_singleflight.py)
+flights = SingleFlight()
+
+# Callbacks run with the endpoint after every write we send upstream
+_write_listeners = []
+
+# Stale-while-revalidate refreshes in flight; the loop only holds tasks weakly
+_background_tasks = set()
+
+_stats_lock = threading.Lock()
+_stats = {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "by_method": {}}
+
+
 def get_headers():
     return {
         "Accept": "application/json",
@@ -16,53 +66,342 @@ def get_headers():
 def get_auth():
     return (TICKET_TAILOR_API_KEY, "")
 
-def fetch_from_tt(endpoint: str, params: dict = None):
+
+def get_session() -> requests.Session:
+    """Returns the shared, connection-pooled session used for every Ticket Tailor call."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=TT_POOL_CONNECTIONS,
+                    pool_maxsize=TT_POOL_MAXSIZE,
+                    pool_block=False,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.auth = get_auth()
+                session.headers["Connection"] = "keep-alive" if TT_KEEPALIVE else "close"
+                _session = session
+    return _session
+
+
+def close_session():
+    """Closes pooled connections (called on app shutdown)."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _record_timing(method: str, endpoint: str, elapsed_ms: float, ok: bool):
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["total_ms"] += elapsed_ms
+        _stats["max_ms"] = max(_stats["max_ms"], elapsed_ms)
+        if not ok:
+            _stats["errors"] += 1
+        per_method = _stats["by_method"].setdefault(method, {"calls": 0, "total_ms": 0.0})
+        per_method["calls"] += 1
+        per_method["total_ms"] += elapsed_ms
+    logger.debug(f"[TT] {method} {endpoint} {elapsed_ms:.1f}ms")
+
+
+def get_tt_metrics() -> dict:
+    """Snapshot of upstream call counts and latencies since process start."""
+    with _stats_lock:
+        calls = _stats["calls"]
+        return {
+            "calls": calls,
+            "errors": _stats["errors"],
+            "avg_ms": round(_stats["total_ms"] / calls, 1) if calls else 0.0,
+            "max_ms": round(_stats["max_ms"], 1),
+            "by_method": {
+                m: {"calls": v["calls"], "avg_ms": round(v["total_ms"] / v["calls"], 1)}
+                for m, v in _stats["by_method"].items()
+            },
+            "pool": {
+                "connections": TT_POOL_CONNECTIONS,
+                "maxsize": TT_POOL_MAXSIZE,
+                "async_max_connections": TT_ASYNC_MAX_CONNECTIONS,
+                "keepalive": TT_KEEPALIVE,
+            },
+            "governor": governor.metrics(),
+            "singleflight": flights.metrics(),
+        }
+
+
+def _retry_after(response, attempt: int) -> float:
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return min(30, 2 ** attempt)
+
+
+def _request(method: str, endpoint: str, priority: str = "default", **kwargs) -> requests.Response:
     url = f"{BASE_URL}{endpoint}"
-    response = requests.get(url, headers=get_headers(), auth=get_auth(), params=params)
+    kwargs.setdefault("timeout", (TT_CONNECT_TIMEOUT, TT_READ_TIMEOUT))
+    for attempt in range(TT_MAX_RATE_LIMIT_RETRIES + 1):
+        governor.acquire(priority)
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = get_session().request(method, url, **kwargs)
+            ok = response.ok
+        finally:
+            _record_timing(method, endpoint, (time.perf_counter() - started) * 1000, ok)
+        if response.status_code != 429 or attempt == TT_MAX_RATE_LIMIT_RETRIES:
+            return response
+        # Rejected before processing, so even writes are safe to resend
+        wait = _retry_after(response, attempt)
+        logger.warning(f"[TT] 429 on {method} {endpoint}, holding all calls for {wait:.1f}s")
+        governor.on_rate_limited(wait)
+
+
+def add_write_listener(callback):
+    """Registers `callback(endpoint)` to run after each post/put/delete to Ticket Tailor."""
+    _write_listeners.append(callback)
+
+
+def _notify_write(endpoint: str):
+    cache.invalidate_for_write(endpoint)
+    for callback in _write_listeners:
+        try:
+            callback(endpoint)
+        except Exception as e:
+            logger.error(f"[TT] Write listener failed for {endpoint}: {e}")
+
+
+def _raise_tt_error(response):
+    # Surface the actual Ticket Tailor error message
+    try:
+        err_body = response.json()
+        tt_message = err_body.get("message") or err_body.get("error") or str(err_body)
+    except Exception:
+        tt_message = response.text or f"HTTP {response.status_code}"
+    raise requests.HTTPError(
+        f"Ticket Tailor API [{response.status_code}]: {tt_message}",
+        response=response,
+    )
+
+
+def _flight_key(endpoint: str, params: dict, priority: str) -> tuple:
+    # The cache generation is part of the key so a read that starts after a
+    # write never joins a call that may have been answered before it. So is the
+    # priority: a checkout read must not wait on a background call held behind
+    # the governor's reserve.
+    query = tuple(sorted((k, str(v)) for k, v in params.items())) if params else ()
+    return (endpoint, query, cache.generation, priority)
+
+
+def _get_upstream(endpoint: str, params: dict, key, priority: str) -> bytes:
+    generation = cache.generation
+    response = _request("GET", endpoint, priority, headers=get_headers(), params=params)
     response.raise_for_status()
-    return response.json()
+    if key is not None:
+        cache.set(key, endpoint, response.content, generation)
+    return response.content
 
-def post_to_tt(endpoint: str, data: dict):
-    url = f"{BASE_URL}{endpoint}"
+
+def _fetch_raw(endpoint: str, params: dict, key, priority: str = "default") -> bytes:
+    return flights.do(
+        _flight_key(endpoint, params, priority), lambda: _get_upstream(endpoint, params, key, priority)
+    )
+
+
+def _refresh_in_background(endpoint: str, params: dict, key: str):
+    try:
+        _fetch_raw(endpoint, params, key, "background")
+    except Exception as e:
+        logger.warning(f"[TT cache] Background refresh of {key} failed: {e}")
+    finally:
+        cache.end_refresh(key)
+
+
+def fetch_from_tt(endpoint: str, params: dict = None, priority: str = "default", cached: bool = True):
+    # cached=False skips the response cache (reads that must see upstream state now)
+    key = cache.key_for(endpoint, params) if cached else None
+    if key is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            body, stale = hit
+            if stale and cache.begin_refresh(key):
+                threading.Thread(
+                    target=_refresh_in_background, args=(endpoint, params, key), daemon=True
+                ).start()
+            return json.loads(body)
+    return json.loads(_fetch_raw(endpoint, params, key, priority))
+
+def post_to_tt(endpoint: str, data: dict, priority: str = "default"):
     # Ticket Tailor standard API uses form-urlencoded for POST
     headers = {"Accept": "application/json"}
-    response = requests.post(url, headers=headers, auth=get_auth(), data=data)
+    try:
+        response = _request("POST", endpoint, priority, headers=headers, data=data)
+    finally:
+        _notify_write(endpoint)
+    if not response.ok:
+        _raise_tt_error(response)
+    return response.json()
 
+
+def put_to_tt(endpoint: str, data: dict, priority: str = "default"):
+    headers = {"Accept": "application/json"}
+    try:
+        response = _request("POST", endpoint, priority, headers=headers, data=data) # TT Docs assert Updates are often POST to the entity URL rather than actual PUT
+    finally:
+        _notify_write(endpoint)
     if not response.ok:
-        # Surface the actual Ticket Tailor error message
-        try:
-            err_body = response.json()
-            tt_message = err_body.get("message") or err_body.get("error") or str(err_body)
-        except Exception:
-            tt_message = response.text or f"HTTP {response.status_code}"
-        raise requests.HTTPError(
-            f"Ticket Tailor API [{response.status_code}]: {tt_message}",
-            response=response,
-        )
+        _raise_tt_error(response)
+    return response.json()
 
+def delete_from_tt(endpoint: str, priority: str = "default"):
+    headers = {"Accept": "application/json"}
+    try:
+        response = _request("DELETE", endpoint, priority, headers=headers)
+    finally:
+        _notify_write(endpoint)
+    response.raise_for_status()
     return response.json()
 
 
-def put_to_tt(endpoint: str, data: dict):
+# ─────────────────────────────────────────────────────────────────────────────
+# Async client — same API as above for `async def` routes
+# ─────────────────────────────────────────────────────────────────────────────
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the pooled httpx client of the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        client = _async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                auth=get_auth(),
+                timeout=httpx.Timeout(TT_READ_TIMEOUT, connect=TT_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=TT_ASYNC_MAX_CONNECTIONS,
+                    max_keepalive_connections=TT_POOL_MAXSIZE if TT_KEEPALIVE else 0,
+                    keepalive_expiry=TT_KEEPALIVE_EXPIRY,
+                ),
+            )
+            _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Closes the running loop's client; clients of other loops are left alone."""
+    with _async_clients_lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def _arequest(method: str, endpoint: str, priority: str = "default", **kwargs) -> httpx.Response:
     url = f"{BASE_URL}{endpoint}"
-    headers = {"Accept": "application/json"}
-    response = requests.post(url, headers=headers, auth=get_auth(), data=data) # TT Docs assert Updates are often POST to the entity URL rather than actual PUT
-    if not response.ok:
-        # Surface the actual Ticket Tailor error message
+    for attempt in range(TT_MAX_RATE_LIMIT_RETRIES + 1):
+        await governor.aacquire(priority)
+        started = time.perf_counter()
+        ok = False
         try:
-            err_body = response.json()
-            tt_message = err_body.get("message") or err_body.get("error") or str(err_body)
-        except Exception:
-            tt_message = response.text or f"HTTP {response.status_code}"
-        raise requests.HTTPError(
-            f"Ticket Tailor API [{response.status_code}]: {tt_message}",
-            response=response,
-        )
+            response = await get_async_client().request(method, url, **kwargs)
+            ok = response.is_success
+        finally:
+            _record_timing(method, endpoint, (time.perf_counter() - started) * 1000, ok)
+        if response.status_code != 429 or attempt == TT_MAX_RATE_LIMIT_RETRIES:
+            return response
+        wait = _retry_after(response, attempt)
+        logger.warning(f"[TT] 429 on {method} {endpoint}, holding all calls for {wait:.1f}s")
+        governor.on_rate_limited(wait)
+
+
+async def _aget_upstream(endpoint: str, params: dict, key, priority: str) -> bytes:
+    generation = cache.generation
+    response = await _arequest("GET", endpoint, priority, headers=get_headers(), params=params)
+    if not response.is_success:
+        _raise_tt_error(response)
+    if key is not None:
+        cache.set(key, endpoint, response.content, generation)
+    return response.content
+
+
+async def _afetch_raw(endpoint: str, params: dict, key, priority: str = "default") -> bytes:
+    return await flights.ado(
+        _flight_key(endpoint, params, priority), lambda: _aget_upstream(endpoint, params, key, priority)
+    )
+
+
+async def _arefresh_in_background(endpoint: str, params: dict, key: str):
+    try:
+        await _afetch_raw(endpoint, params, key, "background")
+    except Exception as e:
+        logger.warning(f"[TT cache] Background refresh of {key} failed: {e}")
+    finally:
+        cache.end_refresh(key)
+
+
+def _forget_background_task(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"[TT cache] Background refresh task failed: {task.exception()}")
+
+
+async def afetch_from_tt(endpoint: str, params: dict = None, priority: str = "default", cached: bool = True):
+    key = cache.key_for(endpoint, params) if cached else None
+    if key is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            body, stale = hit
+            if stale and cache.begin_refresh(key):
+                task = asyncio.get_running_loop().create_task(_arefresh_in_background(endpoint, params, key))
+                _background_tasks.add(task)
+                task.add_done_callback(_forget_background_task)
+            return json.loads(body)
+    return json.loads(await _afetch_raw(endpoint, params, key, priority))
+
+async def apost_to_tt(endpoint: str, data: dict, priority: str = "default"):
+    headers = {"Accept": "application/json"}
+    try:
+        response = await _arequest("POST", endpoint, priority, headers=headers, data=data)
+    finally:
+        _notify_write(endpoint)
+    if not response.is_success:
+        _raise_tt_error(response)
     return response.json()
 
-def delete_from_tt(endpoint: str):
-    url = f"{BASE_URL}{endpoint}"
+async def aput_to_tt(endpoint: str, data: dict, priority: str = "default"):
     headers = {"Accept": "application/json"}
-    response = requests.delete(url, headers=headers, auth=get_auth())
-    response.raise_for_status()
+    try:
+        response = await _arequest("POST", endpoint, priority, headers=headers, data=data)
+    finally:
+        _notify_write(endpoint)
+    if not response.is_success:
+        _raise_tt_error(response)
     return response.json()
+
+async def adelete_from_tt(endpoint: str, priority: str = "default"):
+    headers = {"Accept": "application/json"}
+    try:
+        response = await _arequest("DELETE", endpoint, priority, headers=headers)
+    finally:
+        _notify_write(endpoint)
+    if not response.is_success:
+        _raise_tt_error(response)
+    return response.json()
+
+
+async def gather_from_tt(*calls, priority: str = "default"):
+    """
+    Runs independent Ticket Tailor reads concurrently and returns their results
+    in the order given. Each call is an endpoint string, an (endpoint, params)
+    tuple, or any awaitable (e.g. a paginated helper). The first failure is raised.
+    """
+    aws = []
+    for call in calls:
+        if isinstance(call, str):
+            aws.append(afetch_from_tt(call, priority=priority))
+        elif isinstance(call, tuple):
+            aws.append(afetch_from_tt(*call, priority=priority))
+        else:
+            aws.append(call)
+    return await asyncio.gather(*aws)
@@ -0,0 +1,158 @@
+"""
+In-process response cache for read-mostly Ticket Tailor resources.
+
+Entries are stored as raw JSON bytes (so callers always get a fresh object and
+memory use is exact) in an LRU bounded by TT_CACHE_MAX_BYTES. Each endpoint
+pattern has a fresh TTL and a stale window: inside the stale window the old
+body is served while the caller kicks off a background refresh.
+"""
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+TT_CACHE_ENABLED = os.getenv("TT_CACHE_ENABLED", "true").lower() == "true"
+TT_CACHE_MAX_BYTES = int(os.getenv("TT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# (pattern, fresh seconds, stale-while-revalidate seconds)
+CACHE_RULES = [
+    (re.compile(r"^/event_series$"), int(os.getenv("TT_CACHE_TTL_EVENT_SERIES", "60")), 300),
+    (re.compile(r"^/event_series/[^/]+$"), int(os.getenv("TT_CACHE_TTL_EVENT_SERIES", "60")), 300),
+    (re.compile(r"^/events$"), int(os.getenv("TT_CACHE_TTL_EVENTS", "60")), 300),
+    # Single events carry live ticket quantities — keep them short
+    (re.compile(r"^/events/[^/]+$"), int(os.getenv("TT_CACHE_TTL_EVENT", "15")), 60),
+    (re.compile(r"^/discounts(/[^/]+)?$"), int(os.getenv("TT_CACHE_TTL_DISCOUNTS", "120")), 600),
+]
+
+# Write path prefix -> cached path prefixes it makes stale.
+# Ticket types, bundles and groups live under /event_series but are embedded in
+# /events payloads. Issuing tickets changes no event or series metadata (live
+# quantities come from services/inventory), so it invalidates nothing here —
+# otherwise every sale would cold-start the hottest reads mid on-sale.
+INVALIDATION_RULES = [
+    ("/event_series", ("/event_series", "/events")),
+    ("/events", ("/event_series", "/events")),
+    ("/discounts", ("/discounts",)),
+]
+
+
+class _Entry:
+    __slots__ = ("body", "size", "fresh_until", "stale_until", "refreshing")
+
+    def __init__(self, body: bytes, fresh_for: float, stale_for: float):
+        now = time.monotonic()
+        self.body = body
+        self.size = len(body)
+        self.fresh_until = now + fresh_for
+        self.stale_until = self.fresh_until + stale_for
+        self.refreshing = False
+
+
+class TTCache:
+    def __init__(self, max_bytes: int = TT_CACHE_MAX_BYTES, enabled: bool = TT_CACHE_ENABLED):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        # Bumped on every invalidation so fetches that started before a write
+        # don't put pre-write data back into the cache.
+        self.generation = 0
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def _rule_for(endpoint: str):
+        for pattern, fresh, stale in CACHE_RULES:
+            if pattern.match(endpoint):
+                return fresh, stale
+        return None
+
+    def key_for(self, endpoint: str, params: dict = None):
+        """Cache key for a GET, or None when the endpoint is not cacheable."""
+        if not self.enabled or self._rule_for(endpoint) is None:
+            return None
+        if not params:
+            return endpoint
+        query = "&".join(f"{k}={params[k]}" for k in sorted(params))
+        return f"{endpoint}?{query}"
+
+    def get(self, key: str):
+        """Returns (body, is_stale) or None on a miss / fully expired entry."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now >= entry.stale_until:
+                if entry is not None:
+                    self._drop(key)
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            if now < entry.fresh_until:
+                self.stats["hits"] += 1
+                return entry.body, False
+            self.stats["stale_hits"] += 1
+            return entry.body, True
+
+    def begin_refresh(self, key: str) -> bool:
+        """Claims the background refresh for a stale key; False if one is already running."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.refreshing:
+                return False
+            entry.refreshing = True
+            return True
+
+    def end_refresh(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.refreshing = False
+
+    def set(self, key: str, endpoint: str, body: bytes, generation: int):
+        rule = self._rule_for(endpoint)
+        if rule is None or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            entry = _Entry(body, *rule)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.stats["evictions"] += 1
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def invalidate_prefixes(self, prefixes):
+        with self._lock:
+            self.generation += 1
+            for key in [k for k in self._entries if k.startswith(tuple(prefixes))]:
+                self._drop(key)
+            self.stats["invalidations"] += 1
+
+    def invalidate_for_write(self, endpoint: str):
+        """Drops every cached read that a write to `endpoint` may have changed."""
+        prefixes = set()
+        for write_prefix, affected in INVALIDATION_RULES:
+            if endpoint.startswith(write_prefix):
+                prefixes.update(affected)
+        if prefixes:
+            self.invalidate_prefixes(prefixes)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
@@ -0,0 +1,123 @@
+"""
+Process-wide rate governor for Ticket Tailor calls.
+
+A token bucket refilled at TT_RATE_LIMIT requests/second (up to TT_RATE_BURST)
+gates every upstream request. Lower priority classes must leave a reserve of
+tokens untouched, so when the bucket runs low checkout and door traffic still
+get through while admin listings, exports and syncs wait:
+
+    checkout    issuance, check-ins              may take the last token
+    default     everything not classified        leaves TT_RESERVE_DEFAULT of the burst
+    background  listings, exports, syncs, cache  leaves TT_RESERVE_BACKGROUND of the burst
+
+A 429 empties the bucket and holds every caller until its Retry-After passes.
+Works from threads (`acquire`) and event loops (`aacquire`).
+"""
+
+import os
+import time
+import asyncio
+import threading
+
+TT_RATE_LIMIT = float(os.getenv("TT_RATE_LIMIT", "10"))
+TT_RATE_BURST = float(os.getenv("TT_RATE_BURST", "20"))
+TT_RESERVE_DEFAULT = float(os.getenv("TT_RESERVE_DEFAULT", "0.2"))
+TT_RESERVE_BACKGROUND = float(os.getenv("TT_RESERVE_BACKGROUND", "0.5"))
+
+PRIORITIES = ("checkout", "default", "background")
+
+
+class RateGovernor:
+    def __init__(self, rate: float = TT_RATE_LIMIT, burst: float = TT_RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.reserve = {
+            "checkout": 0.0,
+            "default": burst * TT_RESERVE_DEFAULT,
+            "background": burst * TT_RESERVE_BACKGROUND,
+        }
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self.stats = {
+            p: {"calls": 0, "throttled": 0, "wait_ms": 0.0, "max_wait_ms": 0.0} for p in PRIORITIES
+        }
+        self.rate_limited = 0
+
+    def _try_take(self, priority: str) -> float:
+        """Takes a token and returns 0, or returns how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            self._tokens = min(self.burst, self._tokens + max(0.0, now - self._updated) * self.rate)
+            self._updated = now
+            needed = 1 + self.reserve[priority]
+            if self._tokens >= needed:
+                self._tokens -= 1
+                return 0.0
+            return (needed - self._tokens) / self.rate
+
+    def _record(self, priority: str, waited: float):
+        with self._lock:
+            stats = self.stats[priority]
+            stats["calls"] += 1
+            if waited > 0:
+                stats["throttled"] += 1
+                stats["wait_ms"] += waited * 1000
+                stats["max_wait_ms"] = max(stats["max_wait_ms"], waited * 1000)
+
+    def acquire(self, priority: str = "default"):
+        if priority not in self.reserve:
+            priority = "default"
+        started = time.monotonic()
+        waited = False
+        while True:
+            wait = self._try_take(priority)
+            if wait <= 0:
+                break
+            waited = True
+            time.sleep(max(wait, 0.005))
+        self._record(priority, time.monotonic() - started if waited else 0.0)
+
+    async def aacquire(self, priority: str = "default"):
+        if priority not in self.reserve:
+            priority = "default"
+        started = time.monotonic()
+        waited = False
+        while True:
+            wait = self._try_take(priority)
+            if wait <= 0:
+                break
+            waited = True
+            await asyncio.sleep(max(wait, 0.005))
+        self._record(priority, time.monotonic() - started if waited else 0.0)
+
+    def on_rate_limited(self, retry_after: float):
+        """A 429 came back: stop everyone until Retry-After has passed."""
+        with self._lock:
+            self.rate_limited += 1
+            self._tokens = 0.0
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+            # Refill only starts once the block is over
+            self._updated = self._blocked_until
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "rate_per_sec": self.rate,
+                "burst": self.burst,
+                "tokens": round(min(self.burst, self._tokens + max(0.0, time.monotonic() - self._updated) * self.rate), 1),
+                "rate_limited_responses": self.rate_limited,
+                "blocked_for_ms": round(max(0.0, self._blocked_until - time.monotonic()) * 1000),
+                "by_priority": {
+                    p: {
+                        "calls": s["calls"],
+                        "throttled": s["throttled"],
+                        "avg_wait_ms": round(s["wait_ms"] / s["calls"], 1) if s["calls"] else 0.0,
+                        "max_wait_ms": round(s["max_wait_ms"], 1),
+                    }
+                    for p, s in self.stats.items()
+                },
+            }
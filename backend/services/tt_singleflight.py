@@ -0,0 +1,96 @@
+"""
+Single-flight deduplication for Ticket Tailor GETs.
+
+When an event goes on sale, hundreds of requests ask for the same event, series
+and ticket list in the same second. Identical reads that overlap share one
+upstream request: the first caller makes it, later callers with the same key
+wait for that call and get the same raw body (each parses its own copy). Nothing
+is kept once the call finishes — keeping responses is the cache's job
+(services/tt_cache.py); this only covers the misses that land together.
+
+Threads (`do`) and event loops (`ado`) have separate flights, and async flights
+are per event loop since a task can only be awaited on its own loop.
+"""
+
+import asyncio
+import threading
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._tasks = {}
+        self.stats = {"flights": 0, "coalesced": 0, "async_flights": 0, "async_coalesced": 0}
+
+    def do(self, key, fn):
+        """Returns `fn()`, or the result of an identical call already in flight."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["flights"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    async def ado(self, key, coro_fn):
+        """Awaits `coro_fn()`, or the identical call already in flight on this loop."""
+        task_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = asyncio.ensure_future(coro_fn())
+                self._tasks[task_key] = task
+                task.add_done_callback(lambda t: self._forget(task_key, t))
+                self.stats["async_flights"] += 1
+            else:
+                self.stats["async_coalesced"] += 1
+        # Shielded so one caller giving up doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, task_key, task):
+        with self._lock:
+            if self._tasks.get(task_key) is task:
+                del self._tasks[task_key]
+        if not task.cancelled():
+            # Mark the error retrieved even if every waiter was cancelled
+            task.exception()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            in_flight = len(self._flights) + len(self._tasks)
+        upstream = stats["flights"] + stats["async_flights"]
+        coalesced = stats["coalesced"] + stats["async_coalesced"]
+        return {
+            **stats,
+            "in_flight": in_flight,
+            "coalesced_ratio": round(coalesced / (upstream + coalesced), 3) if upstream + coalesced else 0.0,
+        }
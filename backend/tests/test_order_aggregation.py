@@ -0,0 +1,129 @@
+from collections import defaultdict
+
+from services.order_aggregation import aggregate_orders
+
+
+def _legacy_aggregate(tickets, event_map):
+    """The grouping list_orders did before OrderAccumulator, kept as the reference."""
+    order_groups = defaultdict(list)
+    for t in tickets:
+        order_groups[f"{t.get('email') or 'unknown'}|{t.get('event_id') or 'unknown'}"].append(t)
+
+    transformed = []
+    for key, group_tickets in order_groups.items():
+        email_key, event_id = key.split("|", 1)
+        buyer_name = group_tickets[0].get("full_name") or "Guest"
+        buyer_email = email_key
+        if "****" in buyer_name or "****" in buyer_email:
+            for t in group_tickets:
+                ref = t.get("reference")
+                if ref and "|" in ref:
+                    ref_name, ref_email = ref.split("|", 1)
+                    if ref_name and "****" in buyer_name:
+                        buyer_name = ref_name
+                    if ref_email and "****" in buyer_email:
+                        buyer_email = ref_email
+                    break
+
+        total = 0
+        for t in group_tickets:
+            price = t.get("listed_price")
+            if price and isinstance(price, (int, float)):
+                total += int(price)
+
+        issued_tickets = []
+        for t in group_tickets:
+            t_name = t.get("full_name") or "Guest"
+            t_email = t.get("email") or ""
+            ref = t.get("reference")
+            if ("****" in t_name or "****" in t_email) and ref and "|" in ref:
+                rn, re_ = ref.split("|", 1)
+                if "****" in t_name:
+                    t_name = rn
+                if "****" in t_email:
+                    t_email = re_
+            issued_tickets.append({
+                "id": t.get("id", ""),
+                "description": t.get("description", "Ticket"),
+                "barcode": t.get("barcode") or t.get("id", ""),
+                "checked_in": t.get("checked_in", "false"),
+                "status": t.get("status", "valid"),
+                "full_name": t_name,
+                "email": t_email,
+                "ticket_type_id": t.get("ticket_type_id", ""),
+            })
+
+        transformed.append({
+            "id": f"{event_id}_{buyer_email}",
+            "buyer_name": buyer_name,
+            "buyer_email": buyer_email,
+            "phone": "",
+            "event_id": event_id,
+            "event_name": event_map.get(event_id, "Unknown Event"),
+            "total": total,
+            "source": "free" if total == 0 else "stripe",
+            "status": "confirmed",
+            "created_at": min(t.get("created_at", 0) for t in group_tickets),
+            "stripe_session_id": "",
+            "issued_tickets": issued_tickets,
+            "items": [],
+        })
+    transformed.sort(key=lambda o: o.get("created_at", 0), reverse=True)
+    return transformed
+
+
+EVENT_MAP = {"ev_1": "Concert", "ev_2": "Workshop"}
+
+TICKETS = [
+    # Masked buyer resolved from the second ticket's reference
+    {"id": "it_1", "event_id": "ev_1", "email": "****", "full_name": "****", "listed_price": 1500,
+     "created_at": 300, "barcode": "B1"},
+    {"id": "it_2", "event_id": "ev_1", "email": "****", "full_name": "****", "listed_price": 1500,
+     "created_at": 250, "reference": "Ana Ruiz|ana@example.com", "barcode": "B2"},
+    # Same email, other event — a separate order; free
+    {"id": "it_3", "event_id": "ev_2", "email": "****", "full_name": "****", "listed_price": 0,
+     "created_at": 100, "reference": "Ana Ruiz|ana@example.com", "checked_in": "true"},
+    # Unmasked buyer, price given as a float and a non-number
+    {"id": "it_4", "event_id": "ev_2", "email": "bo@example.com", "full_name": "Bo Lee", "listed_price": 499.0,
+     "created_at": 200, "reference": "Someone Else|else@example.com"},
+    {"id": "it_5", "event_id": "ev_2", "email": "bo@example.com", "full_name": "Bo Lee", "listed_price": "12",
+     "created_at": 400, "status": "voided"},
+    # No email / event: the "unknown" group
+    {"id": "it_6", "full_name": "", "created_at": 50},
+    # Event missing from the map
+    {"id": "it_7", "event_id": "ev_gone", "email": "cy@example.com", "full_name": "Cy", "listed_price": 700,
+     "created_at": 250},
+]
+
+
+def test_matches_legacy_grouping():
+    assert aggregate_orders(TICKETS, EVENT_MAP) == _legacy_aggregate(TICKETS, EVENT_MAP)
+
+
+def test_groups_totals_and_unmasking():
+    orders = {o["id"]: o for o in aggregate_orders(TICKETS, EVENT_MAP)}
+
+    ana = orders["ev_1_ana@example.com"]
+    assert ana["buyer_name"] == "Ana Ruiz"
+    assert ana["total"] == 3000 and ana["source"] == "stripe"
+    assert ana["created_at"] == 250
+    assert [t["id"] for t in ana["issued_tickets"]] == ["it_1", "it_2"]
+
+    assert orders["ev_2_ana@example.com"]["source"] == "free"
+    bo = orders["ev_2_bo@example.com"]
+    assert bo["total"] == 499 and bo["buyer_name"] == "Bo Lee"
+    assert orders["unknown_unknown"]["buyer_name"] == "Guest"
+    assert orders["ev_gone_cy@example.com"]["event_name"] == "Unknown Event"
+
+
+def test_sort_false_keeps_first_seen_order():
+    orders = aggregate_orders(TICKETS, EVENT_MAP, sort=False)
+    assert [o["id"] for o in orders] == [
+        "ev_1_ana@example.com",
+        "ev_2_ana@example.com",
+        "ev_2_bo@example.com",
+        "unknown_unknown",
+        "ev_gone_cy@example.com",
+    ]
+    # Sorting newest first is the only difference
+    assert sorted(orders, key=lambda o: o["created_at"], reverse=True) == aggregate_orders(TICKETS, EVENT_MAP)
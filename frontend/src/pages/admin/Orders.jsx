@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { CheckCircle, ChevronDown, ChevronRight, Ticket, User, XCircle, RefreshCw, AlertTriangle, Clock } from 'lucide-react';
+import { CheckCircle, ChevronDown, ChevronRight, Ticket, User, XCircle, RefreshCw, AlertTriangle, Clock, Search } from 'lucide-react';
 import api from '../../services/api';
 
 const shortOrderId = (id) => {
@@ -118,13 +118,24 @@ const OrderRowDetails = ({ order, handleCheckIn }) => {
     );
 };
 
+const ORDERS_PAGE_SIZE = 50;
+
+// Date inputs give YYYY-MM-DD; the API takes unix seconds (whole local days, inclusive)
+const dateToUnix = (date, endOfDay = false) =>
+    Math.floor(new Date(`${date}T${endOfDay ? '23:59:59' : '00:00:00'}`).getTime() / 1000);
+
 const Orders = () => {
     const [orders, setOrders] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
+    const [filters, setFilters] = useState({ buyer_email: '', event_id: '', source: '', checked_in: '', created_from: '', created_to: '' });
+    const [events, setEvents] = useState([]);
     const [pendingOrders, setPendingOrders] = useState([]);
     const [expandedOrders, setExpandedOrders] = useState(new Set());
     const [toast, setToast] = useState({ show: false, message: '', type: 'success' });
     const [loading, setLoading] = useState(true);
     const [retrying, setRetrying] = useState(null);
+    const [retryRun, setRetryRun] = useState(null);
     const [activeTab, setActiveTab] = useState('confirmed'); // 'confirmed' | 'pending'
 
     const showToast = (message, type = 'success') => {
@@ -135,13 +146,35 @@ const Orders = () => {
     useEffect(() => {
         fetchOrders();
         fetchPendingOrders();
+        fetchEvents();
     }, []);
 
+    const fetchEvents = async () => {
+        try {
+            const res = await api.get('/events');
+            setEvents(res.data.data || []);
+        } catch (err) { console.error(err); }
+    };
+
+    // Filtering and pagination happen server-side; only one page is transferred at a time
+    const buildOrderParams = (cursor) => {
+        const params = { limit: ORDERS_PAGE_SIZE };
+        Object.entries(filters).forEach(([key, value]) => {
+            if (value === '') return;
+            if (key === 'created_from') params[key] = dateToUnix(value);
+            else if (key === 'created_to') params[key] = dateToUnix(value, true);
+            else params[key] = value;
+        });
+        if (cursor) params.cursor = cursor;
+        return params;
+    };
+
     const fetchOrders = async () => {
         setLoading(true);
         try {
-            const res = await api.get('/orders');
+            const res = await api.get('/orders', { params: buildOrderParams() });
             setOrders(res.data.data || []);
+            setNextCursor(res.data.next_cursor || null);
         } catch (err) {
             console.error(err);
             showToast("Failed to fetch orders", "error");
@@ -149,6 +182,26 @@ const Orders = () => {
         setLoading(false);
     };
 
+    const fetchMoreOrders = async () => {
+        if (!nextCursor) return;
+        setLoadingMore(true);
+        try {
+            const res = await api.get('/orders', { params: buildOrderParams(nextCursor) });
+            setOrders(prev => [...prev, ...(res.data.data || [])]);
+            setNextCursor(res.data.next_cursor || null);
+        } catch (err) {
+            console.error(err);
+            showToast("Failed to fetch more orders", "error");
+        }
+        setLoadingMore(false);
+    };
+
+    // A cursor only continues the listing it came from, so any filter change starts over
+    const updateFilter = (key, value) => {
+        setFilters(prev => ({ ...prev, [key]: value }));
+        setNextCursor(null);
+    };
+
     const fetchPendingOrders = async () => {
         try {
             const res = await api.get('/payments/pending-orders');
@@ -172,6 +225,33 @@ const Orders = () => {
         setRetrying(null);
     };
 
+    const pollRetryRun = async (runId) => {
+        try {
+            const res = await api.get(`/payments/pending-orders/retry-runs/${runId}`);
+            setRetryRun(res.data);
+            if (res.data.status === 'running') {
+                setTimeout(() => pollRetryRun(runId), 2000);
+            } else {
+                showToast(`Bulk retry finished: ${res.data.succeeded} succeeded, ${res.data.failed} failed`, res.data.failed ? 'error' : 'success');
+                fetchPendingOrders();
+                fetchOrders();
+            }
+        } catch (err) {
+            console.error('Failed to fetch retry progress', err);
+        }
+    };
+
+    const handleRetryAll = async () => {
+        try {
+            const res = await api.post('/payments/pending-orders/retry-all');
+            setRetryRun(res.data);
+            if (res.data.status === 'running') pollRetryRun(res.data.id);
+        } catch (err) {
+            const msg = err.response?.data?.detail || 'Retry failed';
+            showToast(`❌ Bulk retry failed: ${msg}`, 'error');
+        }
+    };
+
     const toggleOrderArea = (orderId) => {
         const newExpanded = new Set(expandedOrders);
         if (newExpanded.has(orderId)) {
@@ -211,7 +291,7 @@ const Orders = () => {
                         : 'text-gray-400 hover:text-white'
                         }`}
                 >
-                    ✅ Confirmed Orders ({orders.length})
+                    ✅ Confirmed Orders ({orders.length}{nextCursor ? '+' : ''})
                 </button>
                 <button
                     onClick={() => setActiveTab('pending')}
@@ -232,6 +312,69 @@ const Orders = () => {
 
             {/* ── CONFIRMED ORDERS TAB ─────────────────────────────────────────── */}
             {activeTab === 'confirmed' && (
+                <>
+                <form
+                    onSubmit={(e) => { e.preventDefault(); fetchOrders(); }}
+                    className="flex flex-wrap items-center gap-3"
+                >
+                    <div className="flex items-center gap-2 bg-dark-800 border border-white/10 rounded-lg px-3 py-2 flex-1 min-w-[14rem]">
+                        <Search className="w-4 h-4 text-gray-500" />
+                        <input
+                            type="email"
+                            value={filters.buyer_email}
+                            onChange={(e) => updateFilter('buyer_email', e.target.value)}
+                            placeholder="Buyer email"
+                            className="bg-transparent text-sm text-white outline-none w-full"
+                        />
+                    </div>
+                    <select
+                        value={filters.event_id}
+                        onChange={(e) => updateFilter('event_id', e.target.value)}
+                        className="bg-dark-800 border border-white/10 rounded-lg px-3 py-2 text-sm text-white max-w-[16rem]"
+                    >
+                        <option value="">All events</option>
+                        {events.map(evt => <option key={evt.id} value={evt.id}>{evt.name}</option>)}
+                    </select>
+                    <select
+                        value={filters.source}
+                        onChange={(e) => updateFilter('source', e.target.value)}
+                        className="bg-dark-800 border border-white/10 rounded-lg px-3 py-2 text-sm text-white"
+                    >
+                        <option value="">All sources</option>
+                        <option value="stripe">Paid</option>
+                        <option value="free">Free</option>
+                    </select>
+                    <select
+                        value={filters.checked_in}
+                        onChange={(e) => updateFilter('checked_in', e.target.value)}
+                        className="bg-dark-800 border border-white/10 rounded-lg px-3 py-2 text-sm text-white"
+                    >
+                        <option value="">Any check-in status</option>
+                        <option value="true">Fully checked in</option>
+                        <option value="false">Not fully checked in</option>
+                    </select>
+                    <label className="flex items-center gap-2 text-sm text-gray-400">
+                        From
+                        <input
+                            type="date"
+                            value={filters.created_from}
+                            max={filters.created_to || undefined}
+                            onChange={(e) => updateFilter('created_from', e.target.value)}
+                            className="bg-dark-800 border border-white/10 rounded-lg px-3 py-2 text-sm text-white"
+                        />
+                    </label>
+                    <label className="flex items-center gap-2 text-sm text-gray-400">
+                        To
+                        <input
+                            type="date"
+                            value={filters.created_to}
+                            min={filters.created_from || undefined}
+                            onChange={(e) => updateFilter('created_to', e.target.value)}
+                            className="bg-dark-800 border border-white/10 rounded-lg px-3 py-2 text-sm text-white"
+                        />
+                    </label>
+                    <button type="submit" className="btn-secondary text-sm">Apply</button>
+                </form>
                 <div className="glass-card overflow-hidden">
                     <table className="w-full text-left">
                         <thead className="bg-white/5 text-gray-400">
@@ -278,6 +421,14 @@ const Orders = () => {
                         </tbody>
                     </table>
                 </div>
+                {nextCursor && !loading && (
+                    <div className="flex justify-center">
+                        <button onClick={fetchMoreOrders} disabled={loadingMore} className="btn-secondary text-sm flex items-center gap-2">
+                            {loadingMore ? <><RefreshCw className="w-4 h-4 animate-spin" /> Loading...</> : 'Load more orders'}
+                        </button>
+                    </div>
+                )}
+                </>
             )}
 
             {/* ── PENDING ORDERS TAB ───────────────────────────────────────────── */}
@@ -295,6 +446,25 @@ const Orders = () => {
                         </div>
                     </div>
 
+                    {pendingOrders.length > 0 && (
+                        <div className="flex items-center justify-end gap-4">
+                            {retryRun?.status === 'running' && (
+                                <span className="text-sm text-gray-400">
+                                    {retryRun.total - retryRun.queued} / {retryRun.total} processed
+                                    · {retryRun.succeeded} succeeded · {retryRun.failed} failed
+                                </span>
+                            )}
+                            <button
+                                onClick={handleRetryAll}
+                                disabled={retryRun?.status === 'running'}
+                                className="flex items-center gap-2 bg-brand-600 hover:bg-brand-500 disabled:bg-gray-700 text-white text-xs font-bold px-4 py-2 rounded-lg transition-all"
+                            >
+                                <RefreshCw className={`w-3 h-3 ${retryRun?.status === 'running' ? 'animate-spin' : ''}`} />
+                                {retryRun?.status === 'running' ? 'Retrying all...' : 'Retry all'}
+                            </button>
+                        </div>
+                    )}
+
                     {pendingOrders.length === 0 ? (
                         <div className="glass-card p-10 text-center text-gray-500">
                             🎉 No pending orders — all tickets are successfully issued!
@@ -10,6 +10,8 @@ const FreeConfirmPage = () => {
     const navigate = useNavigate();
     const [confirming, setConfirming] = useState(false);
     const [errorMsg, setErrorMsg] = useState('');
+    // One key per confirmation page, so double submits issue tickets only once
+    const [idempotencyKey] = useState(() => crypto.randomUUID());
 
     // If navigated directly without state, redirect back
     if (!state?.payload) {
@@ -23,7 +25,15 @@ const FreeConfirmPage = () => {
         setConfirming(true);
         setErrorMsg('');
         try {
-            await api.post('/payments/create-free-order', payload);
+            const res = await api.post('/payments/create-free-order', payload, {
+                headers: { 'Idempotency-Key': idempotencyKey },
+            });
+            if (res.status === 207) {
+                // Only some tickets were issued — those are already in the buyer's inbox
+                setErrorMsg(`${res.data.detail}. The tickets that were issued have been emailed to you.`);
+                setConfirming(false);
+                return;
+            }
             navigate('/payment/success?free=true');
         } catch (err) {
             console.error('Free registration failed:', err);
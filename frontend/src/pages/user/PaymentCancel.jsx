@@ -1,9 +1,21 @@
-import React from 'react';
-import { useNavigate } from 'react-router-dom';
+import React, { useEffect } from 'react';
+import { useNavigate, useSearchParams } from 'react-router-dom';
 import { XCircle, ArrowLeft, RefreshCw } from 'lucide-react';
+import api from '../../services/api';
 
 const PaymentCancel = () => {
     const navigate = useNavigate();
+    const [searchParams] = useSearchParams();
+
+    // Give the tickets held for this checkout back so others can buy them
+    useEffect(() => {
+        const holdId = searchParams.get('hold');
+        if (holdId) {
+            api.post(`/payments/holds/${holdId}/release`).catch((err) => {
+                console.error('Failed to release ticket hold:', err);
+            });
+        }
+    }, [searchParams]);
 
     return (
         <div className="min-h-[70vh] flex items-center justify-center px-4">